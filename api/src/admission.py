@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, status
+
+from constants import ADMISSION_LIMITS, ADMISSION_QUEUE_SIZES, ADMISSION_QUEUE_TIMEOUT, ADMISSION_RETRY_AFTER
+
+# Priorities of the admitted work, the interactive requests are admitted first
+INTERACTIVE = 0
+SCHEDULED = 1
+
+
+class AdmissionController(object):
+    """
+    Limits the number of concurrent runs of an expensive class of endpoints.
+
+    Up to `limit` requests run at the same time. The interactive requests beyond the limit wait in a queue
+    of at most `queue_size` requests, for at most `queue_timeout` seconds: a request finding the queue full
+    is rejected at once with 429, a request waiting for too long with 503. Scheduled work is never rejected,
+    it waits for a free slot in a queue of its own, which is served after the interactive one.
+    Must be used on the event loop.
+    """
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waiters = {INTERACTIVE: deque(), SCHEDULED: deque()}
+
+    def queued(self, priority: int = None):
+        """
+        Returns the number of requests waiting for a slot, of the given priority or of all of them.
+        """
+        if priority is not None:
+            return len(self._waiters[priority])
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    @asynccontextmanager
+    async def admit(self, priority: int = INTERACTIVE, bounded: bool = True):
+        """
+        Runs the body of an async with block in a slot of the class.
+
+        Args:
+            priority (int): INTERACTIVE or SCHEDULED.
+            bounded (bool): If False, an interactive request waits for a slot however long the queue is,
+                e.g. for work that was already accepted. Scheduled work is never bounded.
+
+        Raises:
+            HTTPException: 429 if the queue is full, 503 if no slot is free within the queue timeout.
+        """
+        await self._acquire(priority, bounded and priority == INTERACTIVE)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int, bounded: bool):
+        if self.active < self.limit and not self.queued():
+            self.active += 1
+            self.admitted += 1
+            return
+        waiters = self._waiters[priority]
+        if bounded and len(waiters) >= self.queue_size:
+            self.rejected += 1
+            logging.warning("Rejected %s request, %d running and %d queued", self.name, self.active, len(waiters))
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail="Too many " + self.name + " requests, retry later",
+                                headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout if bounded else None)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over while the wait ended, give it to the next one
+                self._release()
+            elif waiter in waiters:
+                waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                logging.warning("Timed out waiting for a %s slot", self.name)
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail="The " + self.name + " service is overloaded, retry later",
+                                    headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+            raise
+        self.admitted += 1
+
+    def _release(self):
+        # the slot goes straight to the first waiter of the highest priority, if any
+        for priority in (INTERACTIVE, SCHEDULED):
+            waiters = self._waiters[priority]
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.active -= 1
+
+    def getDict(self):
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queueSize": self.queue_size,
+            "queued": self.queued(INTERACTIVE),
+            "queuedScheduled": self.queued(SCHEDULED),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timedOut": self.timed_out,
+        }
+
+
+# One controller per class of expensive endpoints: the AI agent, the predictions and the reports
+admission = {name: AdmissionController(name, limit, ADMISSION_QUEUE_SIZES[name])
+             for name, limit in ADMISSION_LIMITS.items()}
+
+
+def admission_slot(name: str):
+    """
+    Returns a dependency running the request in a slot of a class of endpoints, at interactive priority.
+    It must follow the API key dependency, so unauthenticated requests do not take a place in the queue.
+
+    Args:
+        name (str): The class of the endpoint: "agent", "predict" or "reports".
+    """
+    controller = admission[name]
+
+    async def slot():
+        async with controller.admit():
+            yield
+
+    return slot
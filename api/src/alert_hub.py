@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import threading
+
+from constants import ALERT_STREAM_QUEUE_SIZE
+
+
+class AlertHub(object):
+    """
+    In-process fan-out of new alerts to the connected users.
+
+    Every open alert stream subscribes with its own bounded queue. Alerts are published from the thread that
+    saved them, right after the commit, and delivered to the queues of their recipients on the event loop.
+    When a client does not keep up, its oldest undelivered alerts are dropped: the alerts are still in the
+    database, so the client can catch up with the alerts endpoint.
+    """
+    def __init__(self, queue_size: int = ALERT_STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._loop = None
+        self._subscribers = {}  # user ID -> set of queues
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def bind(self, loop):
+        """
+        Sets the event loop the subscribers run on. Called by the app lifespan.
+        """
+        self._loop = loop
+
+    def subscribe(self, user_id: str):
+        """
+        Registers a new stream for the user.
+
+        Args:
+            user_id (str): The ID of the user.
+
+        Returns:
+            asyncio.Queue: The queue the new alerts of the user are put in.
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(str(user_id), set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue):
+        """
+        Removes a stream of the user.
+        """
+        with self._lock:
+            queues = self._subscribers.get(str(user_id))
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[str(user_id)]
+
+    def connections(self):
+        """
+        Returns the number of open streams.
+        """
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, user_alerts: dict):
+        """
+        Publishes new alerts to their recipients. Safe to call from any thread.
+
+        Args:
+            user_alerts (dict): The alerts to deliver, as lists of dictionaries by user ID.
+        """
+        if self._loop is None or self._loop.is_closed():
+            return
+        with self._lock:
+            if not any(str(user_id) in self._subscribers for user_id in user_alerts):
+                return
+        self._loop.call_soon_threadsafe(self._deliver, user_alerts)
+
+    def _deliver(self, user_alerts: dict):
+        for user_id, alerts in user_alerts.items():
+            with self._lock:
+                queues = list(self._subscribers.get(str(user_id), ()))
+            for queue in queues:
+                for alert in alerts:
+                    if queue.full():
+                        queue.get_nowait()
+                        self.dropped += 1
+                    queue.put_nowait(alert)
+        logging.info("Published alerts to %d users", len(user_alerts))
@@ -1,30 +1,38 @@
 import asyncio
+import contextvars
 import json
 import logging
 import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from datetime import timedelta, timezone
-from io import BytesIO
+from datetime import date, timedelta, timezone
 from pathlib import Path
-from typing import Annotated, List
+from typing import Annotated, List, Optional
 
-import requests
 import uvicorn
 from dotenv import load_dotenv
-from fastapi import Body, Depends, FastAPI, HTTPException, status
+from fastapi import Body, Depends, FastAPI, Header, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from brotli_asgi import BrotliMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fpdf import FPDF
 from jose import jwt
 from langchain_core.prompts import PromptTemplate
 
+from admission import INTERACTIVE, SCHEDULED, admission, admission_slot
 from AES_lib import encrypt_data, decrypt_data
 from api_auth.api_auth import ACCESS_TOKEN_EXPIRE_MINUTES, get_verify_api_key, SECRET_KEY, ALGORITHM
 from constants import *
-from database.connection import get_db_connection, query_db_with_params, close_connection
-from database.druid_connection import execute_druid_query
+from database.connection import close_pool, db_connection, query_db_with_params
+from database.druid_connection import execute_druid_query, get_native_query_endpoint
+from database.druid_query_builder import build_native_query, build_time_boundary_query, columnar_to_rows, max_time, \
+    select_machines, split_kpi_id, to_columnar, to_rows, VALID_AGGREGATORS, VALID_GRANULARITIES
 from database.minio_connection import *
+from downsampling import downsample_series, VALID_METHODS as VALID_DOWNSAMPLING_METHODS
+from http_clients import downstream, rag_agent_path
 # TODO: how to import modules from rag directory ??
 from model.agent import Answer, Question
 from model.alert import Alert
@@ -35,44 +43,115 @@ from model.prediction import Json_in, Json_out
 from model.report import ReportResponse, Report, ScheduledReport
 from model.task import *
 from model.user import *
-from notification_service import send_notification, retrieve_alerts, send_report
+from notification_service import alert_hub, email_queue, encode_alert_cursor, send_notification, send_notifications, \
+    retrieve_alerts, retrieve_alert_trends, run_alert_maintenance, send_report
+from report_jobs import COMPLETED, FAILED, ReportJob, ReportJobs
+from report_scheduler import ReportScheduler
+from report_service import find_report_by_fingerprint, object_name as report_object_name, report_fingerprint, \
+    save_report
+from response_cache import ResponseCache, normalize_key
+from schedule_service import import_legacy_schedules, load_schedules, retrieve_schedules as retrieve_user_schedules, \
+    save_schedule
+from single_flight import SingleFlight
+from tracing import TracingMiddleware, instrument_http_clients, start_span
 from user_settings_service import persist_user_settings, retrieve_user_settings, persist_dashboard_settings, \
-    load_dashboard_settings
+    load_dashboard_settings, update_user_settings
 
 env_path = Path(__file__).resolve().parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
 logging.basicConfig(level=logging.INFO)
 
-tasks: dict[str, Task] = dict()
-tasks_lock = asyncio.Lock()
-last_task_id = 0
+# periodic tasks (scheduled reports), by schedule ID
+scheduler = ReportScheduler()
+# reports generated in the background
+report_jobs = ReportJobs()
 
+response_cache = ResponseCache(max_entries=RESPONSE_CACHE_MAX_ENTRIES, max_bytes=RESPONSE_CACHE_MAX_BYTES)
+# identical concurrent downstream requests share one call
+single_flight = SingleFlight()
 
-async def task_scheduler():
-    """Central scheduler that runs periodic tasks."""
+
+def add_scheduled_report(userId: str, email: str, params: ScheduledReport, api_key: Optional[str] = None,
+                         skip_missed: bool = False):
+    """
+    Adds a scheduled report to the scheduler, replacing the task with the same schedule ID.
+
+    Args:
+        userId: the id of the user.
+        email: the email of the user.
+        params: the settings of the scheduled report, with its id.
+        api_key: the API key of the request that scheduled the report.
+        skip_missed: if the first run is in the past, start from the next one instead of running immediately.
+    """
+    task = Task(func=generate_and_send_report, args=(userId, email, params, api_key),
+                delay=params.recurrence.seconds, json=params, start_date=params.startDate)
+    if skip_missed and task.shouldRun():
+        task.reschedule(time.time())
+    scheduler.add(str(params.id), task)
+
+
+async def restore_schedules():
+    """Rebuilds the scheduler from the persisted report schedules."""
+    try:
+        await run_in_threadpool(import_legacy_schedules, get_minio_connection())
+    except Exception as e:
+        # the schedules already in the database are restored anyway, the import is retried at the next start
+        logging.error("Report schedules not imported from the object storage: %s", str(e))
+    try:
+        schedules = await run_in_threadpool(load_schedules)
+    except Exception as e:
+        logging.error("Report schedules not restored: %s", str(e))
+        return
+    for user_id, email, schedule in schedules:
+        # the runs missed while the service was down are not recovered
+        add_scheduled_report(str(user_id), email, ScheduledReport.model_validate(schedule), skip_missed=True)
+    logging.info("Restored %d report schedules", len(schedules))
+
+
+async def alert_maintenance():
+    """Periodically creates the upcoming alert partitions and drops the expired ones."""
     while True:
-        async with tasks_lock:
-            for t in tasks.values():
-                logging.info(t.getDict().name)
-                if t.shouldRun():
-                    logging.info("Run task " + t.getDict().name)
-                    await t.run()
-        await asyncio.sleep(1)
+        try:
+            await run_in_threadpool(run_alert_maintenance, ALERT_RETENTION_MONTHS, ALERT_PARTITIONS_AHEAD)
+        except Exception as e:
+            logging.error("Alert maintenance failed: %s", str(e))
+        await asyncio.sleep(ALERT_MAINTENANCE_INTERVAL)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Lifespan context manager to start and stop the scheduler."""
-    scheduler_task = asyncio.create_task(task_scheduler())
+    """Lifespan context manager to start and stop the scheduler, the email queue and the downstream HTTP clients."""
+    downstream.start()
+    email_queue.start()
+    alert_hub.bind(asyncio.get_running_loop())
+    await restore_schedules()
+    scheduler_task = asyncio.create_task(scheduler.run())
+    maintenance_task = asyncio.create_task(alert_maintenance())
     try:
         yield
     finally:
-        scheduler_task.cancel()  # Cancel the scheduler on application shutdown
-        await scheduler_task  # Ensure it exits cleanly
+        for background_task in (scheduler_task, maintenance_task):
+            background_task.cancel()  # Cancel the background tasks on application shutdown
+            try:
+                await background_task  # Ensure it exits cleanly
+            except asyncio.CancelledError:
+                pass
+        await scheduler.stop()
+        await report_jobs.stop()
+        await downstream.close()
+        await run_in_threadpool(email_queue.stop)
+        close_pool()
+
 
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
-app = FastAPI(lifespan=lifespan)
+instrument_http_clients()
+
+# the alert streams are not compressed, so that every event is flushed, nor are the PDFs, which are
+# already compressed and served by byte ranges
+app.add_middleware(BrotliMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_SIZE, gzip_fallback=True,
+                   excluded_handlers=[r"/stream$", r"/download"])
 
 app.add_middleware(
     CORSMiddleware,
@@ -80,8 +159,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "traceparent"],
 )
 
+# added last, so that the server span covers the other middlewares
+app.add_middleware(TracingMiddleware)
+
+
+def validate_alert(alert: Alert):
+    """
+    Performs the validation checks on an alert before it is notified.
+    Args:
+        alert (Alert): The alert object containing notification details.
+    Raises:
+        HTTPException: If any validation check fails.
+    """
+    if not alert.title:
+        logging.error("Missing notification title")
+        raise HTTPException(status_code=400, detail="Missing notification title")
+
+    if not alert.description:
+        logging.error("Missing notification description")
+        raise HTTPException(status_code=400, detail="Missing notification description")
+
+    if not alert.isPush and not alert.isEmail:
+        logging.error("No notification method selected")
+        raise HTTPException(status_code=400, detail="No notification method selected")
+
+    if not alert.recipients or len(alert.recipients) == 0:
+        logging.error("No recipients specified")
+        raise HTTPException(status_code=400, detail="No recipients specified")
+
 
 @app.post("/smartfactory/postAlert")
 async def post_alert(alert: Alert, api_key: str = Depends(get_verify_api_key(["data"]))):
@@ -100,28 +208,14 @@ async def post_alert(alert: Alert, api_key: str = Depends(get_verify_api_key(["d
 
     try:
         logging.info("Received alert with title: %s", alert.description)
-
-        if not alert.title:
-            logging.error("Missing notification title")
-            raise HTTPException(status_code=400, detail="Missing notification title")
-
-        if not alert.description:
-            logging.error("Missing notification description")
-            raise HTTPException(status_code=400, detail="Missing notification description")
-
-        if not alert.isPush and not alert.isEmail:
-            logging.error("No notification method selected")
-            raise HTTPException(status_code=400, detail="No notification method selected")
-
-        if not alert.recipients or len(alert.recipients) == 0:
-            logging.error("No recipients specified")
-            raise HTTPException(status_code=400, detail="No recipients specified")
+        validate_alert(alert)
 
         logging.info("Sending notification")
-        send_notification(alert)
+        # returns once the alert is saved, the emails are sent in the background
+        await run_in_threadpool(send_notification, alert)
         logging.info("Notification sent successfully")
 
-        return JSONResponse(content={"message": "Notification sent successfully"}, status_code=200)
+        return ORJSONResponse(content={"message": "Notification sent successfully"}, status_code=200)
     except HTTPException as e:
         logging.error("HTTPException: %s", e.detail)
         raise e
@@ -139,23 +233,140 @@ async def post_alert(alert: Alert, api_key: str = Depends(get_verify_api_key(["d
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/smartfactory/postAlerts")
+async def post_alerts(alerts: List[Alert], api_key: str = Depends(get_verify_api_key(["data"]))):
+    """
+    Endpoint to post a batch of alerts.
+    This endpoint receives a list of alert objects, validates all of them and then processes them at once:
+    the push alerts and their recipients are saved with a single batch insert.
+    Args:
+        alerts (List[Alert]): The alert objects containing notification details.
+    Returns:
+        Response: A response object with status code 200 and the ID of each alert (null if the alert was not saved).
+    Raises:
+        HTTPException: If any validation check fails, the batch is too big or an unexpected error occurs.
+    """
+    try:
+        logging.info("Received %d alerts", len(alerts))
+        if not alerts:
+            raise HTTPException(status_code=400, detail="No alerts specified")
+        if len(alerts) > ALERT_BATCH_MAX_SIZE:
+            raise HTTPException(status_code=400, detail=f"Too many alerts, the maximum is {ALERT_BATCH_MAX_SIZE}")
+        for alert in alerts:
+            validate_alert(alert)
+
+        alert_ids = await run_in_threadpool(send_notifications, alerts)
+        logging.info("Notifications sent successfully")
+
+        return ORJSONResponse(content={"message": "Notifications sent successfully", "alertIds": alert_ids},
+                            status_code=200)
+    except HTTPException as e:
+        logging.error("HTTPException: %s", e.detail)
+        raise e
+    except (ValueError, TypeError) as e:
+        logging.error("%s: %s", type(e).__name__, str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logging.error("Exception: %s", str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/smartfactory/alerts/{userId}")
-def get_alerts(userId: str, all: bool = True, api_key: str = Depends(get_verify_api_key(["gui"]))):
+def get_alerts(userId: str, all: bool = True, limit: int = ALERTS_PAGE_SIZE, cursor: Optional[str] = None,
+               since: Optional[datetime] = None, api_key: str = Depends(get_verify_api_key(["gui"]))):
     """
-    Retrieve alerts for a given user and return them as a JSON response.
+    Retrieve a page of alerts for a given user, newest first, and return them as a JSON response.
 
     Args:
         userId (str): The ID of the user for whom to retrieve alerts.
         all (bool): Flag to indicate whether to retrieve all alerts or only active ones.
+        limit (int): Maximum number of alerts in the page.
+        cursor (str): The nextCursor of the previous page, to retrieve the following one.
+        since (datetime): Only retrieve the alerts triggered after this time, to fetch the new alerts only.
 
     Returns:
-        JSONResponse: A JSON response containing the list of alerts for the user.
+        JSONResponse: A JSON response containing the list of alerts for the user, and the cursor of the next
+        page (null if this is the last one).
+
+    Raises:
+        HTTPException: If the limit or the cursor is invalid.
     """
+    if limit < 1 or limit > ALERTS_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"The limit must be between 1 and {ALERTS_PAGE_MAX}")
     logging.info("Retrieving alerts for user: %s", userId)
-    list = retrieve_alerts(userId, all)
+    try:
+        list = retrieve_alerts(userId, all, limit, cursor, since)
+    except ValueError as e:
+        logging.error("ValueError: %s", str(e))
+        raise HTTPException(status_code=400, detail=str(e))
     logging.info("Alerts retrieved successfully for user: %s", userId)
 
-    return JSONResponse(content={"alerts": list}, status_code=200)
+    next_cursor = encode_alert_cursor(list[-1]) if len(list) == limit else None
+    return ORJSONResponse(content={"alerts": list, "nextCursor": next_cursor}, status_code=200)
+
+
+@app.get("/smartfactory/alertTrends")
+def get_alert_trends(start_date: date, end_date: date, machineName: Optional[str] = None,
+                     api_key: str = Depends(get_verify_api_key(["gui"]))):
+    """
+    Retrieve the number of alerts per day, machine, type and severity in a period.
+
+    The counts come from the daily rollup of the alerts, so they are available for the periods whose
+    alerts were already dropped by the retention.
+
+    Args:
+        start_date (date): The first day of the period.
+        end_date (date): The last day of the period.
+        machineName (str): Only count the alerts of this machine, if given.
+
+    Returns:
+        JSONResponse: A JSON response containing the daily counts.
+
+    Raises:
+        HTTPException: If the period is invalid.
+    """
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="The start date must precede the end date")
+    trends = retrieve_alert_trends(start_date, end_date, machineName)
+    return ORJSONResponse(content={"trends": trends}, status_code=200)
+
+
+@app.get("/smartfactory/alerts/{userId}/stream")
+async def stream_alerts(userId: str, request: Request, api_key: str = Depends(get_verify_api_key(["gui"]))):
+    """
+    Stream the new alerts of a given user as Server-Sent Events.
+
+    The alerts are pushed as soon as they are saved, as "alert" events whose data is the alert in the same
+    format returned by the alerts endpoint. No query is run while the stream is open; a comment line is sent
+    periodically to keep the connection alive. Clients should load the existing alerts with the alerts
+    endpoint before opening the stream.
+
+    Args:
+        userId (str): The ID of the user for whom to stream alerts.
+        request (Request): The HTTP request, used to detect the client disconnection.
+
+    Returns:
+        StreamingResponse: The text/event-stream response.
+    """
+    queue = alert_hub.subscribe(userId)
+    logging.info("Alert stream opened for user: %s", userId)
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    alert = await asyncio.wait_for(queue.get(), timeout=ALERT_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {alert['alertId']}\nevent: alert\ndata: {json.dumps(alert)}\n\n"
+        finally:
+            alert_hub.unsubscribe(userId, queue)
+            logging.info("Alert stream closed for user: %s", userId)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.post("/smartfactory/settings/{userId}")
@@ -175,7 +386,7 @@ def save_user_settings(userId: str, settings: dict, api_key: str = Depends(get_v
         if persist_user_settings(userId, settings) == False:
             raise HTTPException(status_code=404, detail="User not found")
 
-        return JSONResponse(content={"message": "Settings saved successfully"}, status_code=200)
+        return ORJSONResponse(content={"message": "Settings saved successfully"}, status_code=200)
     except Exception as e:
         logging.error("Exception: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
@@ -195,12 +406,36 @@ def get_user_settings(userId: str, api_key: str = Depends(get_verify_api_key(["g
     """
     try:
         settings = retrieve_user_settings(userId)
-        return JSONResponse(content=settings, status_code=200)
+        return ORJSONResponse(content=settings, status_code=200)
     except Exception as e:
         logging.error("Exception: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.patch("/smartfactory/settings/{userId}")
+def patch_user_settings(userId: str, changes: dict, api_key: str = Depends(get_verify_api_key(["gui"]))):
+    """
+    Endpoint to update some of the user settings.
+    This endpoint receives a user ID and a JSON object with the settings to add or replace; the other settings
+    are kept.
+    Args:
+        userId (str): The ID of the user.
+        changes (dict): The settings to add or replace.
+    Returns:
+        dict: A dictionary containing the updated user settings.
+    Raises:
+        HTTPException: If the user is not found or an unexpected error occurs.
+    """
+    try:
+        settings = update_user_settings(userId, changes)
+    except Exception as e:
+        logging.error("Exception: %s", str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+    if settings is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return ORJSONResponse(content=settings, status_code=200)
+
+
 @app.post("/smartfactory/login")
 def login(body: Login, api_key: str = Depends(get_verify_api_key(["gui"]))):
     """
@@ -214,17 +449,16 @@ def login(body: Login, api_key: str = Depends(get_verify_api_key(["gui"]))):
         HTTPException: If any validation check fails or an unexpected error occurs.
     """
     try:
-        connection, cursor = get_db_connection()
         query = "SELECT * FROM Users WHERE " + ("Email" if body.isEmail else "Username") + "=%s"
         key = bytes.fromhex(os.getenv("AES_KEY").strip())
-        response = query_db_with_params(cursor, connection, query, (encrypt_data(body.user, key),))
+        with db_connection() as (connection, cursor):
+            response = query_db_with_params(cursor, connection, query, (encrypt_data(body.user, key),))
 
         if not response or (body.password != response[0][4]):
             logging.error("Invalid credentials")
             raise HTTPException(status_code=401, detail="Invalid username or password")
 
         result = response[0]
-        close_connection(connection, cursor)
         logging.info("User logged in successfully")
 
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -238,15 +472,13 @@ def login(body: Login, api_key: str = Depends(get_verify_api_key(["gui"]))):
             result[5], key)
         user = UserInfo(userId=result[0], username=dec_username, email=dec_email, role=result[3],
                         access_token=access_token, site=dec_site)
-        return JSONResponse(content=user.to_dict(), status_code=200)
+        return ORJSONResponse(content=user.to_dict(), status_code=200)
 
     except HTTPException as e:
         logging.error("HTTPException: %s", e.detail)
-        close_connection(connection, cursor)
         raise e
     except Exception as e:
         logging.error("Exception: %s", str(e))
-        close_connection(connection, cursor)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -263,21 +495,18 @@ def logout(userId: str, api_key: str = Depends(get_verify_api_key(["gui"]))):
         HTTPException: If the user is not present in the database.
     """
     try:
-        connection, cursor = get_db_connection()
         query = "SELECT UserID FROM Users WHERE UserID=%s"
-        response = query_db_with_params(cursor, connection, query, (int(userId),))
+        with db_connection() as (connection, cursor):
+            response = query_db_with_params(cursor, connection, query, (int(userId),))
         logging.info(response)
         if (len(response) == 0):
             raise HTTPException(status_code=404, detail="User not found")
-        close_connection(connection, cursor)
-        return JSONResponse(content={"message": "User logged out successfully"}, status_code=200)
+        return ORJSONResponse(content={"message": "User logged out successfully"}, status_code=200)
     except HTTPException as e:
         logging.error("HTTPException: %s", e.detail)
-        close_connection(connection, cursor)
         raise e
     except Exception as e:
         logging.error("Exception: %s", str(e))
-        close_connection(connection, cursor)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -294,36 +523,33 @@ def register(body: Register, api_key: str = Depends(get_verify_api_key(["gui"]))
         HTTPException: If the user is already present in the database.
     """
     try:
-        connection, cursor = get_db_connection()
-        # Check if user already exists
-        query = "SELECT * FROM Users WHERE Username = %s OR Email = %s"
-        key = bytes.fromhex(os.getenv("AES_KEY").strip())
-        enc_username, enc_email = encrypt_data(body.username, key), encrypt_data(body.email, key)
-        response = query_db_with_params(cursor, connection, query, (enc_username, enc_email))
-        user_exists = response
-        logging.info(user_exists)
-
-        if user_exists:
-            logging.error("User already registered")
-            raise HTTPException(status_code=400, detail="User already registered")
-        else:
-            enc_site = encrypt_data(body.site, key)
-            # Insert new user into the database
-            query_insert = "INSERT INTO Users (Username, Email, Role, Password, SiteName) VALUES (%s, %s, %s, %s, %s) RETURNING UserID;"
-            cursor.execute(query_insert, (enc_username, enc_email, body.role, body.password, enc_site))
-            connection.commit()
-            userid = cursor.fetchone()[0]
-            close_connection(connection, cursor)
-            return UserInfo(userId=str(userid), username=body.username, email=body.email, role=body.role,
-                            site=body.site, access_token='')
+        with db_connection() as (connection, cursor):
+            # Check if user already exists
+            query = "SELECT * FROM Users WHERE Username = %s OR Email = %s"
+            key = bytes.fromhex(os.getenv("AES_KEY").strip())
+            enc_username, enc_email = encrypt_data(body.username, key), encrypt_data(body.email, key)
+            response = query_db_with_params(cursor, connection, query, (enc_username, enc_email))
+            user_exists = response
+            logging.info(user_exists)
+
+            if user_exists:
+                logging.error("User already registered")
+                raise HTTPException(status_code=400, detail="User already registered")
+            else:
+                enc_site = encrypt_data(body.site, key)
+                # Insert new user into the database
+                query_insert = "INSERT INTO Users (Username, Email, Role, Password, SiteName) VALUES (%s, %s, %s, %s, %s) RETURNING UserID;"
+                cursor.execute(query_insert, (enc_username, enc_email, body.role, body.password, enc_site))
+                connection.commit()
+                userid = cursor.fetchone()[0]
+        return UserInfo(userId=str(userid), username=body.username, email=body.email, role=body.role,
+                        site=body.site, access_token='')
 
     except HTTPException as e:
         logging.error("HTTPException: %s", e.detail)
-        close_connection(connection, cursor)
         raise e
     except Exception as e:
         logging.error("Exception: %s", str(e))
-        close_connection(connection, cursor)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -340,40 +566,37 @@ def change_password(userId: str, body: ChangePassword, api_key: str = Depends(ge
         HTTPException: If the user is not present in the database, the old password is incorrect, or an unexpected error occurs
     """
     try:
-        connection, cursor = get_db_connection()
-        # Check if old password is correct
-        query = "SELECT Password FROM Users WHERE UserID = %s"
-        response = query_db_with_params(cursor, connection, query, (userId,))
-        if not response:
-            raise HTTPException(status_code=401, detail="User not found")
-        try:
-            if not body.old_password == response[0][0]:
-                logging.error("Invalid old password")
-                return JSONResponse(content={"message": "Invalid old password"}, status_code=401)
-        except ValueError as e:
-            # logging.error("Password not hashed")
-            raise HTTPException(status_code=500, detail=f"ERROR: {str(e)}")
-
-        # Update user password in the database
-        query_update = "UPDATE Users SET password = %s WHERE UserID = %s;"
-        cursor.execute(query_update, (body.new_password, userId))
-        connection.commit()
-        # check if updated correctly
-        result = cursor.rowcount
-        if result == 0:
-            raise HTTPException(status_code=404, detail="User not found")
+        with db_connection() as (connection, cursor):
+            # Check if old password is correct
+            query = "SELECT Password FROM Users WHERE UserID = %s"
+            response = query_db_with_params(cursor, connection, query, (userId,))
+            if not response:
+                raise HTTPException(status_code=401, detail="User not found")
+            try:
+                if not body.old_password == response[0][0]:
+                    logging.error("Invalid old password")
+                    return ORJSONResponse(content={"message": "Invalid old password"}, status_code=401)
+            except ValueError as e:
+                # logging.error("Password not hashed")
+                raise HTTPException(status_code=500, detail=f"ERROR: {str(e)}")
+
+            # Update user password in the database
+            query_update = "UPDATE Users SET password = %s WHERE UserID = %s;"
+            cursor.execute(query_update, (body.new_password, userId))
+            connection.commit()
+            # check if updated correctly
+            result = cursor.rowcount
+            if result == 0:
+                raise HTTPException(status_code=404, detail="User not found")
 
-        close_connection(connection, cursor)
-        return JSONResponse(content={"message": "Password changed successfully"}, status_code=200)
+        return ORJSONResponse(content={"message": "Password changed successfully"}, status_code=200)
 
     except HTTPException as e:
         logging.error("HTTPException: %s", e.detail)
-        close_connection(connection, cursor)
         raise e
 
     except Exception as e:
         logging.error("Exception: %s", str(e))
-        close_connection(connection, cursor)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -392,7 +615,7 @@ def retrieve_dashboard_settings(userId: str, api_key: str = Depends(get_verify_a
     '''
     try:
         settings = load_dashboard_settings(userId)
-        return JSONResponse(content=settings, status_code=200)
+        return ORJSONResponse(content=settings, status_code=200)
     except Exception as e:
         logging.error("Exception: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
@@ -415,7 +638,7 @@ def post_dashboard_settings(userId: str, dashboard_settings: dict, api_key: str
         if persist_dashboard_settings(userId, dashboard_settings) == False:
             raise HTTPException(status_code=404, detail="User not found")
 
-        return JSONResponse(content={"message": "Settings saved successfully"}, status_code=200)
+        return ORJSONResponse(content={"message": "Settings saved successfully"}, status_code=200)
     except Exception as e:
         logging.error("Exception: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
@@ -434,121 +657,194 @@ def retrieve_reports(userId: str, api_key: str = Depends(get_verify_api_key(["gu
         HTTPException: If a server exception occurs.
     """
     try:
-        connection, cursor = get_db_connection()
         query = "SELECT ReportID, Name, Type, FilePath FROM Reports WHERE OwnerID = %s"
-        response = query_db_with_params(cursor, connection, query, (int(userId),))
+        with db_connection() as (connection, cursor):
+            response = query_db_with_params(cursor, connection, query, (int(userId),))
         if not response or response[0] is None:
             logging.info("No reports for userID %s", str(userId))
-            return JSONResponse(content={"data": []}, status_code=200)
+            return ORJSONResponse(content={"data": []}, status_code=200)
         reports = []
         for row in response:
             rep = ReportResponse(id=row[0], name=row[1], type=row[2])
             reports.append(rep.model_dump())
-        close_connection(connection, cursor)
-        return JSONResponse(content={"data": reports}, status_code=200)
+        return ORJSONResponse(content={"data": reports}, status_code=200)
     except Exception as e:
         logging.error("Exception: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/smartfactory/reports/download/{report_id}")
-def download_report(report_id: int, api_key: str = Depends(get_verify_api_key(["gui"]))):
+def download_report(report_id: int, range: Annotated[Optional[str], Header()] = None,
+                    api_key: str = Depends(get_verify_api_key(["gui"]))):
     """
     Endpoint to download a report.
-    This endpoint receives the report id and sends back the report data in pdf format.
+    This endpoint receives the report id and sends back the report data in pdf format,
+    streamed from the object storage.
     Args:
         report_id: the id of the report.
+        range: the byte range to download, to resume an interrupted download.
     Returns:
         A PDF file.
     Raises:
         HTTPException: If a server exception occurs or the report is not found.
     """
     try:
-        connection, cursor = get_db_connection()
-        query = "SELECT ReportID, Name, OwnerID, FilePath FROM Reports WHERE ReportID = %s"
-        response = query_db_with_params(cursor, connection, query, (report_id,))
-        if not response or response[0] is None:
-            raise HTTPException(status_code=404, detail="Report not found")
-        file_name = response[0][1]
-        ownerID = str(response[0][2])
-        tmp_path = "/tmp/" + ownerID + "_" + file_name + ".pdf"
-        minio = get_minio_connection()
-        download_object(minio, "reports", ownerID + "/" + file_name, tmp_path)
-        close_connection(connection, cursor)
-        return FileResponse(
-            path=tmp_path,
-            media_type="application/pdf",
-            filename="downloaded_example.pdf"
-        )
+        return stream_report(report_id, range)
     except HTTPException as e:
         logging.error("HTTPException: %s", e.detail)
-        close_connection(connection, cursor)
         raise e
     except Exception as e:
-        close_connection(connection, cursor)
         logging.error("Exception: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def call_ai_agent(input: Question):
+def stream_report(report_id: int, range_header: Optional[str] = None):
+    """
+    This function streams a report PDF from the object storage, without a local copy.
+    Args:
+        report_id: the id of the report.
+        range_header: the Range header of the request, if any.
+    Returns:
+        A streamed PDF file, partial if a byte range is requested.
+    Raises:
+        HTTPException: If the report is not found or the range is not satisfiable.
+    """
+    query = "SELECT ReportID, Name, FilePath FROM Reports WHERE ReportID = %s"
+    with db_connection() as (connection, cursor):
+        response = query_db_with_params(cursor, connection, query, (report_id,))
+    if not response or response[0] is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    file_name = response[0][1]
+    object_name = report_object_name(response[0][2])
+    minio = get_minio_connection()
+    headers = {"Content-Disposition": 'attachment; filename="' + file_name + '"', "Accept-Ranges": "bytes"}
+    byte_range = None
+    if range_header:
+        with start_span("minio.stat_object", bucket="reports", object=object_name):
+            size = minio.stat_object("reports", object_name).size
+        try:
+            byte_range = parse_byte_range(range_header, size)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                                detail="Range not satisfiable", headers={"Content-Range": "bytes */" + str(size)})
+    if byte_range is None:
+        with start_span("minio.get_object", bucket="reports", object=object_name):
+            obj = minio.get_object("reports", object_name)
+        status_code = status.HTTP_200_OK
+    else:
+        offset, length = byte_range
+        with start_span("minio.get_object", bucket="reports", object=object_name, offset=offset, length=length):
+            obj = minio.get_object("reports", object_name, offset=offset, length=length)
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = "bytes " + str(offset) + "-" + str(offset + length - 1) + "/" + str(size)
+
+    def chunks():
+        try:
+            yield from obj.stream(REPORT_STREAM_CHUNK_SIZE)
+        finally:
+            obj.close()
+            obj.release_conn()
+
+    if obj.headers.get("Content-Length") is not None:
+        headers["Content-Length"] = obj.headers.get("Content-Length")
+    return StreamingResponse(chunks(), status_code=status_code, media_type="application/pdf", headers=headers)
+
+
+async def call_ai_agent(input: Question):
     """
-    This function performs a call to the RAG AI agent.
+    This function performs a call to the RAG AI agent, through the pooled RAG client.
     Args:
         input: the user text input.
     Returns:
         The response of the API call.
     """
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': os.getenv('API_KEY')
-    }
     body = {
         'userInput': input.userInput,
         'userId': input.userId
     }
     print(f"sending request to RAG API: {body}")
-    response = requests.post(os.getenv('RAG_API_ENDPOINT'), headers=headers, json=body)
+    response = await downstream.get("rag").post(rag_agent_path(), json=body)
     response.raise_for_status()
     return response
 
 
-def create_report_pdf(answer: Answer, userId: str, tmp_path: str, obj_name: str, type: str = None):
+def create_report_pdf(answer: Answer, userId: str, obj_name: str, type: str = None, fingerprint: str = None):
     """
-    This function inserts the report PDF in the DB.
+    This function renders the report PDF in memory, uploads it and inserts the report in the DB.
     Args:
         answer: the Answer object from the AI agent.
         userId: the id of the user.
-        tmp_path: the path where to save the .
+        obj_name: the name of the report.
         type: the type of the report.
+        fingerprint: the fingerprint of the report content, to reuse the PDF for identical reports.
     Returns:
-        The id of the report.
+        The id of the report and the content of the PDF.
     """
-    connection, cursor = get_db_connection()
-    obj_path = "/reports/" + userId + "/" + obj_name + ".pdf"
+    # reusable PDFs are stored by content, so that regenerating a report of the user with the same name
+    # does not overwrite the PDF linked by other reports
+    if fingerprint is not None:
+        obj_path = "/reports/artifacts/" + fingerprint + ".pdf"
+    else:
+        obj_path = "/reports/" + userId + "/" + obj_name + ".pdf"
     # if answer is a dict, access the data via ['data']
     if isinstance(answer, dict):
-        create_pdf(answer["data"], answer["textExplanation"], tmp_path)
+        pdf = create_pdf(answer["data"], answer["textExplanation"])
     else:
-        create_pdf(answer.data, answer.textExplanation, tmp_path)
+        pdf = create_pdf(answer.data, answer.textExplanation)
     minio = get_minio_connection()
-    upload_object(minio, "reports", userId + "/" + obj_name + ".pdf", tmp_path, "application/pdf")
-    query_insert = "INSERT INTO Reports (Name, Type, OwnerId, GeneratedAt, FilePath, SiteName) VALUES (%s, %s, %s, %s, %s, %s) RETURNING ReportID, Name, Type;"
-    cursor.execute(query_insert,
-                   (obj_name + ".pdf", type or "Standard", int(userId), datetime.now(), obj_path, "Test",))
-    connection.commit()
-    # return the report id
-    response = cursor.fetchone()
-    close_connection(connection, cursor)
-    return response[0]
+    if not upload_bytes(minio, "reports", report_object_name(obj_path), pdf, "application/pdf"):
+        raise Exception("Error uploading the report " + obj_name)
+    return save_report(userId, obj_name + ".pdf", type, obj_path, fingerprint), pdf
 
 
-def create_pdf(text: str, appendix: str, path: str):
+def reuse_report_pdf(userId: str, obj_name: str, type: str, file_path: str, fingerprint: str):
+    """
+    This function links an already generated PDF to a new report of the user.
+    Args:
+        userId: the id of the user.
+        obj_name: the name of the report.
+        type: the type of the report.
+        file_path: the path of the PDF in the object storage.
+        fingerprint: the fingerprint of the report content.
+    Returns:
+        The id of the report and the content of the PDF.
+    """
+    minio = get_minio_connection()
+    with start_span("minio.get_object", bucket="reports", object=report_object_name(file_path)):
+        obj = minio.get_object("reports", report_object_name(file_path))
+        try:
+            pdf = obj.read()
+        finally:
+            obj.close()
+            obj.release_conn()
+    return save_report(userId, obj_name + ".pdf", type, file_path, fingerprint), pdf
+
+
+def data_watermark():
+    """
+    This function retrieves the timestamp of the latest data ingested in Druid, cached for a short time.
+    Returns:
+        The ISO-8601 timestamp, or None if it could not be retrieved.
+    """
+    entry = response_cache.get("watermark", "")
+    if entry is not None:
+        return json.loads(entry.body)
+    response = execute_druid_query(get_native_query_endpoint(), build_time_boundary_query())
+    if response is None:
+        return None
+    watermark = max_time(response)
+    response_cache.set("watermark", "", watermark, CACHE_TTLS["watermark"])
+    return watermark
+
+
+def create_pdf(text: str, appendix: str):
     """
-    This function creates a PDF file.
+    This function creates a PDF file in memory.
     Args:
         text: the text of the PDF.
         appendix: the appendix of the PDF.
-        path: the path where to save the PDF.
+    Returns:
+        The content of the PDF.
     """
     pdf = FPDF()
     try:
@@ -589,15 +885,108 @@ def create_pdf(text: str, appendix: str, path: str):
         exc_type, exc_obj, exc_tb = sys.exc_info()
         fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
         print(exc_type, fname, exc_tb.tb_lineno)
-    pdf.output(name=path, dest="F")
+    # FPDF 1.7 returns the document as a latin-1 string
+    return pdf.output(dest="S").encode("latin-1")
+
+
+def find_user(userId: int):
+    """
+    This function checks that a user exists.
+    Args:
+        userId: the id of the user.
+    Returns:
+        The rows of the query, empty if the user does not exist.
+    """
+    query = "SELECT UserID FROM Users WHERE UserID = %s"
+    with db_connection() as (connection, cursor):
+        return query_db_with_params(cursor, connection, query, (userId,))
+
+
+def find_user_email(userId: int):
+    """
+    This function retrieves the email of a user.
+    Args:
+        userId: the id of the user.
+    Returns:
+        The rows of the query, with the id and the email of the user, empty if the user does not exist.
+    """
+    query = "SELECT UserID, Email FROM Users WHERE UserID = %s"
+    with db_connection() as (connection, cursor):
+        return query_db_with_params(cursor, connection, query, (userId,))
+
+
+async def build_report(userId: str, params: Union[Report, ScheduledReport], is_scheduled: bool = False,
+                       job: Optional[ReportJob] = None):
+    """
+    This function runs the report generation pipeline: it asks the AI agent for the report, renders the PDF,
+    and stores it in MinIO and in the DB.
+    Args:
+        userId: the id of the user.
+        params: the settings of the report to generate, as Report or ScheduledReport.
+        is_scheduled: check if the generate comes from a scheduled process.
+        job: the background job running the pipeline, to report its progress.
+    Returns:
+        The id of the report and the content of the PDF.
+    Raises:
+        HTTPException: If the user is not found.
+    """
+    response = await run_in_threadpool(find_user, int(userId))
+    if not response:
+        logging.error("User not found")
+        raise HTTPException(status_code=404, detail="User not found")
+    userId = str(response[0][0])
+    period = ""
+    if is_scheduled:
+        now = time.time()
+        now_str = datetime.fromtimestamp(now).strftime("%d/%m/%Y")
+        start_str = datetime.fromtimestamp((now - params.recurrence.seconds)).strftime("%d/%m/%Y")
+        period = start_str + " - " + now_str
+    else:
+        period = params.period
+    prompt = PromptTemplate(
+        input_variables=["period", "kpi", "machines"],
+        template=(
+            "Generate the periodic report for the period {period}, including the "
+            "following KPIs: {kpi}; the KPIs concern the specified machines: {machines}."
+        )
+    )
+    filled_prompt = prompt.format(
+        period=period,
+        kpi=",".join(params.kpis),
+        machines=",".join(params.machines)
+    )
+    obj_name = params.name + ("_periodic" if is_scheduled else "")
+    report_type = "Periodic" if is_scheduled else params.type
+    # identical reports over the same data reuse the stored PDF
+    watermark = await run_in_threadpool(data_watermark)
+    fingerprint = None
+    if watermark is not None:
+        fingerprint = report_fingerprint(period, params.kpis, params.machines, watermark)
+        file_path = await run_in_threadpool(find_report_by_fingerprint, fingerprint)
+        if file_path is not None:
+            logging.info("Reusing report %s", fingerprint)
+            return await run_in_threadpool(reuse_report_pdf, userId, obj_name, report_type, file_path, fingerprint)
+    if job is not None:
+        job.progress("generating")
+    question = Question(userInput=filled_prompt, userId=userId)
+    ai_response = (await call_ai_agent(question)).json()
+    logging.info(ai_response)
+    answer = Answer.model_validate(ai_response)
+    if job is not None:
+        job.progress("rendering")
+    return await run_in_threadpool(create_report_pdf, answer, userId, obj_name, report_type, fingerprint)
 
 
 @app.post("/smartfactory/reports/generate", status_code=status.HTTP_201_CREATED)
-def generate_report(userId: Annotated[str, Body()], params: Annotated[Union[Report, ScheduledReport], Body()],
+async def generate_report(userId: Annotated[str, Body()], params: Annotated[Union[Report, ScheduledReport], Body()],
                     is_scheduled: bool = False, api_key: str = Depends(get_verify_api_key(["gui"]))):
     """
     Endpoint to download a report.
     This endpoint receives the report id and sends back the report data in pdf format.
+    The generation holds the request for the whole pipeline, the reports/jobs endpoints run it in the background.
+    At most REPORTS_MAX_CONCURRENCY reports are generated at the same time. The requests are always admitted at
+    interactive priority, in the bounded queue: is_scheduled is set by the client, so it does not give access to
+    the scheduled queue, which is kept for the schedules of the app (generate_and_send_report).
     Args:
         userId: the id of the user.
         params: the settings of the report to generate, as Report or ScheduledReport.
@@ -605,65 +994,96 @@ def generate_report(userId: Annotated[str, Body()], params: Annotated[Union[Repo
     Returns:
         A PDF file.
     Raises:
-        HTTPException: If a server exception occurs or the user is not found.
+        HTTPException: If a server exception occurs or the user is not found, 429 or 503 if too many reports
+            are being generated.
     """
     try:
-        connection, cursor = get_db_connection()
-        query = "SELECT UserID FROM Users WHERE UserID = %s"
-        response = query_db_with_params(cursor, connection, query, (int(userId),))
-        if not response:
-            logging.error("User not found")
-            raise HTTPException(status_code=404, detail="User not found")
-        userId = str(response[0][0])
-        period = ""
+        async with admission["reports"].admit(INTERACTIVE):
+            _, pdf = await build_report(userId, params, is_scheduled)
         if is_scheduled:
-            now = time.time()
-            now_str = datetime.fromtimestamp(now).strftime("%d/%m/%Y")
-            start_str = datetime.fromtimestamp((now - params.recurrence.seconds)).strftime("%d/%m/%Y")
-            period = start_str + " - " + now_str
-        else:
-            period = params.period
-        prompt = PromptTemplate(
-            input_variables=["period", "kpi", "machines"],
-            template=(
-                "Generate the periodic report for the period {period}, including the "
-                "following KPIs: {kpi}; the KPIs concern the specified machines: {machines}."
-            )
-        )
-        filled_prompt = prompt.format(
-            period=period,
-            kpi=",".join(params.kpis),
-            machines=",".join(params.machines)
-        )
-        question = Question(userInput=filled_prompt, userId=userId)
-        ai_response = call_ai_agent(question).json()
-        logging.info(ai_response)
-        answer = Answer.model_validate(ai_response)
-        tmp_path = "/tmp/" + userId + "_" + params.name + ".pdf"
-        create_report_pdf(answer, userId, tmp_path, params.name + ("_periodic" if is_scheduled else ""),
-                          "Periodic" if is_scheduled else params.type)
-        close_connection(connection, cursor)
-        if is_scheduled:
-            return (params.name, params.email, tmp_path)
-        return FileResponse(
-            path=tmp_path,
-            media_type="application/pdf",
-            filename="downloaded_example.pdf"
-        )
+            return (params.name, params.email, pdf)
+        return Response(content=pdf, media_type="application/pdf",
+                        headers={"Content-Disposition": 'attachment; filename="downloaded_example.pdf"'})
     except HTTPException as e:
         logging.error("HTTPException: %s", e.detail)
-        close_connection(connection, cursor)
         raise e
     except Exception as e:
         exc_type, exc_obj, exc_tb = sys.exc_info()
         fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
         print(exc_type, fname, exc_tb.tb_lineno)
         logging.error("Exception: %s", str(e))
-        close_connection(connection, cursor)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def generate_and_send_report(userId: str, email: str, params: ScheduledReport, api_key: str):
+@app.post("/smartfactory/reports/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_report_job(userId: Annotated[str, Body()], params: Annotated[Report, Body()],
+                            api_key: str = Depends(get_verify_api_key(["gui"]))):
+    """
+    Endpoint to generate a report in the background.
+    This endpoint receives the user id and the settings of the report, and returns at once the id of the job
+    generating it; its status is polled with the reports/jobs/{job_id} endpoint.
+    Args:
+        userId: the id of the user.
+        params: the settings of the report to generate.
+    Returns:
+        A Json with the status of the job.
+    """
+    async def run(job: ReportJob):
+        # the job is already accepted, it waits for a slot however long the queue is
+        async with admission["reports"].admit(bounded=False):
+            report_id, _ = await build_report(userId, params, job=job)
+        return report_id
+
+    job = report_jobs.submit(userId, run)
+    logging.info("Submitted report job %s", job.id)
+    return ORJSONResponse(content=job.getDict(), status_code=status.HTTP_202_ACCEPTED)
+
+
+def find_report_job(job_id: str, userId: str):
+    # the jobs of other users are not found, so that their ids cannot be probed
+    job = report_jobs.get(job_id, userId)
+    if job is None:
+        logging.error("Report job %s not found", job_id)
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job
+
+
+@app.get("/smartfactory/reports/jobs/{job_id}", status_code=status.HTTP_200_OK)
+def get_report_job(job_id: str, userId: str, api_key: str = Depends(get_verify_api_key(["gui"]))):
+    """
+    Endpoint to retrieve the status of a report job.
+    Args:
+        job_id: the id of the job.
+        userId: the id of the user who submitted the job.
+    Returns:
+        A Json with the status and stage of the job, and the id of the report once it is completed.
+    Raises:
+        HTTPException: If the job is not found or was submitted by another user.
+    """
+    return ORJSONResponse(content=find_report_job(job_id, userId).getDict(), status_code=200)
+
+
+@app.get("/smartfactory/reports/jobs/{job_id}/download")
+def download_report_job(job_id: str, userId: str, api_key: str = Depends(get_verify_api_key(["gui"]))):
+    """
+    Endpoint to download the report generated by a job, streamed from the object storage.
+    Args:
+        job_id: the id of the job.
+        userId: the id of the user who submitted the job.
+    Returns:
+        The PDF file.
+    Raises:
+        HTTPException: If the job is not found, was submitted by another user or is not completed yet.
+    """
+    job = find_report_job(job_id, userId)
+    if job.status == FAILED:
+        raise HTTPException(status_code=409, detail="Report job failed: " + str(job.error))
+    if job.status != COMPLETED:
+        raise HTTPException(status_code=409, detail="Report job not completed yet")
+    return stream_report(job.result)
+
+
+async def generate_and_send_report(userId: str, email: str, params: ScheduledReport, api_key: str):
     """
     This function generates a schedules report and sends it via email.
     Args:
@@ -672,8 +1092,9 @@ def generate_and_send_report(userId: str, email: str, params: ScheduledReport, a
         params: the settings of the report.
     """
     logging.info("Started scheduled report generation")
-    report_name, to_email, tmp_path = generate_report(userId, params, True, api_key)
-    send_report(to_email, report_name, tmp_path)
+    async with admission["reports"].admit(SCHEDULED):
+        _, pdf = await build_report(userId, params, True)
+    await run_in_threadpool(send_report, params.email, params.name, pdf)
 
 
 @app.get("/smartfactory/reports/schedule")
@@ -685,23 +1106,15 @@ def retrieve_schedules(userId: str, api_key: str = Depends(get_verify_api_key(["
         userId: the id of the user.
     Returns:
         A Json file with the list of ScheduledReport objects.
+    Raises:
+        HTTPException: If a server exception occurs.
     """
-    schedules = []
-    minio = get_minio_connection()
-    objects = minio.list_objects(bucket_name="settings", recursive=True)
-    matching_files = []
-    for obj in objects:
-        logging.info(obj.object_name)
-        if obj.object_name.endswith("_scheduling.json") and (userId + "/") in obj.object_name:
-            matching_files.append(obj.object_name.split('/')[-1])
-    logging.info(matching_files)
-    for file_name in matching_files:
-        response = minio.get_object("settings", userId + "/" + file_name)
-        json_str = response.read().decode("utf-8")
-        logging.info(json_str)
-        sched = json.loads(json_str)
-        schedules.append(sched)
-    return JSONResponse(content={"data": schedules}, status_code=200)
+    try:
+        schedules = retrieve_user_schedules(int(userId))
+    except Exception as e:
+        logging.error("Exception: %s", str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+    return ORJSONResponse(content={"data": schedules}, status_code=200)
 
 
 @app.post("/smartfactory/reports/schedule", status_code=status.HTTP_200_OK)
@@ -717,33 +1130,15 @@ async def schedule_report(userId: Annotated[str, Body()], params: Annotated[Sche
         HTTPException: If a server exception occurs or the user is not found.
     """
     try:
-        connection, cursor = get_db_connection()
-        query = "SELECT UserID, Email FROM Users WHERE UserID = %s"
-        response = query_db_with_params(cursor, connection, query, (int(userId),))
+        response = await run_in_threadpool(find_user_email, int(userId))
         if not response:
             logging.error("User not found")
             raise HTTPException(status_code=404, detail="User not found")
         email = response[0][1]
-        close_connection(connection, cursor)
-        logging.info(params.id)
-        if params.id is None:
-            logging.info("Insert scheduling")
-            global last_task_id
-            last_task_id = last_task_id + 1
-            params.id = last_task_id
-        elif str(params.id) in tasks.keys():
-            logging.info("Update scheduling")
-            params.name = tasks.get(str(params.id)).getDict().name
-        json_str = params.model_dump_json()
-        minio = get_minio_connection()
-        minio.put_object("settings", userId + "/" + params.name + "_scheduling.json", BytesIO(json_str.encode("utf-8")),
-                         length=len(json_str), content_type="application/json")
-        async with tasks_lock:
-            tasks[str(params.id)] = Task(func=generate_and_send_report, args=(userId, email, params, api_key),
-                                         delay=params.recurrence.seconds, json=params, start_date=params.startDate)
+        await run_in_threadpool(save_schedule, int(userId), params)
+        add_scheduled_report(userId, email, params, api_key)
     except HTTPException as e:
         logging.error("HTTPException: %s", e.detail)
-        close_connection(connection, cursor)
         raise e
     except Exception as e:
         logging.error("Exception: %s", str(e))
@@ -751,72 +1146,72 @@ async def schedule_report(userId: Annotated[str, Body()], params: Annotated[Sche
 
 
 @app.get("/smartfactory/kpi", status_code=status.HTTP_200_OK)
-def get_kpi(_: str = Depends(get_verify_api_key(["gui"]))):
+async def get_kpi(if_none_match: Annotated[Optional[str], Header()] = None, _: str = Depends(get_verify_api_key(["gui"]))):
     """
     Retrieve all Key Performance Indicators (KPIs) from the knowledge base.
 
-    This function constructs a URL using the host and port specified in the environment variables
-    `KB_HOST` and `KB_PORT`. It then sends a GET request to the constructed URL to retrieve KPIs.
+    This function sends a GET request to the knowledge base through the pooled KB client, whose
+    base URL is built from the environment variables `KB_HOST` and `KB_PORT`.
     The request includes an API key in the headers for authentication.
+    The KPIs are cached until they expire or a new KPI is inserted.
 
     Args:
+        if_none_match: The ETag of the copy of the KPIs already held by the client.
         _: str: A dependency injection placeholder for API key verification.
 
     Returns:
-        JSONResponse: A JSON response containing the KPIs retrieved from the knowledge base with a status code of 200.
+        JSONResponse: A JSON response containing the KPIs retrieved from the knowledge base with a status code of 200,
+        or 304 if the client copy is still valid.
     """
-    KB_HOST = os.getenv("KB_HOST", "kb")
-    KB_PORT = os.getenv("KB_PORT", "8000")
-    url = f"http://{KB_HOST}:{KB_PORT}/kb/retrieveKPIs"
-
-    api_key = os.getenv("API_KEY")
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': api_key
-    }
+    entry = response_cache.get("kpi", "")
+    if entry is not None:
+        return entry.to_response(if_none_match)
 
     logging.info("Retrieving all KPIs")
-    response = requests.get(url, headers=headers)
-    return JSONResponse(content=response.json(), status_code=200)
+    response = await single_flight.do(normalize_key(["kb", "/kb/retrieveKPIs"]),
+                                      lambda: downstream.get("kb").get("/kb/retrieveKPIs"))
+    if not response.is_success:
+        return ORJSONResponse(content=response.json(), status_code=200)
+    return response_cache.set("kpi", "", response.json(), CACHE_TTLS["kpi"]).to_response(if_none_match)
 
 
 @app.get("/smartfactory/retrieveMachines", status_code=status.HTTP_200_OK)
-def get_machines(_: str = Depends(get_verify_api_key(["gui"]))):
+async def get_machines(if_none_match: Annotated[Optional[str], Header()] = None,
+                       _: str = Depends(get_verify_api_key(["gui"]))):
     """
     Retrieve all machines from the knowledge base.
 
     This function sends a GET request to the knowledge base service to retrieve
     information about all machines. It requires an API key for authentication.
+    The machines are cached until they expire.
 
     Args:
+        if_none_match: The ETag of the copy of the machines already held by the client.
         _: A dependency injection placeholder for API key verification.
 
     Returns:
-        JSONResponse: A JSON response containing the list of machines and a status code of 200.
+        JSONResponse: A JSON response containing the list of machines and a status code of 200,
+        or 304 if the client copy is still valid.
     """
-    KB_HOST = os.getenv("KB_HOST", "kb")
-    KB_PORT = os.getenv("KB_PORT", "8000")
-    url = f"http://{KB_HOST}:{KB_PORT}/kb/retrieveMachines"
-
-    api_key = os.getenv("API_KEY")
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': api_key
-    }
+    entry = response_cache.get("machines", "")
+    if entry is not None:
+        return entry.to_response(if_none_match)
 
     logging.info("Retrieving all Machines")
-    response = requests.get(url, headers=headers)
-    return JSONResponse(content=response.json(), status_code=200)
+    response = await single_flight.do(normalize_key(["kb", "/kb/retrieveMachines"]),
+                                      lambda: downstream.get("kb").get("/kb/retrieveMachines"))
+    if not response.is_success:
+        return ORJSONResponse(content=response.json(), status_code=200)
+    return response_cache.set("machines", "", response.json(), CACHE_TTLS["machines"]).to_response(if_none_match)
 
 
 @app.post("/smartfactory/kpi", status_code=status.HTTP_200_OK)
-def insert_kpi(kpi: Kpi, _: str = Depends(get_verify_api_key(["gui"]))):
+async def insert_kpi(kpi: Kpi, _: str = Depends(get_verify_api_key(["gui"]))):
     """
     Inserts a KPI (Key Performance Indicator) into the knowledge base.
 
     This function sends a POST request to the knowledge base service to insert
-    the provided KPI data. The knowledge base service URL and API key are
-    retrieved from environment variables.
+    the provided KPI data, through the pooled KB client.
 
     Args:
         kpi (Kpi): The KPI object to be inserted.
@@ -825,77 +1220,63 @@ def insert_kpi(kpi: Kpi, _: str = Depends(get_verify_api_key(["gui"]))):
     Returns:
         JSONResponse: A JSON response containing the result of the insertion operation.
     """
-    KB_HOST = os.getenv("KB_HOST", "localhost")
-    KB_PORT = os.getenv("KB_PORT", "8000")
-    url = f"http://{KB_HOST}:{KB_PORT}/kb/insert"
-
-    api_key = os.getenv("API_KEY")
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': api_key
-    }
     logging.info("Inserting KPI: %s", kpi)
 
     # kpi is already a dict when it comes from the RAG
-    
-    # kpi = kpi.dict()
-
-    # kpi = json.dumps(kpi)
+    kpi = jsonable_encoder(kpi)
 
-    response = requests.post(url, data=kpi, headers=headers)
+    response = await downstream.get("kb").post("/kb/insert", json=kpi)
     response_data = response.json()
-    if response_data['Status'] == 0:
-        return JSONResponse(content=kpi["id"], status_code=200)
+    if response_data.get('Status') == 0:
+        # the cached list of KPIs is now stale
+        response_cache.invalidate("kpi")
+        return ORJSONResponse(content=kpi["id"], status_code=200)
     else:
-        return JSONResponse(content=response_data, status_code=400)
+        return ORJSONResponse(content=response_data, status_code=400)
 
 
 @app.post("/smartfactory/calculate", status_code=status.HTTP_200_OK)
-def calculate_kpi(request: List[KpiRequest], _: str = Depends(get_verify_api_key(["gui"]))):
+async def calculate_kpi(request: List[KpiRequest], _: str = Depends(get_verify_api_key(["gui"]))):
     """
     Calculate KPI based on the provided request data.
 
-    This function sends a POST request to the KPI engine to calculate KPIs.
-    The KPI engine host and port are retrieved from environment variables.
-    The request data is converted to JSON and sent to the KPI engine.
+    This function sends a POST request to the KPI engine to calculate KPIs, through the pooled
+    KPI engine client. The request data is converted to JSON and sent to the KPI engine.
 
     Args:
         request (List[KpiRequest]): A list of KPI request objects.
         _ (str, optional): Dependency injection for API key verification.
 
+    Identical requests arriving while one is in flight share its response.
+
     Returns:
         JSONResponse: The response from the KPI engine containing the calculated KPIs.
     """
-    KPI_ENGINE_HOST = os.getenv("KPI_ENGINE_HOST", "kpi-engine")
-    KPI_ENGINE_PORT = os.getenv("KPI_ENGINE_PORT", "8000")
-    url = f"http://{KPI_ENGINE_HOST}:{KPI_ENGINE_PORT}/kpi/calculate"
-
-    api_key = os.getenv("API_KEY")
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': api_key
-    }
-    kpi_request = json.dumps([req.to_dict() for req in request])
+    payload = [req.to_dict() for req in request]
+    kpi_request = json.dumps(payload)
     logging.info("Calculating KPIs: %s", kpi_request)
 
-    response = requests.post(url, headers=headers,
-                             data=kpi_request)  # TODO Check when the kpi-engine will push its code
-    return JSONResponse(content=response.json(), status_code=200)
+    response = await single_flight.do(normalize_key(["kpi_engine", "/kpi/calculate", payload]),
+                                      lambda: downstream.get("kpi_engine").post("/kpi/calculate", content=kpi_request))
+    # the body is already JSON, it is passed through without parsing it
+    return Response(content=response.content, status_code=200, media_type="application/json")
 
 
 @app.post("/smartfactory/agent/{userId}", response_model=Answer)
-def ai_agent_interaction(userInput: Annotated[str, Body(embed=True)], userId: str,
-                         api_key: str = Depends(get_verify_api_key(["gui"]))):
+async def ai_agent_interaction(userInput: Annotated[str, Body(embed=True)], userId: str,
+                               api_key: str = Depends(get_verify_api_key(["gui"])),
+                               slot: None = Depends(admission_slot("agent"))):
     """
     Endpoint to interact with the AI agent.
     This endpoint receives user input and forwards it to the AI agent, then returns the generated response.
+    At most AGENT_MAX_CONCURRENCY requests are processed at the same time, the others wait in a bounded queue.
     
     Args:
         userInput (str): The user input to be processed by the AI agent.
     Returns:
         answer: The response generated by the AI agent.
     Raises:
-        HTTPException: If the input is empty or an unexpected error occurs.
+        HTTPException: If the input is empty or an unexpected error occurs, 429 or 503 if the agent is overloaded.
     """
     if not userInput:
         logging.error("Empty input")
@@ -904,13 +1285,13 @@ def ai_agent_interaction(userInput: Annotated[str, Body(embed=True)], userId: st
         # Send the user input to the RAG API and get the response
         # build the Question object
         question = Question(userInput=userInput, userId=userId)
-        response = call_ai_agent(question)
+        response = await call_ai_agent(question)
         answer = response.json()
         if answer["label"] == 'new_kpi':
             # add new kpi
             try:
                 logging.info("Inserting new KPI: %s", answer["data"])
-                insert_kpi(answer["data"], os.getenv("API_KEY"))
+                await insert_kpi(answer["data"], os.getenv("API_KEY"))
             except Exception as e:
                 logging.error("Exception: %s", str(e))
                 raise HTTPException(status_code=500, detail=str(e))
@@ -919,10 +1300,9 @@ def ai_agent_interaction(userInput: Annotated[str, Body(embed=True)], userId: st
             # generate report
             # name is based on the current datetime
             report_name = "report_" + str(datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
-            tmp_path = "/tmp/" + report_name + ".pdf"
             try:
                 logging.info("Generating report: %s", answer["data"])
-                report_id = create_report_pdf(answer, userId, tmp_path, report_name)
+                report_id, _ = await run_in_threadpool(create_report_pdf, answer, userId, report_name)
                 # replace the data with the report id
                 answer["data"] = str(report_id)
                 answer["textResponse"] = report_name
@@ -938,144 +1318,291 @@ def ai_agent_interaction(userInput: Annotated[str, Body(embed=True)], userId: st
     return answer
 
 
-@app.post('/smartfactory/historical')
-def retrieve_historical_data(historical_params: HistoricalQueryParams,
-                             api_key: str = Depends(get_verify_api_key(["gui"]))):
+def validate_historical_params(historical_params: HistoricalQueryParams):
     """
-    Endpoint to retrieve historical data.
-    This endpoint receives a set of parameters and retrieves historical data from the database based on those parameters.
+    This function checks the parameters of a historical data query.
     Args:
         historical_params (HistoricalQueryParams): The parameters for the historical data query.
     Returns:
-        response: The historical data retrieved from the database.
+        The list of requested KPI IDs.
     Raises:
-        HTTPException: If the query parameters are malformed or an unexpected error occurs.
+        HTTPException: If the query parameters are malformed.
     """
-
     # check if group_time has valid values
-    if historical_params.group_time and historical_params.group_time not in ['P1D', 'P1W', 'P1M']:
+    if historical_params.group_time and historical_params.group_time not in VALID_GRANULARITIES:
         raise HTTPException(status_code=400, detail="Invalid group_time value")
 
     # check if necessary fields are not empty
-    if not historical_params.kpi or not historical_params.timeframe or not historical_params.machines:
+    kpi_ids = historical_params.kpi_ids()
+    if not kpi_ids or not historical_params.timeframe or not historical_params.machines:
+        raise HTTPException(status_code=400, detail="Missing required fields")
+
+    if "start_date" not in historical_params.timeframe or "end_date" not in historical_params.timeframe:
         raise HTTPException(status_code=400, detail="Missing required fields")
 
-    # The database only supports the following fields for a KPI ID
+    if historical_params.aggregator not in VALID_AGGREGATORS:
+        raise HTTPException(status_code=400, detail="Invalid aggregator value")
+
+    if historical_params.format not in ("rows", "columnar"):
+        raise HTTPException(status_code=400, detail="Invalid format value")
+
+    if historical_params.max_points is not None and historical_params.max_points < 3:
+        raise HTTPException(status_code=400, detail="max_points must be at least 3")
+
+    if historical_params.downsampling not in VALID_DOWNSAMPLING_METHODS:
+        raise HTTPException(status_code=400, detail="Invalid downsampling value")
+
+    # The database only supports the fields sum, min, max and avg for a KPI ID,
     # the others will need to be requested using the calculate KPI endpoint
-    valid_fields = {"sum", "min", "max", "avg"}
-    kpi_id = historical_params.kpi
-    kpi_name, field = None, None
-
-    # Check the last 3 characters of the KPI ID
-    # Extract the suffix to get the field
-    if kpi_id[-3:] in valid_fields:
-        # Find the last underscore
-        split_index = kpi_id.rfind("_")
-
-        # Dividi il nome del KPI
-        kpi_name = kpi_id[:split_index]
-        field = kpi_id[split_index + 1:]
-
-    # check if the kpi is valid and was split correctly
-    if not kpi_name or not field:
-        raise HTTPException(status_code=400, detail="Invalid KPI ID")
-
-    # substitute square brackets with parentheses in machine list
-    historical_params.machines = tuple(historical_params.machines)
-
-    # remove commas from machines string in case it's a single one
-    if len(historical_params.machines) == 1:
-        machines = str(historical_params.machines).replace(",", "")
-    else:
-        machines = str(historical_params.machines)
+    for kpi_id in kpi_ids:
+        try:
+            split_kpi_id(kpi_id)
+        except ValueError as e:
+            logging.error("Invalid historical query: %s", str(e))
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return kpi_ids
+
 
+def build_historical_query(historical_params: HistoricalQueryParams, kpi_ids, machines):
+    """
+    This function builds the native Druid query for the given parameters.
+    Args:
+        historical_params (HistoricalQueryParams): The parameters giving the timeframe, granularity and aggregator.
+        kpi_ids: The KPI IDs to retrieve.
+        machines: The machines to include.
+    Returns:
+        The native Druid query.
+    Raises:
+        HTTPException: If the query parameters are malformed.
+    """
     try:
-        # Build the query body
-
-        # group_time is optional and has values:
-        # 'P1D'for daily intervals
-        # 'P1W' for weekly intervals
-        # 'P1M' for monthly intervals.
-
-        ''' previous code
-        query = """SELECT name, TIME_FORMAT(__time, 'yyyy-MM-dd') AS timeframe FROM \"timeseries\" WHERE kpi = '{}' AND '__time' >= '{}' AND __time < '{}' 
-                    AND name IN {} GROUP BY 
-        """.format(
-            historical_params.kpi, historical_params.timeframe["start_date"],
-            historical_params.timeframe["end_date"], machines
+        return build_native_query(
+            kpi_ids,
+            historical_params.timeframe["start_date"],
+            historical_params.timeframe["end_date"],
+            machines,
+            historical_params.group_time,
+            historical_params.aggregator
         )
+    except ValueError as e:
+        logging.error("Invalid historical query: %s", str(e))
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # append optional group by time clause
-        if historical_params.group_time:
-            query += f"""TIME_FLOOR(__time, '{historical_params.group_time}'),"""
-
-        query += "name, __time"
-        '''
-
-        # Base SELECT and FROM
-        query = f"""
-                    SELECT name,
-                """
-
-        # Include time formatting only for time series (group_time is present)
-        if historical_params.group_time:
-            query += f"TIME_FORMAT(TIME_FLOOR(__time, '{historical_params.group_time}'), 'yyyy-MM-dd') AS \"timestamp\", "
-
-        # Add KPI field aggregation, since max,avg etc. are keywords, they need to be enclosed in double quotes
-        query += f"SUM(\"{field}\") AS {kpi_id} FROM \"timeseries\" WHERE kpi = '{kpi_name}'"
-
-        # Add WHERE clause for timeframe and machines
-        query += f"""
-                      AND __time >= TIMESTAMP '{historical_params.timeframe["start_date"]}'
-                      AND __time < TIMESTAMP '{historical_params.timeframe["end_date"]}'
-                      AND name IN {machines}
-                """
-
-        # Add GROUP BY clause
-        query += " GROUP BY name"
-        # Group by time if present
-        if historical_params.group_time:
-            query += f", TIME_FLOOR(__time, '{historical_params.group_time}')"
-
-        # Execute the query
-        response = execute_druid_query(os.getenv('DRUID_QUERY_ENDPOINT'), {"query": query})
-        if response:
-            print("Query response:", response)
-        else:
-            print("Failed to retrieve query response.")
 
+def run_historical_query(query: dict):
+    """
+    This function executes a native Druid query.
+    Args:
+        query: The native Druid query.
+    Returns:
+        The Druid response.
+    Raises:
+        HTTPException: If Druid could not be queried.
+    """
+    response = execute_druid_query(get_native_query_endpoint(), query)
+    if response is None:
+        logging.error("Failed to retrieve query response.")
+        raise HTTPException(status_code=502, detail="Failed to retrieve historical data")
+    return response
+
+
+def shape_historical_data(historical_params: HistoricalQueryParams, kpi_ids, query: dict, response):
+    """
+    This function converts a Druid response to the format requested in the parameters,
+    downsampling the series if needed.
+    Args:
+        historical_params (HistoricalQueryParams): The parameters for the historical data query.
+        kpi_ids: The requested KPI IDs.
+        query: The native Druid query.
+        response: The Druid response, restricted to the requested machines.
+    Returns:
+        The historical data, as a list of rows or in columnar format.
+    """
+    if historical_params.max_points and historical_params.group_time:
+        # Downsample every (machine, KPI) series independently, so the payload size
+        # only depends on max_points and not on the requested range
+        result = to_columnar(query, response, kpi_ids, historical_params.group_time)
+        for series in result["series"]:
+            downsample_series(series, historical_params.max_points, historical_params.downsampling)
+        if historical_params.format == "columnar":
+            return result
+        return columnar_to_rows(result, kpi_ids)
+
+    if historical_params.format == "columnar":
+        return to_columnar(query, response, kpi_ids, historical_params.group_time)
+    return to_rows(query, response, kpi_ids, historical_params.group_time)
+
+
+def query_historical_data(historical_params: HistoricalQueryParams):
+    """
+    This function retrieves historical data from Druid based on the given parameters.
+    The data is retrieved with a single native Druid query, even when several KPIs are requested.
+    Args:
+        historical_params (HistoricalQueryParams): The parameters for the historical data query.
+    Returns:
+        The historical data retrieved from the database, as a list of rows or in columnar format.
+    Raises:
+        HTTPException: If the query parameters are malformed or an unexpected error occurs.
+    """
+    kpi_ids = validate_historical_params(historical_params)
+    query = build_historical_query(historical_params, kpi_ids, historical_params.machines)
+    try:
+        response = run_historical_query(query)
+        return shape_historical_data(historical_params, kpi_ids, query, response)
+    except HTTPException as e:
+        raise e
     except Exception as e:
         logging.error("Exception: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
-    return response
+
+def historical_cache_key(historical_params: HistoricalQueryParams):
+    """
+    This function builds the normalized cache key of a historical data query.
+    Machines are sorted and KPI IDs deduplicated, since they don't change the returned data.
+    Args:
+        historical_params (HistoricalQueryParams): The parameters for the historical data query.
+    Returns:
+        The cache key.
+    """
+    params = historical_params.model_dump(exclude={"widgetId"})
+    params["kpi"], params["kpis"] = None, historical_params.kpi_ids()
+    params["machines"] = sorted(set(str(machine) for machine in historical_params.machines))
+    return normalize_key(params)
+
+
+@app.post('/smartfactory/historical')
+def retrieve_historical_data(historical_params: HistoricalQueryParams,
+                             if_none_match: Annotated[Optional[str], Header()] = None,
+                             api_key: str = Depends(get_verify_api_key(["gui"]))):
+    """
+    Endpoint to retrieve historical data.
+    This endpoint receives a set of parameters and retrieves historical data from the database based on those parameters.
+    Responses are cached for a short time and carry an ETag: a request with a matching If-None-Match
+    header gets a 304 Not Modified response.
+    Args:
+        historical_params (HistoricalQueryParams): The parameters for the historical data query.
+        if_none_match (str): The ETag of the copy of the data already held by the client.
+    Returns:
+        response: The historical data retrieved from the database, as a list of rows or in columnar format.
+    Raises:
+        HTTPException: If the query parameters are malformed or an unexpected error occurs.
+    """
+    key = historical_cache_key(historical_params)
+    entry = response_cache.get("historical", key)
+    if entry is None:
+        entry = response_cache.set("historical", key, query_historical_data(historical_params),
+                                   CACHE_TTLS["historical"])
+    return entry.to_response(if_none_match)
+
+
+@app.post('/smartfactory/historical/batch')
+def retrieve_historical_data_batch(queries: List[HistoricalQueryParams],
+                                   api_key: str = Depends(get_verify_api_key(["gui"]))):
+    """
+    Endpoint to retrieve the historical data of several dashboard widgets at once.
+    Queries sharing the same timeframe, granularity and aggregator are merged in a single Druid query
+    (the union of their KPIs and machines), the resulting queries are run concurrently.
+    Args:
+        queries (List[HistoricalQueryParams]): The historical data queries, each one identified by its widgetId
+            (the position in the list is used when missing).
+    Returns:
+        JSONResponse: {"data": {widgetId: historical data}, "errors": {widgetId: {"status_code", "detail"}}}.
+    Raises:
+        HTTPException: If the batch is empty or too big, or if two queries have the same widgetId.
+    """
+    if not queries:
+        raise HTTPException(status_code=400, detail="Missing required fields")
+    if len(queries) > HISTORICAL_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail="Too many queries in the batch")
+    widget_ids = [params.widgetId or str(index) for index, params in enumerate(queries)]
+    duplicates = sorted(widget_id for widget_id, count in Counter(widget_ids).items() if count > 1)
+    if duplicates:
+        # the results of the queries with the same id would overwrite each other
+        raise HTTPException(status_code=400, detail="Duplicate widgetId: " + ", ".join(duplicates))
+
+    results, errors = {}, {}
+    groups = {}
+    for widget_id, params in zip(widget_ids, queries):
+        try:
+            kpi_ids = validate_historical_params(params)
+        except HTTPException as e:
+            errors[widget_id] = {"status_code": e.status_code, "detail": e.detail}
+            continue
+
+        entry = response_cache.get("historical", historical_cache_key(params))
+        if entry is not None:
+            results[widget_id] = json.loads(entry.body)
+            continue
+
+        group_key = (params.timeframe["start_date"], params.timeframe["end_date"], params.group_time,
+                     params.aggregator)
+        groups.setdefault(group_key, []).append((widget_id, params, kpi_ids))
+
+    def run_group(members):
+        kpi_ids = list(dict.fromkeys(kpi_id for _, _, member_kpis in members for kpi_id in member_kpis))
+        machines = list(dict.fromkeys(machine for _, params, _ in members for machine in params.machines))
+        query = build_historical_query(members[0][1], kpi_ids, machines)
+        return query, run_historical_query(query)
+
+    logging.info("Running %d historical queries for %d widgets", len(groups), len(queries))
+    with ThreadPoolExecutor(max_workers=max(1, min(HISTORICAL_BATCH_WORKERS, len(groups)))) as executor:
+        # every group runs in a copy of the context, so that its spans are children of the request span
+        futures = {executor.submit(contextvars.copy_context().run, run_group, members): members
+                   for members in groups.values()}
+        for future, members in futures.items():
+            try:
+                query, response = future.result()
+            except HTTPException as e:
+                for widget_id, _, _ in members:
+                    errors[widget_id] = {"status_code": e.status_code, "detail": e.detail}
+                continue
+            except Exception as e:
+                logging.error("Exception: %s", str(e))
+                for widget_id, _, _ in members:
+                    errors[widget_id] = {"status_code": 500, "detail": str(e)}
+                continue
+
+            for widget_id, params, kpi_ids in members:
+                try:
+                    data = shape_historical_data(params, kpi_ids, query,
+                                                 select_machines(query, response, params.machines))
+                except Exception as e:
+                    logging.error("Exception: %s", str(e))
+                    errors[widget_id] = {"status_code": 500, "detail": str(e)}
+                    continue
+                response_cache.set("historical", historical_cache_key(params), data, CACHE_TTLS["historical"])
+                results[widget_id] = data
+
+    return ORJSONResponse(content={"data": results, "errors": errors}, status_code=200)
 
 
 @app.post('/smartfactory/predict', response_model=Json_out)
-def get_prediction(pred_request: Json_in, api_key: str = Depends(get_verify_api_key(["gui"]))):
+async def get_prediction(pred_request: Json_in, api_key: str = Depends(get_verify_api_key(["gui"])),
+                         slot: None = Depends(admission_slot("predict"))):
     """
     Endpoint to get a prediction from the ML model.
     This endpoint receives a set of parameters and retrieves a prediction from the ML model based on those parameters.
+    Identical requests arriving while a prediction is in flight share its result.
+    At most PREDICT_MAX_CONCURRENCY requests are processed at the same time, the others wait in a bounded queue.
     Args:
         pred_request (Json_in): The parameters for the prediction request.
         api_key (str): The API key for authentication.
     Returns:
         response: The prediction data retrieved from the ML model.
     Raises:
-        HTTPException: If the prediction request is malformed or an unexpected error occurs.
+        HTTPException: If the prediction request is malformed or an unexpected error occurs, 429 or 503 if the
+            predictions are overloaded.
     """
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': os.getenv('API_KEY')
-    }
-    DATA_PROCESSING_HOST = os.getenv("DATA_PROCESSING_HOST", "data-processing")
-    DATA_PROCESSING_PORT = os.getenv("DATA_PROCESSING_PORT", "8000")
-    url = f"http://{DATA_PROCESSING_HOST}:{DATA_PROCESSING_PORT}/data-processing/predict"
+    url = "/data-processing/predict"
 
     logging.info("sending request to %s: %s", url, pred_request)
     try:
         # Send the prediction request to the data processing module and get the response
-        response = requests.post(url, json=jsonable_encoder(pred_request), headers=headers)
+        payload = jsonable_encoder(pred_request)
+        response = await single_flight.do(normalize_key(["data_processing", url, payload]),
+                                          lambda: downstream.get("data_processing").post(url, json=payload))
         response.raise_for_status()
     except Exception as e:
         logging.error("Exception: %s", str(e))
@@ -1083,6 +1610,17 @@ def get_prediction(pred_request: Json_in, api_key: str = Depends(get_verify_api_
     return response.json()
 
 
+@app.get("/smartfactory/admission", status_code=status.HTTP_200_OK)
+def get_admission(api_key: str = Depends(get_verify_api_key(["gui"]))):
+    """
+    Endpoint to monitor the admission control of the expensive endpoints.
+    Returns:
+        A Json with, for every class of endpoints, the running and queued requests and the rejection counters.
+    """
+    return ORJSONResponse(content={name: controller.getDict() for name, controller in admission.items()},
+                          status_code=200)
+
+
 @app.get("/smartfactory/dummy")
 async def dummy_endpoint(api_key: str = Depends(get_verify_api_key(["gui"]))):
     """
@@ -1090,7 +1628,7 @@ async def dummy_endpoint(api_key: str = Depends(get_verify_api_key(["gui"]))):
     Returns:
         JSONResponse: A JSON response with a dummy message.
     """
-    return JSONResponse(content={"message": "This is a dummy endpoint"}, status_code=200)
+    return ORJSONResponse(content={"message": "This is a dummy endpoint"}, status_code=200)
 
 
 if __name__ == "__main__":
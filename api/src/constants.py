@@ -4,4 +4,82 @@ druid_host = os.getenv('DRUID_HOST')
 druid_post = os.getenv('DRUID_PORT')
 
 FRONTEND_HOST = "http://localhost:8000"
-DRUID_URL = f"http://{druid_host}:{druid_post}/druid/v2/sql"
\ No newline at end of file
+DRUID_URL = f"http://{druid_host}:{druid_post}/druid/v2/sql"
+
+# In-process response cache, TTLs are in seconds
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 512))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+CACHE_TTLS = {
+    "historical": int(os.getenv('HISTORICAL_CACHE_TTL', 60)),
+    "kpi": int(os.getenv('KPI_CACHE_TTL', 300)),
+    "machines": int(os.getenv('MACHINES_CACHE_TTL', 300)),
+    "watermark": int(os.getenv('WATERMARK_CACHE_TTL', 60)),
+}
+
+# Responses smaller than this number of bytes are sent uncompressed
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 1024))
+
+# Batch historical queries
+HISTORICAL_BATCH_MAX_QUERIES = int(os.getenv('HISTORICAL_BATCH_MAX_QUERIES', 50))
+HISTORICAL_BATCH_WORKERS = int(os.getenv('HISTORICAL_BATCH_WORKERS', 4))
+
+# Outbound HTTP clients to the other services, timeouts are in seconds
+DOWNSTREAM_TIMEOUTS = {
+    "kb": float(os.getenv('KB_TIMEOUT', 10)),
+    "kpi_engine": float(os.getenv('KPI_ENGINE_TIMEOUT', 30)),
+    "data_processing": float(os.getenv('DATA_PROCESSING_TIMEOUT', 60)),
+    "rag": float(os.getenv('RAG_TIMEOUT', 180)),
+}
+DOWNSTREAM_CONNECT_TIMEOUT = float(os.getenv('DOWNSTREAM_CONNECT_TIMEOUT', 5))
+DOWNSTREAM_MAX_CONNECTIONS = int(os.getenv('DOWNSTREAM_MAX_CONNECTIONS', 200))
+DOWNSTREAM_MAX_KEEPALIVE = int(os.getenv('DOWNSTREAM_MAX_KEEPALIVE', 20))
+DOWNSTREAM_KEEPALIVE_EXPIRY = float(os.getenv('DOWNSTREAM_KEEPALIVE_EXPIRY', 30))
+
+# Maximum number of alerts accepted by a single batch request
+ALERT_BATCH_MAX_SIZE = int(os.getenv('ALERT_BATCH_MAX_SIZE', 1000))
+
+# Background email delivery, delays are in seconds
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', 50))
+EMAIL_MAX_RETRIES = int(os.getenv('EMAIL_MAX_RETRIES', 3))
+EMAIL_RETRY_BACKOFF = float(os.getenv('EMAIL_RETRY_BACKOFF', 1))
+EMAIL_IDLE_TIMEOUT = float(os.getenv('EMAIL_IDLE_TIMEOUT', 30))
+
+# Alert streams, the keep-alive interval is in seconds
+ALERT_STREAM_QUEUE_SIZE = int(os.getenv('ALERT_STREAM_QUEUE_SIZE', 100))
+ALERT_STREAM_KEEPALIVE = float(os.getenv('ALERT_STREAM_KEEPALIVE', 15))
+
+# Alert pagination
+ALERTS_PAGE_SIZE = int(os.getenv('ALERTS_PAGE_SIZE', 100))
+ALERTS_PAGE_MAX = int(os.getenv('ALERTS_PAGE_MAX', 1000))
+
+# Alert partitions, the maintenance interval is in seconds
+ALERT_RETENTION_MONTHS = int(os.getenv('ALERT_RETENTION_MONTHS', 12))
+ALERT_PARTITIONS_AHEAD = int(os.getenv('ALERT_PARTITIONS_AHEAD', 2))
+ALERT_MAINTENANCE_INTERVAL = int(os.getenv('ALERT_MAINTENANCE_INTERVAL', 86400))
+
+# Report scheduler, the timeout is in seconds
+REPORT_SCHEDULER_WORKERS = int(os.getenv('REPORT_SCHEDULER_WORKERS', 2))
+REPORT_JOB_TIMEOUT = float(os.getenv('REPORT_JOB_TIMEOUT', 600))
+
+# Background report generation jobs, the retention of the finished jobs is in seconds
+REPORT_JOB_WORKERS = int(os.getenv('REPORT_JOB_WORKERS', 4))
+REPORT_JOB_RETENTION = float(os.getenv('REPORT_JOB_RETENTION', 3600))
+REPORT_STREAM_CHUNK_SIZE = int(os.getenv('REPORT_STREAM_CHUNK_SIZE', 64 * 1024))
+
+# Number of users whose settings and dashboards are cached
+USER_SETTINGS_CACHE_SIZE = int(os.getenv('USER_SETTINGS_CACHE_SIZE', 1024))
+
+# Admission control of the expensive endpoints: the requests running at the same time and the ones waiting
+# for a slot, per class of endpoints. The queue timeout and the Retry-After of the rejections are in seconds
+ADMISSION_LIMITS = {
+    "agent": int(os.getenv('AGENT_MAX_CONCURRENCY', 8)),
+    "predict": int(os.getenv('PREDICT_MAX_CONCURRENCY', 8)),
+    "reports": int(os.getenv('REPORTS_MAX_CONCURRENCY', 4)),
+}
+ADMISSION_QUEUE_SIZES = {
+    "agent": int(os.getenv('AGENT_QUEUE_SIZE', 32)),
+    "predict": int(os.getenv('PREDICT_QUEUE_SIZE', 32)),
+    "reports": int(os.getenv('REPORTS_QUEUE_SIZE', 8)),
+}
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 30))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 5))
@@ -1,9 +1,26 @@
+import logging
 import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import pool
+
+from tracing import start_span
+
+# Connection pool settings
+POOL_MIN_CONNECTIONS = int(os.getenv('POSTGRES_POOL_MIN', 1))
+POOL_MAX_CONNECTIONS = int(os.getenv('POSTGRES_POOL_MAX', 10))
+# Seconds to wait for a free connection before giving up
+POOL_TIMEOUT = float(os.getenv('POSTGRES_POOL_TIMEOUT', 10))
+# Connections idle for longer than this many seconds are checked before being handed out
+POOL_HEALTHCHECK_INTERVAL = float(os.getenv('POSTGRES_POOL_HEALTHCHECK_INTERVAL', 30))
 
 def get_db_connection():
     """
     Establishes a connection to the PostgreSQL database using credentials from environment variables.
+    The connection is not pooled: request handlers should use db_connection() instead.
     Returns:
         tuple: A tuple containing the database connection and cursor objects.
                If the connection fails, returns (None, None).
@@ -79,4 +96,150 @@ def close_connection(connection, cursor):
     if cursor != None:
         cursor.close()
     if connection != None:
-        connection.close()
\ No newline at end of file
+        connection.close()
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection becomes available in the pool within the timeout.
+    """
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Thread safe pool of PostgreSQL connections with a size limit and health checks.
+
+    Callers block (up to timeout seconds) when all the connections are in use. Connections that
+    were closed, or that fail a "SELECT 1" after being idle for too long, are replaced.
+    """
+    def __init__(self, minconn: int, maxconn: int, timeout: float, healthcheck_interval: float, **connect_kwargs):
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self._pool = pool.ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+
+    def getconn(self):
+        """
+        Borrows a healthy connection from the pool.
+
+        Raises:
+            PoolTimeout: If no connection is released within the timeout.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout("No PostgreSQL connection available in the pool")
+        try:
+            connection = self._pool.getconn()
+            if not self._is_healthy(connection):
+                logging.warning("Discarding broken PostgreSQL connection")
+                self._discard(connection)
+                connection = self._pool.getconn()
+            return connection
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, connection):
+        """
+        Gives a connection back to the pool, rolling back any transaction left open.
+        """
+        try:
+            if connection.closed:
+                self._discard(connection)
+            else:
+                self._last_used[id(connection)] = time.monotonic()
+                self._pool.putconn(connection)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+        self._last_used.clear()
+
+    def _is_healthy(self, connection):
+        if connection.closed:
+            return False
+        if time.monotonic() - self._last_used.get(id(connection), 0) < self.healthcheck_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, connection):
+        self._last_used.pop(id(connection), None)
+        self._pool.putconn(connection, close=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Returns the process-wide connection pool, creating it on first use.
+    Returns:
+        ConnectionPool: The connection pool.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    POOL_MIN_CONNECTIONS,
+                    POOL_MAX_CONNECTIONS,
+                    POOL_TIMEOUT,
+                    POOL_HEALTHCHECK_INTERVAL,
+                    dbname=os.getenv('POSTGRES_DB'),
+                    user=os.getenv('POSTGRES_USER'),
+                    password=os.getenv('POSTGRES_PASSWORD'),
+                    host=os.getenv('POSTGRES_HOST'),
+                    port=os.getenv('POSTGRES_PORT')
+                )
+    return _pool
+
+
+def close_pool():
+    """
+    Closes all the connections of the process-wide pool, e.g. on application shutdown.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+@contextmanager
+def db_connection():
+    """
+    Borrows a connection from the process-wide pool for the duration of a with block.
+
+    Usage:
+        with db_connection() as (connection, cursor):
+            cursor.execute(query, params)
+            connection.commit()
+
+    Uncommitted work is rolled back when the connection goes back to the pool.
+    Yields:
+        tuple: A tuple containing the database connection and cursor objects.
+    Raises:
+        PoolTimeout: If no connection is available within the pool timeout.
+    """
+    with start_span("postgres", **{"db.system": "postgresql"}) as span:
+        connection_pool = get_pool()
+        waited = time.perf_counter()
+        connection = connection_pool.getconn()
+        span.set("db.pool_wait_ms", (time.perf_counter() - waited) * 1000)
+        try:
+            cursor = connection.cursor()
+            try:
+                yield connection, cursor
+            finally:
+                cursor.close()
+        finally:
+            connection_pool.putconn(connection)
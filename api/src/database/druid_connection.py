@@ -1,5 +1,9 @@
+import os
+
 import requests
 
+from tracing import start_span
+
 def execute_druid_query(url, body):
     """
     Executes a SQL query on a Druid instance.
@@ -12,10 +16,30 @@ def execute_druid_query(url, body):
         "Content-Type": "application/json"
     }
 
-    try:
-        response = requests.post(url, headers=headers, json=body)
-        response.raise_for_status()  # Raise an error for bad status codes
-        return response.json()  # Return the JSON response
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred: {e}")
-        return None
\ No newline at end of file
+    with start_span("druid.query", **{"druid.query_type": body.get("queryType", "sql")}) as span:
+        try:
+            response = requests.post(url, headers=headers, json=body)
+            response.raise_for_status()  # Raise an error for bad status codes
+            return response.json()  # Return the JSON response
+        except requests.exceptions.RequestException as e:
+            print(f"An error occurred: {e}")
+            span.fail(e)
+            return None
+
+
+def get_native_query_endpoint():
+    """
+    Returns the Druid native query endpoint.
+
+    Uses DRUID_NATIVE_QUERY_ENDPOINT if set, otherwise derives it from the SQL endpoint
+    (DRUID_QUERY_ENDPOINT) by dropping the trailing "/sql".
+
+    :return: The URL of the Druid native query endpoint.
+    """
+    endpoint = os.getenv('DRUID_NATIVE_QUERY_ENDPOINT')
+    if endpoint:
+        return endpoint
+    sql_endpoint = (os.getenv('DRUID_QUERY_ENDPOINT') or '').rstrip("/")
+    if sql_endpoint.endswith("/sql"):
+        sql_endpoint = sql_endpoint[:-len("/sql")]
+    return sql_endpoint
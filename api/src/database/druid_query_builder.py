@@ -0,0 +1,261 @@
+import math
+from collections import OrderedDict
+
+# Fields stored for every KPI row in the "timeseries" datasource
+VALID_FIELDS = ("sum", "min", "max", "avg")
+
+# Supported rollups applied to the rows falling in the same time bucket
+VALID_AGGREGATORS = ("sum", "min", "max", "avg")
+
+# ISO-8601 periods accepted for the group_time parameter
+VALID_GRANULARITIES = ("P1D", "P1W", "P1M")
+
+DATASOURCE = "timeseries"
+
+_DRUID_AGGREGATOR_TYPES = {
+    "sum": "doubleSum",
+    "min": "doubleMin",
+    "max": "doubleMax",
+}
+
+
+def split_kpi_id(kpi_id: str):
+    """
+    Splits a KPI ID such as "working_time_sum" into the KPI name and the stored field.
+
+    Args:
+        kpi_id (str): The KPI ID, ending with one of the VALID_FIELDS.
+
+    Returns:
+        tuple: (kpi_name, field).
+
+    Raises:
+        ValueError: If the KPI ID does not end with a supported field.
+    """
+    split_index = kpi_id.rfind("_") if kpi_id else -1
+    if split_index <= 0 or kpi_id[split_index + 1:] not in VALID_FIELDS:
+        raise ValueError("Invalid KPI ID: " + str(kpi_id))
+    return kpi_id[:split_index], kpi_id[split_index + 1:]
+
+
+def _granularity(group_time):
+    """
+    Maps the group_time parameter to a native Druid granularity spec.
+    """
+    if group_time is None:
+        return "all"
+    if group_time not in VALID_GRANULARITIES:
+        raise ValueError("Invalid group_time value: " + str(group_time))
+    return {"type": "period", "period": group_time, "timeZone": "UTC"}
+
+
+def _selector(dimension: str, values):
+    """
+    Builds a filter matching one or more values of a dimension.
+    """
+    values = list(values)
+    if len(values) == 1:
+        return {"type": "selector", "dimension": dimension, "value": values[0]}
+    return {"type": "in", "dimension": dimension, "values": values}
+
+
+def _kpi_aggregations(kpi_ids, aggregator: str):
+    """
+    Builds one filtered aggregator per KPI ID, so that several KPIs are computed in a single scan.
+
+    Returns:
+        tuple: (aggregations, postAggregations) lists for the native query.
+    """
+    if aggregator not in VALID_AGGREGATORS:
+        raise ValueError("Invalid aggregator: " + str(aggregator))
+
+    aggregations, post_aggregations = [], []
+    for kpi_id in kpi_ids:
+        kpi_name, field = split_kpi_id(kpi_id)
+        kpi_filter = _selector("kpi", [kpi_name])
+        if aggregator == "avg":
+            # Druid has no native average, compute it as sum / count. In a merged query the filter may
+            # match no row of a bucket: the average is null there, rather than the NaN of 0 / 0
+            aggregations.append({"type": "filtered", "filter": kpi_filter, "aggregator": {
+                "type": "doubleSum", "name": kpi_id + "__sum", "fieldName": field}})
+            aggregations.append({"type": "filtered", "filter": kpi_filter, "aggregator": {
+                "type": "count", "name": kpi_id + "__count"}})
+            post_aggregations.append({
+                "type": "expression",
+                "name": kpi_id,
+                "expression": f'if("{kpi_id}__count" > 0, "{kpi_id}__sum" / "{kpi_id}__count", null)'
+            })
+        else:
+            aggregations.append({"type": "filtered", "filter": kpi_filter, "aggregator": {
+                "type": _DRUID_AGGREGATOR_TYPES[aggregator], "name": kpi_id, "fieldName": field}})
+    return aggregations, post_aggregations
+
+
+def build_native_query(kpi_ids, start_date: str, end_date: str, machines, group_time=None, aggregator: str = "sum"):
+    """
+    Builds a native Druid JSON query retrieving one or more KPIs for the given machines.
+
+    A "timeseries" query is emitted when a single machine is requested, since no split on the
+    machine dimension is needed; otherwise a "groupBy" on the machine name is emitted.
+
+    Args:
+        kpi_ids (list(str)): KPI IDs to retrieve (e.g. ["working_time_sum", "idle_time_max"]).
+        start_date (str): Inclusive start of the interval.
+        end_date (str): Exclusive end of the interval.
+        machines (list(str)): Names of the machines to include.
+        group_time (str, optional): One of VALID_GRANULARITIES, None to aggregate the whole interval.
+        aggregator (str): Rollup applied inside each bucket, one of VALID_AGGREGATORS.
+
+    Returns:
+        dict: The native query body to POST to the Druid native query endpoint.
+
+    Raises:
+        ValueError: If any of the parameters is invalid.
+    """
+    kpi_ids = list(OrderedDict.fromkeys(kpi_ids))
+    machines = list(OrderedDict.fromkeys(machines))
+    if not kpi_ids or not machines:
+        raise ValueError("At least one KPI and one machine are required")
+
+    aggregations, post_aggregations = _kpi_aggregations(kpi_ids, aggregator)
+    kpi_names = OrderedDict.fromkeys(split_kpi_id(kpi_id)[0] for kpi_id in kpi_ids)
+
+    query = {
+        "dataSource": DATASOURCE,
+        "intervals": [f"{start_date}/{end_date}"],
+        "granularity": _granularity(group_time),
+        "filter": {"type": "and", "fields": [_selector("kpi", kpi_names), _selector("name", machines)]},
+        "aggregations": aggregations,
+        "postAggregations": post_aggregations,
+    }
+    if len(machines) == 1:
+        query["queryType"] = "timeseries"
+        query["context"] = {"skipEmptyBuckets": True}
+    else:
+        query["queryType"] = "groupBy"
+        query["dimensions"] = ["name"]
+    return query
+
+
+def _iter_events(query: dict, response):
+    """
+    Yields (timestamp, machine, event) tuples from a native timeseries or groupBy response.
+    """
+    for row in response or []:
+        if query["queryType"] == "timeseries":
+            yield row["timestamp"], query["filter"]["fields"][1]["value"], row["result"]
+        else:
+            yield row["timestamp"], row["event"]["name"], row["event"]
+
+
+def _value(event: dict, kpi_id: str):
+    """
+    Returns the value of a KPI in a bucket, None if the bucket has none, including the NaN of an
+    average over no rows.
+    """
+    value = event.get(kpi_id)
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def select_machines(query: dict, response, machines):
+    """
+    Keeps only the rows of the given machines from a native response, so that the result of a
+    query merged from several requests can be split back per request.
+    """
+    if query["queryType"] == "timeseries":
+        return response
+    machines = set(machines)
+    return [row for row in response or [] if row["event"].get("name") in machines]
+
+
+def to_rows(query: dict, response, kpi_ids, group_time=None):
+    """
+    Converts a native response to the row shape historically returned by the endpoint:
+    [{"name": machine, "timestamp": "yyyy-MM-dd", <kpi_id>: value, ...}, ...].
+    The "timestamp" key is only present when grouping by time.
+    """
+    rows = []
+    for timestamp, machine, event in _iter_events(query, response):
+        # skip buckets where none of the requested KPIs has a value (e.g. they only matched
+        # other KPIs of a merged query)
+        if all(_value(event, kpi_id) is None for kpi_id in kpi_ids):
+            continue
+        row = {"name": machine}
+        if group_time:
+            row["timestamp"] = timestamp[:10]
+        for kpi_id in kpi_ids:
+            row[kpi_id] = _value(event, kpi_id)
+        rows.append(row)
+    return rows
+
+
+def to_columnar(query: dict, response, kpi_ids, group_time=None):
+    """
+    Converts a native response to a columnar shape, with one entry per (machine, KPI) series:
+    {"series": [{"name": machine, "kpi": kpi_id, "timestamp": [...], "values": [...]}, ...]}.
+    Buckets where the KPI has no value are left out of the series.
+    """
+    series = OrderedDict()
+    for timestamp, machine, event in _iter_events(query, response):
+        for kpi_id in kpi_ids:
+            value = _value(event, kpi_id)
+            if value is None:
+                continue
+            entry = series.setdefault((machine, kpi_id),
+                                      {"name": machine, "kpi": kpi_id, "timestamp": [], "values": []})
+            entry["timestamp"].append(timestamp[:10] if group_time else None)
+            entry["values"].append(value)
+    if not group_time:
+        for entry in series.values():
+            del entry["timestamp"]
+    return {"series": list(series.values())}
+
+
+def columnar_to_rows(columnar: dict, kpi_ids):
+    """
+    Converts a columnar result back to the row shape returned by to_rows, sorted by timestamp.
+    Useful when the series were transformed (e.g. downsampled) independently of each other.
+    """
+    rows = OrderedDict()
+    for entry in columnar["series"]:
+        timestamps = entry.get("timestamp", [None] * len(entry["values"]))
+        for timestamp, value in zip(timestamps, entry["values"]):
+            row = rows.get((timestamp, entry["name"]))
+            if row is None:
+                row = {"name": entry["name"]}
+                if timestamp is not None:
+                    row["timestamp"] = timestamp
+                row.update(dict.fromkeys(kpi_ids))
+                rows[(timestamp, entry["name"])] = row
+            row[entry["kpi"]] = value
+    return sorted(rows.values(), key=lambda row: row.get("timestamp") or "")
+
+
+def build_time_boundary_query():
+    """
+    Builds a native Druid JSON query retrieving the timestamp of the latest ingested row, i.e. the
+    watermark of the data.
+
+    Returns:
+        dict: The native query body to POST to the Druid native query endpoint.
+    """
+    return {"queryType": "timeBoundary", "dataSource": DATASOURCE, "bound": "maxTime"}
+
+
+def max_time(response):
+    """
+    Extracts the latest timestamp from the response of a time boundary query.
+
+    Args:
+        response (list): The Druid response.
+
+    Returns:
+        str: The ISO-8601 timestamp, or None if the datasource is empty.
+    """
+    for result in response or []:
+        value = (result.get("result") or {}).get("maxTime")
+        if value is not None:
+            return value
+    return None
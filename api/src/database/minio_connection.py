@@ -1,7 +1,11 @@
+from io import BytesIO
 from minio import Minio
 from minio.error import S3Error
 from dotenv import load_dotenv
 import os
+import re
+
+from tracing import start_span
 
 load_dotenv() # Load environment variables from the .env file
 
@@ -44,6 +48,69 @@ def upload_object(client: Minio, bucket_name: str, object_name: str, file_path:
         return False
     
 
+def upload_bytes(client: Minio, bucket_name: str, object_name: str, data: bytes, content_type: str):
+    """
+    Uploads an in-memory file to the Minio object storage service. Large files are uploaded in parts.
+
+    Args:
+        client (Minio): The Minio client object used to interact with the object storage service.
+        bucket_name (str): The name of the bucket where the file will be uploaded.
+        object_name (str): The name of the object to create.
+        data (bytes): The content of the file.
+        content_type (str): The content type of the file.
+
+    Returns:
+        bool: True if the file is successfully uploaded, otherwise False.
+    """
+    if not client.bucket_exists(bucket_name):
+        client.make_bucket(bucket_name)
+        print("Bucket not found, creating one.")
+    try:
+        # the client switches to a multipart upload when the length exceeds the part size
+        with start_span("minio.put_object", bucket=bucket_name, object=object_name, size=len(data)):
+            client.put_object(bucket_name, object_name, BytesIO(data), length=len(data), content_type=content_type)
+        print(f"{len(data)} bytes are successfully uploaded as object '{object_name}' to bucket '{bucket_name}'.")
+        return True
+    except S3Error as exc:
+        print("Error occurred.", exc)
+        return False
+
+
+def parse_byte_range(range_header: str, size: int):
+    """
+    Parses the Range header of a download request.
+
+    Only a single byte range is supported; other ranges are ignored and the whole object is served.
+
+    Args:
+        range_header (str): The value of the Range header, e.g. "bytes=0-1023", "bytes=1024-" or "bytes=-512".
+        size (int): The size of the object.
+
+    Returns:
+        tuple: The offset and length of the requested range, or None to serve the whole object.
+
+    Raises:
+        ValueError: If the range is not satisfiable.
+    """
+    if not range_header:
+        return None
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", range_header)
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.group(1), match.group(2)
+    if first == "":
+        # suffix range, the last bytes of the object
+        length = min(int(last), size)
+        if length == 0:
+            raise ValueError("Range not satisfiable")
+        return size - length, length
+    start = int(first)
+    end = min(int(last), size - 1) if last != "" else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, end - start + 1
+
+
 def download_object(client: Minio, bucket_name: str, object_name: str, file_path: str):
     """
     Downloads a file from the Minio object storage service.
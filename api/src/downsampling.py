@@ -0,0 +1,110 @@
+import numpy as np
+
+# Supported downsampling methods
+VALID_METHODS = ("lttb", "minmax")
+
+
+def lttb_indices(x, y, max_points: int):
+    """
+    Selects the points to keep with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last points are always kept; the points in between are split in max_points - 2
+    buckets and, for each bucket, the point forming the largest triangle with the previously
+    selected point and the average of the next bucket is kept.
+
+    Args:
+        x (np.ndarray): The x coordinates, sorted in ascending order.
+        y (np.ndarray): The y coordinates.
+        max_points (int): The maximum number of points to keep.
+
+    Returns:
+        np.ndarray: The sorted indices of the points to keep.
+    """
+    n = len(x)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 3:
+        raise ValueError("LTTB needs to keep at least 3 points")
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # Bucket edges over the interior points [1, n - 1), every bucket holds at least one point
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    # The "next bucket" of the last interior bucket is the last point
+    mean_x = np.append(mean_x[1:], x[n - 1])
+    mean_y = np.append(mean_y[1:], y[n - 1])
+
+    selected = np.empty(max_points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        areas = np.abs((x[a] - mean_x[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (mean_y[i] - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(x, y, max_points: int):
+    """
+    Selects the points to keep with a min/max envelope.
+
+    The series is split in max_points // 2 buckets of consecutive points and the minimum and
+    maximum of every bucket are kept, so that peaks are never lost.
+
+    Args:
+        x (np.ndarray): The x coordinates, sorted in ascending order.
+        y (np.ndarray): The y coordinates.
+        max_points (int): The maximum number of points to keep.
+
+    Returns:
+        np.ndarray: The sorted indices of the points to keep.
+    """
+    n = len(x)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 2:
+        raise ValueError("The min/max envelope needs to keep at least 2 points")
+    n_buckets = max_points // 2
+
+    y = np.asarray(y, dtype=float)
+    buckets = np.arange(n) * n_buckets // n
+    # Sort by bucket, then by value: the first and last point of every bucket are its min and max
+    order = np.lexsort((y, buckets))
+    starts = np.flatnonzero(np.r_[True, buckets[order][1:] != buckets[order][:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.concatenate((order[starts], order[ends])))
+
+
+def downsample_series(series: dict, max_points: int, method: str = "lttb"):
+    """
+    Downsamples a columnar series in place.
+
+    Args:
+        series (dict): A series with the "timestamp" (yyyy-MM-dd strings) and "values" lists.
+        max_points (int): The maximum number of points to keep.
+        method (str): One of VALID_METHODS.
+
+    Returns:
+        dict: The same series, with at most max_points points.
+
+    Raises:
+        ValueError: If the method is not supported or max_points is too small.
+    """
+    if method not in VALID_METHODS:
+        raise ValueError("Invalid downsampling method: " + str(method))
+    timestamps = series.get("timestamp")
+    if not timestamps or len(timestamps) <= max_points:
+        return series
+
+    x = np.array(timestamps, dtype="datetime64[D]").astype(float)
+    y = np.asarray(series["values"], dtype=float)
+    indices = lttb_indices(x, y, max_points) if method == "lttb" else minmax_indices(x, y, max_points)
+
+    series["timestamp"] = [timestamps[i] for i in indices]
+    series["values"] = y[indices].tolist()
+    return series
@@ -0,0 +1,155 @@
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+
+from constants import EMAIL_BATCH_SIZE, EMAIL_MAX_RETRIES, EMAIL_RETRY_BACKOFF, EMAIL_IDLE_TIMEOUT
+
+
+class EmailQueue(object):
+    """
+    Background delivery of emails over a persistent SMTP connection.
+
+    Messages are put in a queue and sent by a single worker thread, so that the request that produced them
+    does not wait for the SMTP server. The worker keeps one authenticated connection open while there is
+    work to do, sends the queued messages in batches, and retries with exponential backoff when the
+    connection fails. The connection is closed after being idle for a while.
+    """
+    def __init__(self, batch_size: int = EMAIL_BATCH_SIZE, max_retries: int = EMAIL_MAX_RETRIES,
+                 retry_backoff: float = EMAIL_RETRY_BACKOFF, idle_timeout: float = EMAIL_IDLE_TIMEOUT):
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue()
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+
+    def start(self):
+        """
+        Starts the worker thread, if it is not running yet.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="email-queue", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """
+        Sends the messages still in the queue and stops the worker thread.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait for the queue to drain.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def put(self, message):
+        """
+        Queues a message for delivery.
+
+        Args:
+            message (email.message.Message): The message to send, with its From and To headers set.
+        """
+        self.start()
+        self._queue.put(message)
+
+    def pending(self):
+        """
+        Returns the number of messages waiting to be sent.
+        """
+        return self._queue.qsize()
+
+    def _connect(self):
+        server = smtplib.SMTP(os.getenv('SMTP_SERVER'), int(os.getenv('SMTP_PORT')))
+        server.ehlo()
+        from_password = os.getenv('SMTP_PASSWORD')
+        # local debugging servers do not support authentication
+        if from_password and server.has_extn("auth"):
+            server.login(os.getenv('SMTP_EMAIL'), from_password)
+        logging.info("SMTP connection opened")
+        return server
+
+    def _disconnect(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            self._server.close()
+        self._server = None
+        logging.info("SMTP connection closed")
+
+    def _next_batch(self):
+        """
+        Waits for a message, then takes the ones already queued behind it, up to the batch size.
+        Returns None when the queue is being stopped, an empty list when idle.
+        """
+        try:
+            first = self._queue.get(timeout=self.idle_timeout)
+        except queue.Empty:
+            return []
+        if first is None:
+            return None
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is None:
+                self._queue.put(None)
+                break
+            batch.append(message)
+        return batch
+
+    def _send_batch(self, batch):
+        for message in batch:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    if self._server is None:
+                        self._server = self._connect()
+                    self._server.send_message(message)
+                    self.sent += 1
+                    break
+                except smtplib.SMTPRecipientsRefused as e:
+                    # retrying would not help
+                    logging.error("Email to %s refused: %s", message['To'], str(e))
+                    self.failed += 1
+                    break
+                except (smtplib.SMTPException, OSError) as e:
+                    logging.warning("Error sending email to %s (attempt %d): %s", message['To'], attempt + 1, str(e))
+                    self._disconnect()
+                    if attempt == self.max_retries:
+                        logging.error("Giving up on email to %s", message['To'])
+                        self.failed += 1
+                    else:
+                        time.sleep(self.retry_backoff * (2 ** attempt))
+        logging.info("Sent batch of %d emails", len(batch))
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            if not batch:
+                self._disconnect()
+                continue
+            self._send_batch(batch)
+        # send what was queued before the stop
+        while True:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is not None:
+                self._send_batch([message])
+        self._disconnect()
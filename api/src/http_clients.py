@@ -0,0 +1,86 @@
+import logging
+import os
+
+import httpx
+
+from constants import DOWNSTREAM_TIMEOUTS, DOWNSTREAM_CONNECT_TIMEOUT, DOWNSTREAM_MAX_CONNECTIONS, \
+    DOWNSTREAM_MAX_KEEPALIVE, DOWNSTREAM_KEEPALIVE_EXPIRY
+
+
+def service_urls():
+    """
+    Builds the base URL of every downstream service from the environment variables.
+
+    Returns:
+        dict: The base URL of each service, by service name.
+    """
+    rag_endpoint = httpx.URL(os.getenv("RAG_API_ENDPOINT", "http://rag:8000/agent/chat"))
+    return {
+        "kb": f"http://{os.getenv('KB_HOST', 'kb')}:{os.getenv('KB_PORT', '8000')}",
+        "kpi_engine": f"http://{os.getenv('KPI_ENGINE_HOST', 'kpi-engine')}:{os.getenv('KPI_ENGINE_PORT', '8000')}",
+        "data_processing": f"http://{os.getenv('DATA_PROCESSING_HOST', 'data-processing')}:"
+                           f"{os.getenv('DATA_PROCESSING_PORT', '8000')}",
+        "rag": str(rag_endpoint.copy_with(path="/", query=None)),
+    }
+
+
+def rag_agent_path():
+    """
+    Returns the path of the RAG agent endpoint, relative to the RAG base URL.
+    """
+    return httpx.URL(os.getenv("RAG_API_ENDPOINT", "http://rag:8000/agent/chat")).path
+
+
+class DownstreamClients(object):
+    """
+    Long-lived httpx.AsyncClient instances, one per downstream service.
+
+    Every client keeps its connections alive between requests and has its own timeout, so that a slow service
+    (e.g. the AI agent) does not affect the others. The clients are opened and closed by the app lifespan.
+    """
+    def __init__(self):
+        self._clients = {}
+
+    def _create(self, name: str, base_url: str):
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers={'Content-Type': 'application/json', 'x-api-key': os.getenv('API_KEY', '')},
+            timeout=httpx.Timeout(DOWNSTREAM_TIMEOUTS[name], connect=DOWNSTREAM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=DOWNSTREAM_MAX_CONNECTIONS,
+                                max_keepalive_connections=DOWNSTREAM_MAX_KEEPALIVE,
+                                keepalive_expiry=DOWNSTREAM_KEEPALIVE_EXPIRY),
+        )
+
+    def start(self):
+        """
+        Opens a client for every downstream service.
+        """
+        for name, base_url in service_urls().items():
+            if name not in self._clients:
+                self._clients[name] = self._create(name, base_url)
+                logging.info("Opened HTTP client for %s at %s", name, base_url)
+
+    async def close(self):
+        """
+        Closes all the clients and their connections.
+        """
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """
+        Returns the client of a downstream service, opening the clients if the lifespan did not run yet.
+
+        Args:
+            name (str): The service name, one of "kb", "kpi_engine", "data_processing", "rag".
+
+        Returns:
+            httpx.AsyncClient: The client of the service.
+        """
+        if name not in self._clients:
+            self.start()
+        return self._clients[name]
+
+
+downstream = DownstreamClients()
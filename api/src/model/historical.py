@@ -1,21 +1,40 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 class HistoricalQueryParams(BaseModel):
     """
     Represents the parameters that describe a query to retrieve historical data.
 
     Attributes:
         kpi (str): The key performance indicator.
+        kpis: optional (list(str)): Additional key performance indicators to retrieve in the same query.
         timeframe (dict): {
             start_date (str): The start date of the timeframe.
             end_date (str): The end date of the timeframe.
         }.
         machines (list(str)): machines of which the data is collected.
         group_time: optional (str): The time interval for grouping.
+        aggregator: optional (str): How values in the same time interval are combined (sum, avg, min, max).
+        format: optional (str): Shape of the response, "rows" (list of dicts) or "columnar" (arrays per series).
+        max_points: optional (int): Maximum number of points returned per series, the series are downsampled if longer.
+        downsampling: optional (str): Downsampling method, "lttb" (Largest-Triangle-Three-Buckets) or "minmax" (envelope).
+        widgetId: optional (str): Identifier of the dashboard widget the query belongs to, used by batch requests.
     """
 
-    kpi: str
+    kpi: Optional[str] = None
+    kpis: Optional[List[str]] = None
     timeframe: dict
     machines: list
     group_time: Optional[str] = None
-    
+    aggregator: str = "sum"
+    format: str = "rows"
+    max_points: Optional[int] = None
+    downsampling: str = "lttb"
+    widgetId: Optional[str] = None
+
+    def kpi_ids(self):
+        """
+        Returns the list of requested KPI IDs, without duplicates.
+        """
+        ids = ([self.kpi] if self.kpi else []) + (self.kpis or [])
+        return list(dict.fromkeys(ids))
+
@@ -1,3 +1,4 @@
+import inspect
 import time
 from enum import Enum
 from datetime import datetime
@@ -17,8 +18,18 @@ class Task(object):
         return time.time() >= self.next_run
 
     async def run(self):
+        result = self.function(*(self.args))
+        if inspect.isawaitable(result):
+            await result
+
+    def run_sync(self):
         self.function(*(self.args))
+
+    def reschedule(self, now):
+        """Moves the next run to the first run time after now, skipping the runs that were missed."""
         self.next_run += self.delay
+        if self.next_run <= now:
+            self.next_run += ((now - self.next_run) // self.delay + 1) * self.delay
 
 class SchedulingFrequency(str, Enum):
     TEST = "test"
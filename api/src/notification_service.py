@@ -1,15 +1,26 @@
+import base64
+import binascii
 import os
 import smtplib
+from datetime import datetime
 from email.message import EmailMessage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 import logging
-from database.connection import query_db, get_db_connection
+from alert_hub import AlertHub
+from database.connection import db_connection
+from email_queue import EmailQueue
+from psycopg2.extras import execute_values
 import json
 from model.alert import Alert
 
 logging.basicConfig(level=logging.INFO)
 
+# emails are delivered in the background, over a persistent SMTP connection
+email_queue = EmailQueue()
+# new alerts are pushed to the open alert streams
+alert_hub = AlertHub()
+
 email_subject = "{} - Alert: {}"
 
 email_body = """
@@ -23,9 +34,29 @@ Machine Name: {}
 Severity: {}
 """
 
+def build_alert_email(to_email, alert):
+    """
+    Builds the email notification with the given alert details.
+
+    Args:
+        to_email (str): The recipient's email address.
+        alert (Alert): An alert object containing details about the alert.
+
+    Returns:
+        MIMEMultipart: The email message.
+    """
+    msg = MIMEMultipart()
+    msg['From'] = os.getenv('SMTP_EMAIL')
+    msg['To'] = to_email
+    msg['Subject'] = email_subject.format(alert.severity.value.upper(), alert.title)
+    body = email_body.format(alert.alertId, alert.description, alert.triggeredAt, alert.machineName, alert.severity.value)
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
 def send_email(to_email, alert):
     """
-    Sends an email notification with the given alert details.
+    Sends an email notification with the given alert details, on a new SMTP connection.
+    Notifications use the background email_queue instead.
 
     Args:
         to_email (str): The recipient's email address.
@@ -37,12 +68,7 @@ def send_email(to_email, alert):
     from_email = os.getenv('SMTP_EMAIL')
     from_password = os.getenv('SMTP_PASSWORD')
 
-    msg = MIMEMultipart()
-    msg['From'] = from_email
-    msg['To'] = to_email
-    msg['Subject'] = email_subject.format(alert.severity.value.upper(), alert.title)
-    body = email_body.format(alert.alertId, alert.description, alert.triggeredAt, alert.machineName, alert.severity.value)
-    msg.attach(MIMEText(body, 'plain'))
+    msg = build_alert_email(to_email, alert)
 
     try:
         smtp_server = os.getenv('SMTP_SERVER')
@@ -59,45 +85,110 @@ def send_email(to_email, alert):
     finally:
         server.quit()
 
-def send_report(to_email, report_name, tmp_path):
+def send_report(to_email, report_name, pdf):
     """
-    Sends an email notification with the given report pdf file attached.
+    Queues an email with the given report pdf file attached.
 
     Args:
         to_email (str): The recipient's email address.
         report_name (str): The name of the report.
-        tmp_path (str): the file path on the server.
-
-    Raises:
-        Exception: If there is an error sending the email.
+        pdf (bytes): the content of the report.
     """
-    from_email = os.getenv('SMTP_EMAIL')
-    from_password = os.getenv('SMTP_PASSWORD')
-
     msg = EmailMessage()
-    msg['From'] = from_email
+    msg['From'] = os.getenv('SMTP_EMAIL')
     msg['To'] = to_email
     msg['Subject'] = "Report: "+report_name
     msg.set_content("Hello, please find attached your scheduled report")
+    msg.add_attachment(pdf, maintype="application", subtype="pdf", filename=report_name+".pdf")
+    email_queue.put(msg)
+    logging.info("Report email queued")
 
-    try:
-        with open(tmp_path, "rb") as f:
-            pdf_data = f.read()
-            msg.add_attachment(pdf_data, maintype="application", subtype="pdf", filename=report_name+".pdf")
+def save_alerts(alerts):
+    """
+    Save a batch of alerts to the database, with their recipients.
 
-        smtp_server = os.getenv('SMTP_SERVER')
-        smtp_port = int(os.getenv('SMTP_PORT'))
+    The alerts are inserted with a single multi-row INSERT ... SELECT, which also updates the daily rollup,
+    and so are the recipients, which are resolved from the recipient roles by joining Users in the same
+    statement. Everything is committed at once.
 
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.login(from_email, from_password)
-        logging.info("Sending email")
-        server.send_message(msg)
-        logging.info("Email sent successfully")
+    Args:
+        alerts (list): The Alert instances to save.
+
+    Raises:
+        Exception: If there is an error inserting the alerts into the database.
+
+    Returns:
+        list: The IDs of the inserted alerts, in the same order as the given alerts.
+    """
+    if not alerts:
+        return []
+    try:
+        logging.info("Inserting %d alerts into database", len(alerts))
+        with db_connection() as (connection, cursor):
+            # the ordinal keeps the generated IDs in the order of the batch
+            insert_alerts_query = """
+            WITH new_alerts AS (
+                INSERT INTO Alerts (Title, Type, Description, TriggeredAt, MachineName, isPush, Severity)
+                SELECT v.title, v.type, v.description, v.triggered_at::timestamp, v.machine_name, v.is_push,
+                       v.severity
+                FROM (VALUES %s) AS v(ord, title, type, description, triggered_at, machine_name, is_push, severity)
+                ORDER BY v.ord
+                RETURNING AlertID, TriggeredAt, MachineName, Type, Severity
+            ), rollup AS (
+                INSERT INTO AlertDailyRollup (AlertDate, MachineName, Type, Severity, AlertCount)
+                SELECT TriggeredAt::date, MachineName, Type, Severity, COUNT(*) FROM new_alerts
+                GROUP BY 1, 2, 3, 4
+                ON CONFLICT (AlertDate, MachineName, Type, Severity)
+                DO UPDATE SET AlertCount = AlertDailyRollup.AlertCount + EXCLUDED.AlertCount
+            )
+            SELECT AlertID, TriggeredAt FROM new_alerts
+            """
+            rows = [(i, alert.title, alert.type, alert.description, alert.triggeredAt, alert.machineName,
+                     True if alert.isPush else False, alert.severity.value) for i, alert in enumerate(alerts)]
+            inserted = sorted(execute_values(cursor, insert_alerts_query, rows, page_size=len(rows), fetch=True))
+            alert_ids = [alert_id for alert_id, _ in inserted]
+            logging.info("Alerts inserted with IDs: %s", alert_ids)
+
+            logging.info("Inserting into association table")
+            # the recipients are stored in the partition of the month of their alert
+            insert_recipients_query = """
+            INSERT INTO AlertRecipients (AlertID, UserID, TriggeredAt)
+            SELECT v.alert_id, u.UserID, v.triggered_at
+            FROM (VALUES %s) AS v(alert_id, triggered_at, roles)
+            JOIN Users u ON u.Role = ANY(v.roles::text[])
+            RETURNING AlertID, UserID
+            """
+            recipients = [(alert_id, triggered_at, list(alert.recipients))
+                          for (alert_id, triggered_at), alert in zip(inserted, alerts)]
+            recipient_rows = execute_values(cursor, insert_recipients_query, recipients,
+                                            page_size=len(recipients), fetch=True)
+
+            connection.commit()
+        logging.info("Alerts inserted successfully")
+
+        publish_alerts(dict(zip(alert_ids, alerts)), recipient_rows)
+
+        return alert_ids
     except Exception as e:
-        logging.error("Error sending email: " + str(e))
+        logging.error("Error inserting alerts into database: " + str(e))
         raise e
-    finally:
-        server.quit()
+
+def publish_alerts(alerts_by_id, recipient_rows):
+    """
+    Pushes saved alerts to the open alert streams of their recipients.
+
+    Args:
+        alerts_by_id (dict): The saved Alert instances, by alert ID.
+        recipient_rows (list): The (AlertID, UserID) rows inserted in AlertRecipients.
+    """
+    payloads = {}
+    user_alerts = {}
+    for alert_id, user_id in recipient_rows:
+        if alert_id not in payloads:
+            alert = alerts_by_id[alert_id]
+            payloads[alert_id] = dict(alert.to_dict(), alertId=alert_id, isEmail=False, recipients=[])
+        user_alerts.setdefault(str(user_id), []).append(payloads[alert_id])
+    alert_hub.publish(user_alerts)
 
 def save_alert(alert):
     """
@@ -121,59 +212,15 @@ def save_alert(alert):
         - isPush (bool): Whether the alert is a push notification.
         - severity (Severity): Severity level of the alert.
     """
-    try:
-        logging.info("Inserting alert into database")
-        connection, cursor = get_db_connection()
-
-        insertAlertQuery = """
-        INSERT INTO Alerts (Title, Type, Description, TriggeredAt, MachineName, isPush, Severity)
-        VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING AlertID
-        """
-
-        cursor.execute(insertAlertQuery, (
-            alert.title,
-            alert.type,
-            alert.description,
-            alert.triggeredAt,
-            alert.machineName,
-            True if alert.isPush else False,
-            alert.severity.value
-        ))
-
-        alertId = cursor.fetchone()[0]
-        logging.info("Alert inserted with ID: %s", alertId)
-
-        logging.info("Retrieving user IDs for recipients")
-        select_users_query = """
-        SELECT UserID FROM Users WHERE Role = ANY(%s)
-        """
-        cursor.execute(select_users_query, (alert.recipients,))
-        user_ids = cursor.fetchall()
-
-        logging.info("Inserting into association table")
-        insert_recipient_query = """
-        INSERT INTO AlertRecipients (AlertID, UserID) VALUES (%s, %s)
-        """
-        for user_id in user_ids:
-            cursor.execute(insert_recipient_query, (alertId, user_id[0]))
-
-        connection.commit()
-        logging.info("Alert inserted successfully")
-
-        return alertId
-    except Exception as e:
-        logging.error("Error inserting alert into database: " + str(e))
-        raise e    
-    finally:
-        cursor.close()
-        connection.close()
+    return save_alerts([alert])[0]
 
 def send_notification(alert):
     """
     Sends a notification based on the alert type.
 
     If the alert is a push notification, it logs the action and saves the alert.
-    If the alert is an email notification, it sends an email to each recipient listed in the alert.
+    If the alert is an email notification, it queues an email for each user having one of the recipient roles;
+    the emails are delivered in the background.
 
     Args:
         alert (Alert): An alert object containing notification details. 
@@ -194,11 +241,69 @@ def send_notification(alert):
         alertId = save_alert(alert)
         alert.alertId = alertId
     if alert.isEmail:
-        for recipient in alert.recipients:
-            emails = retrieve_email(recipient)
-            logging.info("Sending email to %s", emails)
-            for email in emails:
-                send_email(email, alert)
+        queue_alert_emails([alert])
+
+def send_notifications(alerts):
+    """
+    Sends the notifications of a batch of alerts.
+
+    The push alerts are saved with a single batch insert, then the emails are queued as in send_notification.
+
+    Args:
+        alerts (list): The Alert instances to notify.
+
+    Returns:
+        list: The ID of each alert, or None for the alerts that are not push notifications and are not saved.
+    """
+    push_alerts = [alert for alert in alerts if alert.isPush]
+    logging.info("Sending %d push notifications", len(push_alerts))
+    for alert, alertId in zip(push_alerts, save_alerts(push_alerts)):
+        alert.alertId = alertId
+    queue_alert_emails([alert for alert in alerts if alert.isEmail])
+    return [alert.alertId if alert.isPush else None for alert in alerts]
+
+def queue_alert_emails(alerts):
+    """
+    Queues the email notifications of the given alerts, resolving all the recipient roles with one query.
+
+    Args:
+        alerts (list): The Alert instances to send by email.
+    """
+    if not alerts:
+        return
+    emails_by_role = retrieve_emails({role for alert in alerts for role in alert.recipients})
+    for alert in alerts:
+        emails = list(dict.fromkeys(email for role in alert.recipients for email in emails_by_role.get(role, [])))
+        logging.info("Queueing email to %s", emails)
+        for email in emails:
+            email_queue.put(build_alert_email(email, alert))
+
+def retrieve_emails(roles):
+    """
+    Retrieve email addresses of users with any of the given roles from the database.
+
+    Args:
+        roles (iterable): The roles of the users whose email addresses are to be retrieved.
+
+    Returns:
+        dict: The email addresses of the users, by role.
+
+    Raises:
+        Exception: If there is an error retrieving email addresses from the database.
+    """
+    query = "SELECT Role, Email FROM Users WHERE Role = ANY(%s)"
+
+    try:
+        with db_connection() as (connection, cursor):
+            cursor.execute(query, (list(roles),))
+            response = cursor.fetchall()
+        emails_by_role = {}
+        for role, email in response:
+            emails_by_role.setdefault(role, []).append(email)
+        return emails_by_role
+    except Exception as e:
+        logging.error("Error retrieving emails for roles " + str(roles) + ": " + str(e))
+        raise e
 
 def retrieve_email(role):
     """
@@ -216,77 +321,187 @@ def retrieve_email(role):
     query = "SELECT Email FROM Users WHERE Role = %s"
 
     try:
-        connection, cursor = get_db_connection()
-        cursor.execute(query, (role,))
-        response = cursor.fetchall()
+        with db_connection() as (connection, cursor):
+            cursor.execute(query, (role,))
+            response = cursor.fetchall()
         emails = [row[0] for row in response]
         return emails
     except Exception as e:
         logging.error("Error retrieving emails for role " + role + ": " + str(e))
         raise e
-    finally:
-        cursor.close()
-        connection.close()
 
-def retrieve_alerts(userId, all):
+def encode_alert_cursor(alert):
+    """
+    Builds the opaque pagination cursor pointing after the given alert.
+
+    Args:
+        alert (dict): The last alert of a page, as returned by retrieve_alerts.
+
+    Returns:
+        str: The cursor.
+    """
+    position = "{}|{}".format(alert["triggeredAt"], alert["alertId"])
+    return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
+
+def decode_alert_cursor(cursor):
     """
-    Retrieve alerts for a specific user from the database.
-    
+    Reads a pagination cursor built by encode_alert_cursor.
+
+    Args:
+        cursor (str): The cursor.
+
+    Returns:
+        tuple: The (TriggeredAt, AlertID) position of the last alert of the previous page.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        triggered_at, alert_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return datetime.fromisoformat(triggered_at), int(alert_id)
+    except (UnicodeError, binascii.Error, ValueError):
+        raise ValueError("Invalid cursor: " + cursor)
+
+def retrieve_alerts(userId, all, limit=None, cursor=None, since=None):
+    """
+    Retrieve alerts for a specific user from the database, newest first.
+
+    The alerts are paginated by keyset on (TriggeredAt, AlertID): the next page starts after the cursor
+    of the last alert of the previous one, so that every page costs the same whatever its position.
+    Only the returned alerts are marked as read.
+
     Args:
         userId (str): The ID of the user for whom to retrieve alerts.
         all (bool): Flag to determine whether to retrieve all alerts or only unread alerts.
-        
+        limit (int): Maximum number of alerts to return, all of them if None.
+        cursor (str): The cursor of the last alert of the previous page, see encode_alert_cursor.
+        since (datetime): Only return the alerts triggered after this time.
+
     Returns:
         list: A list of dictionaries, each representing an alert.
-        
+
     Raises:
+        ValueError: If the cursor is malformed.
         Exception: If there is an error retrieving alerts from the database.
     """
     query = """
-    SELECT a.* FROM Alerts a
-    JOIN AlertRecipients ar ON a.AlertID = ar.AlertID
-    JOIN Users u ON ar.UserID = u.UserID
-    WHERE u.userID = %s
+    SELECT a.AlertID, a.Title, a.Type, a.Description, a.TriggeredAt, a.MachineName, a.isPush, a.Severity
+    FROM AlertRecipients ar
+    JOIN Alerts a ON a.AlertID = ar.AlertID AND a.TriggeredAt = ar.TriggeredAt
+    WHERE ar.UserID = %s
     """
-    
+    params = [userId]
+
     if not all:
         query += " AND ar.Read = FALSE"
+    # the conditions on ar.TriggeredAt let Postgres skip the partitions out of range
+    if cursor:
+        triggered_at, alert_id = decode_alert_cursor(cursor)
+        query += " AND ar.TriggeredAt <= %s AND (a.TriggeredAt, a.AlertID) < (%s, %s)"
+        params.extend((triggered_at, triggered_at, alert_id))
+    if since:
+        query += " AND ar.TriggeredAt > %s"
+        params.append(since)
+    query += " ORDER BY a.TriggeredAt DESC, a.AlertID DESC"
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
 
     try:
-        connection, cursor = get_db_connection()
-        cursor.execute(query, (userId,))
-        response = cursor.fetchall()
-        
-        alerts = []
-        for row in response:
-            logging.info("Row: %s", row)
-            alert = Alert(
-                alertId=row[0],
-                title=row[1],
-                type=row[2],
-                description=row[3],
-                triggeredAt=str(row[4]),
-                machineName=row[5],
-                isPush=bool(row[6]),
-                isEmail=False,
-                recipients=[],
-                severity=row[7]
-            )
-            alerts.append(alert.to_dict())
-
-        # Update all alerts to mark them as read
-        update_query = """
-        UPDATE AlertRecipients
-        SET Read = TRUE
-        WHERE UserID = %s
-        """
-        cursor.execute(update_query, (userId,))
-        connection.commit()
+        with db_connection() as (connection, db_cursor):
+            db_cursor.execute(query, tuple(params))
+            response = db_cursor.fetchall()
+            logging.info("Retrieved %d alerts", len(response))
+
+            alerts = []
+            for row in response:
+                alert = Alert(
+                    alertId=row[0],
+                    title=row[1],
+                    type=row[2],
+                    description=row[3],
+                    triggeredAt=str(row[4]),
+                    machineName=row[5],
+                    isPush=bool(row[6]),
+                    isEmail=False,
+                    recipients=[],
+                    severity=row[7]
+                )
+                alerts.append(alert.to_dict())
+
+            if alerts:
+                # Mark only the returned alerts as read
+                update_query = """
+                UPDATE AlertRecipients
+                SET Read = TRUE
+                WHERE UserID = %s AND AlertID = ANY(%s) AND Read = FALSE
+                """
+                db_cursor.execute(update_query, (userId, [alert["alertId"] for alert in alerts]))
+                connection.commit()
 
         return alerts
     except Exception as e:
         logging.error("Error retrieving alerts for " + userId + ": " + str(e))
         raise e
-    finally:
-        cursor.close()
-        connection.close()
\ No newline at end of file
+
+def retrieve_alert_trends(start_date, end_date, machineName=None):
+    """
+    Retrieve the number of alerts per day, machine, type and severity from the daily rollup.
+
+    Args:
+        start_date (date): The first day of the period.
+        end_date (date): The last day of the period.
+        machineName (str): Only count the alerts of this machine, if given.
+
+    Returns:
+        list: A list of dictionaries with the date, machine name, type, severity and number of alerts.
+
+    Raises:
+        Exception: If there is an error retrieving the trends from the database.
+    """
+    query = """
+    SELECT AlertDate, MachineName, Type, Severity, AlertCount FROM AlertDailyRollup
+    WHERE AlertDate BETWEEN %s AND %s
+    """
+    params = [start_date, end_date]
+    if machineName:
+        query += " AND MachineName = %s"
+        params.append(machineName)
+    query += " ORDER BY AlertDate, MachineName, Type, Severity"
+
+    try:
+        with db_connection() as (connection, cursor):
+            cursor.execute(query, tuple(params))
+            response = cursor.fetchall()
+        return [{"date": str(row[0]), "machineName": row[1], "type": row[2], "severity": row[3], "count": row[4]}
+                for row in response]
+    except Exception as e:
+        logging.error("Error retrieving alert trends: " + str(e))
+        raise e
+
+def run_alert_maintenance(retention_months, partitions_ahead):
+    """
+    Creates the monthly alert partitions of the coming months and drops the ones older than the retention.
+    The daily rollup is not affected, so the alert trends outlive the raw alerts.
+
+    Args:
+        retention_months (int): Number of past months of alerts to keep, besides the current one.
+        partitions_ahead (int): Number of future months to create the partitions for.
+
+    Returns:
+        int: The number of dropped partitions.
+
+    Raises:
+        Exception: If there is an error managing the partitions.
+    """
+    try:
+        with db_connection() as (connection, cursor):
+            cursor.execute("SELECT create_alert_partitions(%s)", (partitions_ahead,))
+            cursor.execute("SELECT drop_alert_partitions(%s)", (retention_months,))
+            dropped = cursor.fetchone()[0]
+            connection.commit()
+        logging.info("Alert maintenance done, %d partitions dropped", dropped)
+        return dropped
+    except Exception as e:
+        logging.error("Error during alert maintenance: " + str(e))
+        raise e
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Optional
+
+from constants import REPORT_JOB_WORKERS, REPORT_JOB_TIMEOUT, REPORT_JOB_RETENTION
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class ReportJob(object):
+    """
+    State of a report generation job.
+    """
+    def __init__(self, owner: str):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.status = QUEUED
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def progress(self, stage: str):
+        """
+        Records the stage the job is at, reported by the status endpoint.
+        """
+        self.stage = stage
+
+    def getDict(self):
+        return {
+            "jobId": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "reportId": self.result,
+            "error": self.error,
+        }
+
+
+class ReportJobs(object):
+    """
+    Runs the report generation jobs in the background, so that the request that submits a job returns at once.
+
+    At most `workers` jobs run at the same time, the others wait for a free slot in the queued status.
+    Every run is cancelled after `timeout` seconds. The state of the finished jobs is kept for `retention`
+    seconds, for the client to poll it and download the result.
+    """
+    def __init__(self, workers: int = REPORT_JOB_WORKERS, timeout: float = REPORT_JOB_TIMEOUT,
+                 retention: float = REPORT_JOB_RETENTION):
+        self.workers = workers
+        self.timeout = timeout
+        self.retention = retention
+        self.jobs = {}  # job ID -> ReportJob
+        self._slots = None
+        self._running = set()
+
+    def submit(self, owner: str, func):
+        """
+        Submits a job. Must be called on the event loop.
+
+        Args:
+            owner (str): The ID of the user who submitted the job.
+            func (callable): The coroutine function that runs the job; it receives the job, to report its
+                progress, and returns the result of the job.
+
+        Returns:
+            ReportJob: The submitted job.
+        """
+        if self._slots is None:
+            # created here, on the loop of the app
+            self._slots = asyncio.Semaphore(self.workers)
+        self._evict()
+        job = ReportJob(owner)
+        self.jobs[job.id] = job
+        worker = asyncio.create_task(self._execute(job, func))
+        self._running.add(worker)
+        worker.add_done_callback(self._running.discard)
+        return job
+
+    def get(self, job_id: str, owner: Optional[str] = None):
+        """
+        Returns a job, or None if it does not exist.
+
+        Args:
+            job_id (str): The ID of the job.
+            owner (str): If given, the job is returned only if it was submitted by this user.
+        """
+        job = self.jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def pending(self):
+        """
+        Returns the number of jobs queued or running.
+        """
+        return sum(1 for job in self.jobs.values() if job.status in (QUEUED, RUNNING))
+
+    def _evict(self):
+        expiry = time.time() - self.retention
+        for job_id in [job.id for job in self.jobs.values() if job.finished_at is not None and job.finished_at < expiry]:
+            del self.jobs[job_id]
+
+    async def _execute(self, job: ReportJob, func):
+        async with self._slots:
+            job.status = RUNNING
+            try:
+                job.result = await asyncio.wait_for(func(job), timeout=self.timeout)
+                job.status = COMPLETED
+                logging.info("Report job %s completed", job.id)
+            except asyncio.TimeoutError:
+                job.status = FAILED
+                job.error = "Timed out after " + str(self.timeout) + " seconds"
+                logging.error("Report job %s timed out", job.id)
+            except Exception as e:
+                job.status = FAILED
+                job.error = getattr(e, "detail", None) or str(e)
+                logging.error("Report job %s failed: %s", job.id, str(e))
+            finally:
+                job.finished_at = time.time()
+
+    async def stop(self):
+        """
+        Cancels the jobs still queued or running.
+        """
+        for worker in list(self._running):
+            worker.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
@@ -0,0 +1,160 @@
+import asyncio
+import heapq
+import inspect
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import REPORT_SCHEDULER_WORKERS, REPORT_JOB_TIMEOUT
+
+
+class ReportScheduler(object):
+    """
+    Runs the periodic tasks (e.g. scheduled reports) at their next run time.
+
+    The tasks are kept in a min-heap ordered by next run time: the scheduler sleeps until the earliest one
+    is due, or until a task is added or removed. Due tasks are dispatched to a bounded pool of workers,
+    so that at most `workers` of them run at the same time and none of them runs on the event loop:
+    coroutine functions are awaited in their own asyncio task (their blocking parts are expected to use a
+    threadpool), plain functions run in a thread pool. Every run is cancelled after `timeout` seconds; a plain
+    function cannot be interrupted, so its slot is only released when it returns.
+    A task runs once at a time: a run falling due while the previous one is still in progress is skipped.
+    """
+    def __init__(self, workers: int = REPORT_SCHEDULER_WORKERS, timeout: float = REPORT_JOB_TIMEOUT):
+        self.timeout = timeout
+        self.jobs = {}  # job ID -> Task
+        self._heap = []  # (next_run, version, job ID)
+        self._versions = {}  # job ID -> version of its valid heap entry
+        self._version = 0
+        self._wakeup = None
+        self._workers = workers
+        self._slots = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-worker")
+        self._running = set()
+        self._in_flight = set()  # IDs of the tasks with a run in progress
+        self.skipped = 0
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def add(self, job_id: str, task):
+        """
+        Adds a task, or replaces the one with the same ID.
+
+        Args:
+            job_id (str): The ID of the task.
+            task (Task): The task, with its next run time.
+        """
+        self._version += 1
+        self.jobs[job_id] = task
+        self._versions[job_id] = self._version
+        heapq.heappush(self._heap, (task.next_run, self._version, job_id))
+        self._wake()
+
+    def remove(self, job_id: str):
+        """
+        Removes a task. A run already in progress is not interrupted.
+        """
+        self.jobs.pop(job_id, None)
+        self._versions.pop(job_id, None)
+        self._wake()
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def next_run(self):
+        """
+        Returns the time of the earliest run, or None if there are no tasks.
+        """
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def _drop_stale(self):
+        # entries of removed or replaced tasks are discarded lazily
+        while self._heap and self._versions.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+    def pop_due(self, now: float):
+        """
+        Removes the due tasks from the heap and reschedules them at their following run time.
+
+        Args:
+            now (float): The current timestamp.
+
+        Returns:
+            list: The (job ID, task) pairs to run.
+        """
+        due = []
+        self._drop_stale()
+        while self._heap and self._heap[0][0] <= now:
+            _, version, job_id = heapq.heappop(self._heap)
+            task = self.jobs[job_id]
+            due.append((job_id, task))
+            task.reschedule(now)
+            heapq.heappush(self._heap, (task.next_run, version, job_id))
+            self._drop_stale()
+        return due
+
+    async def run(self):
+        """
+        Main loop, to be run as an asyncio task for the whole lifetime of the app.
+        """
+        # created here, on the loop of the app
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self._workers)
+        while True:
+            self._wakeup.clear()
+            next_run = self.next_run()
+            delay = None if next_run is None else max(0.0, next_run - time.time())
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    continue  # the heap changed
+                except asyncio.TimeoutError:
+                    pass
+            for job_id, task in self.pop_due(time.time()):
+                if job_id in self._in_flight:
+                    self.skipped += 1
+                    logging.warning("Skipped run of task %s, the previous run is still in progress", job_id)
+                    continue
+                logging.info("Run task %s", job_id)
+                self._in_flight.add(job_id)
+                worker = asyncio.create_task(self._execute(job_id, task))
+                self._running.add(worker)
+                worker.add_done_callback(self._running.discard)
+
+    async def _execute(self, job_id: str, task):
+        try:
+            async with self._slots:
+                try:
+                    if inspect.iscoroutinefunction(task.function):
+                        await asyncio.wait_for(task.run(), timeout=self.timeout)
+                    else:
+                        await self._run_in_thread(task)
+                    logging.info("Task %s completed", job_id)
+                except asyncio.TimeoutError:
+                    logging.error("Task %s timed out after %s seconds", job_id, self.timeout)
+                except Exception as e:
+                    logging.error("Task %s failed: %s", job_id, str(e))
+        finally:
+            self._in_flight.discard(job_id)
+
+    async def _run_in_thread(self, task):
+        future = asyncio.get_running_loop().run_in_executor(self._executor, task.run_sync)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            # the thread cannot be stopped: the slot and the task stay taken until it ends, so that the
+            # following runs do not pile up in the executor
+            await asyncio.gather(future, return_exceptions=True)
+            raise
+
+    async def stop(self):
+        """
+        Cancels the runs in progress and shuts the worker threads down.
+        """
+        for worker in list(self._running):
+            worker.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        self._executor.shutdown(wait=False)
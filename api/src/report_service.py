@@ -0,0 +1,84 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+from database.connection import db_connection
+
+def report_fingerprint(period, kpis, machines, watermark):
+    """
+    Computes the fingerprint of the content of a report.
+
+    Two reports with the same fingerprint are generated from the same prompt over the same data, so the
+    PDF of the first one can be reused for the second one. The KPIs and machines are normalized, since
+    their order and duplicates do not change the report.
+
+    Args:
+        period (str): The period covered by the report.
+        kpis (list): The KPIs included in the report.
+        machines (list): The machines the KPIs concern.
+        watermark (str): The timestamp of the latest data, so that new data invalidates the fingerprint.
+
+    Returns:
+        str: The hexadecimal SHA-256 of the normalized parameters.
+    """
+    content = {
+        "period": period.strip(),
+        "kpis": sorted(set(kpis)),
+        "machines": sorted(set(machines)),
+        "watermark": watermark,
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+def find_report_by_fingerprint(fingerprint):
+    """
+    Finds the stored PDF of a report with the given fingerprint, generated for any user.
+
+    Args:
+        fingerprint (str): The fingerprint of the report.
+
+    Returns:
+        str: The path of the PDF in the object storage, or None if no report has the fingerprint.
+    """
+    query = "SELECT FilePath FROM Reports WHERE Fingerprint = %s ORDER BY GeneratedAt DESC LIMIT 1"
+    try:
+        with db_connection() as (connection, cursor):
+            cursor.execute(query, (fingerprint,))
+            row = cursor.fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        logging.error("Error retrieving report by fingerprint: " + str(e))
+        raise e
+
+def save_report(userId, name, type, file_path, fingerprint=None):
+    """
+    Inserts a report of a user in the database.
+
+    Several reports, of the same or of different users, may link to the same PDF.
+
+    Args:
+        userId (int): The ID of the owner of the report.
+        name (str): The file name of the report.
+        type (str): The type of the report.
+        file_path (str): The path of the PDF in the object storage.
+        fingerprint (str): The fingerprint of the report content, None if it is not reusable.
+
+    Returns:
+        int: The ID of the report.
+    """
+    query = ("INSERT INTO Reports (Name, Type, OwnerId, GeneratedAt, FilePath, SiteName, Fingerprint) "
+             "VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING ReportID")
+    try:
+        with db_connection() as (connection, cursor):
+            cursor.execute(query, (name, type or "Standard", int(userId), datetime.now(), file_path, "Test",
+                                   fingerprint))
+            connection.commit()
+            return cursor.fetchone()[0]
+    except Exception as e:
+        logging.error("Error saving report to database: " + str(e))
+        raise e
+
+def object_name(file_path):
+    """
+    Returns the name of the PDF object in the reports bucket, from the path stored in Reports.
+    """
+    return file_path[len("/reports/"):] if file_path.startswith("/reports/") else file_path.lstrip("/")
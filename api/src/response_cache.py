@@ -0,0 +1,135 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import orjson
+from fastapi.responses import Response
+
+
+def normalize_key(params) -> str:
+    """
+    Builds a cache key from the query parameters, independent of the order of the dict keys.
+
+    Args:
+        params: A JSON serializable object describing the query.
+
+    Returns:
+        str: The normalized key.
+    """
+    return json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def _opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    """
+    Checks an If-None-Match header value against an ETag, with the weak comparison of If-None-Match:
+    W/"x" and "x" match, so the tag is recognized whatever form the client or a proxy sends back.
+
+    Args:
+        if_none_match (str): The header value, possibly a comma separated list or "*".
+        etag (str): The current ETag of the resource.
+
+    Returns:
+        bool: True if the client copy is up to date.
+    """
+    if not if_none_match:
+        return False
+    candidates = [_opaque_tag(tag.strip()) for tag in if_none_match.split(",")]
+    return "*" in candidates or _opaque_tag(etag) in candidates
+
+
+class CacheEntry(object):
+    """
+    A cached JSON response body with its ETag.
+
+    The ETag is weak: the body may be sent compressed, depending on the Accept-Encoding of the request,
+    and the plain and compressed bodies are not byte for byte the same representation.
+
+    Attributes:
+        body (bytes): The serialized JSON body.
+        etag (str): The weak ETag of the body.
+        ttl (int): The time to live of the entry, in seconds.
+        expires_at (float): The timestamp after which the entry is stale.
+    """
+    def __init__(self, content, ttl: int):
+        self.body = orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        self.etag = 'W/"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.ttl = ttl
+        self.expires_at = time.monotonic() + ttl
+
+    def is_expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def to_response(self, if_none_match=None):
+        """
+        Builds the HTTP response for the entry, a 304 Not Modified if the client already has it.
+        """
+        headers = {"ETag": self.etag, "Cache-Control": f"private, max-age={self.ttl}", "Vary": "Accept-Encoding"}
+        if etag_matches(if_none_match, self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, status_code=200, media_type="application/json", headers=headers)
+
+
+class ResponseCache(object):
+    """
+    In-process LRU cache of JSON responses, bounded by number of entries and total body size.
+
+    Entries are grouped by namespace (one per endpoint), so that a whole endpoint can be
+    invalidated at once. The cache is thread safe, since sync endpoints run in a threadpool.
+    """
+    def __init__(self, max_entries: int = 512, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str):
+        """
+        Returns the entry for the given namespace and key, or None if missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            if entry.is_expired():
+                self._remove((namespace, key))
+                return None
+            self._entries.move_to_end((namespace, key))
+            return entry
+
+    def set(self, namespace: str, key: str, content, ttl: int):
+        """
+        Stores the content for the given namespace and key.
+
+        Returns:
+            CacheEntry: The new entry. It is returned even if it is too big to be kept in the cache.
+        """
+        entry = CacheEntry(content, ttl)
+        if ttl <= 0 or len(entry.body) > self.max_bytes:
+            return entry
+        with self._lock:
+            self._remove((namespace, key))
+            self._entries[(namespace, key)] = entry
+            self._size += len(entry.body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, namespace: str = None):
+        """
+        Drops all the entries of a namespace, or the whole cache if no namespace is given.
+        """
+        with self._lock:
+            for cache_key in [k for k in self._entries if namespace is None or k[0] == namespace]:
+                self._remove(cache_key)
+
+    def _remove(self, cache_key):
+        entry = self._entries.pop(cache_key, None)
+        if entry is not None:
+            self._size -= len(entry.body)
@@ -0,0 +1,149 @@
+import json
+import logging
+from database.connection import db_connection
+from model.report import ScheduledReport
+
+# Bucket and suffix of the schedules saved in MinIO before they were stored in ReportSchedules
+LEGACY_SCHEDULES_BUCKET = "settings"
+LEGACY_SCHEDULES_SUFFIX = "_scheduling.json"
+
+def save_schedule(userId, schedule):
+    """
+    Persist a report schedule to the database.
+
+    A schedule without an ID, or with the ID of a schedule of another user, is inserted and gets its ID from
+    the sequence of the table. An existing schedule is updated, keeping its name.
+
+    Args:
+        userId (int): The ID of the user who owns the schedule.
+        schedule (ScheduledReport): The schedule to save. Its id and name are updated in place.
+
+    Returns:
+        ScheduledReport: The saved schedule.
+
+    Raises:
+        Exception: If there is an error while saving the schedule to the database.
+    """
+    logging.info("Saving report schedule to database")
+    try:
+        with db_connection() as (connection, cursor):
+            row = None
+            if schedule.id is not None:
+                cursor.execute("SELECT Name FROM ReportSchedules WHERE ScheduleID = %s AND UserID = %s",
+                               (schedule.id, userId))
+                row = cursor.fetchone()
+            if row:
+                schedule.name = row[0]
+                cursor.execute("UPDATE ReportSchedules SET Settings = %s WHERE ScheduleID = %s",
+                               (schedule.model_dump_json(exclude={"id"}), schedule.id))
+            else:
+                cursor.execute("INSERT INTO ReportSchedules (UserID, Name, Settings) VALUES (%s, %s, %s) "
+                               "RETURNING ScheduleID",
+                               (userId, schedule.name, schedule.model_dump_json(exclude={"id"})))
+                schedule.id = cursor.fetchone()[0]
+            connection.commit()
+        logging.info("Report schedule %s saved successfully", schedule.id)
+        return schedule
+    except Exception as e:
+        logging.error("Error saving report schedule to database: " + str(e))
+        raise e
+
+def retrieve_schedules(userId):
+    """
+    Retrieve the report schedules of a user from the database.
+
+    Args:
+        userId (int): The ID of the user.
+
+    Returns:
+        list: The schedules of the user, as dictionaries.
+    """
+    query = "SELECT ScheduleID, Settings FROM ReportSchedules WHERE UserID = %s ORDER BY ScheduleID"
+    try:
+        with db_connection() as (connection, cursor):
+            cursor.execute(query, (userId,))
+            rows = cursor.fetchall()
+        return [dict(json.loads(settings), id=schedule_id) for schedule_id, settings in rows]
+    except Exception as e:
+        logging.error("Error retrieving report schedules from database: " + str(e))
+        raise e
+
+def load_schedules():
+    """
+    Retrieve all the report schedules, to rebuild the scheduler at startup.
+
+    Returns:
+        list: Tuples of (user ID, email of the user, schedule as dictionary).
+    """
+    query = """
+    SELECT s.ScheduleID, s.UserID, u.Email, s.Settings
+    FROM ReportSchedules s JOIN Users u ON u.UserID = s.UserID
+    ORDER BY s.ScheduleID
+    """
+    try:
+        with db_connection() as (connection, cursor):
+            cursor.execute(query)
+            rows = cursor.fetchall()
+        return [(user_id, email, dict(json.loads(settings), id=schedule_id))
+                for schedule_id, user_id, email, settings in rows]
+    except Exception as e:
+        logging.error("Error loading report schedules from database: " + str(e))
+        raise e
+
+def import_legacy_schedules(minio):
+    """
+    Import the report schedules saved in the MinIO settings bucket, as <user ID>/<name>_scheduling.json,
+    before the schedules were stored in the database.
+
+    The import is idempotent: a schedule is skipped if its user already has a schedule with the same name,
+    which was the key of the schedules in the bucket, or if its user no longer exists. The blobs are left
+    in the bucket. The schedules get new IDs from the sequence of the table.
+
+    Args:
+        minio (Minio): The client of the object storage.
+
+    Returns:
+        int: The number of schedules imported.
+    """
+    if not minio.bucket_exists(LEGACY_SCHEDULES_BUCKET):
+        return 0
+    schedules = []
+    for obj in minio.list_objects(LEGACY_SCHEDULES_BUCKET, recursive=True):
+        user_id, _, file_name = obj.object_name.partition("/")
+        if not file_name.endswith(LEGACY_SCHEDULES_SUFFIX) or not user_id.isdigit():
+            continue
+        response = minio.get_object(LEGACY_SCHEDULES_BUCKET, obj.object_name)
+        try:
+            schedule = ScheduledReport.model_validate(json.loads(response.read().decode("utf-8")))
+        except Exception as e:
+            logging.error("Skipped report schedule %s: %s", obj.object_name, str(e))
+            continue
+        finally:
+            response.close()
+            response.release_conn()
+        schedules.append((int(user_id), schedule))
+    if not schedules:
+        return 0
+
+    query = """
+    INSERT INTO ReportSchedules (UserID, Name, Settings)
+    SELECT %s, %s, %s
+    WHERE EXISTS (SELECT 1 FROM Users WHERE UserID = %s)
+    AND NOT EXISTS (SELECT 1 FROM ReportSchedules WHERE UserID = %s AND Name = %s)
+    """
+    imported = 0
+    try:
+        with db_connection() as (connection, cursor):
+            # serializes the imports of the instances starting at the same time
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext('import_legacy_schedules'))")
+            for user_id, schedule in schedules:
+                cursor.execute(query, (user_id, schedule.name, schedule.model_dump_json(exclude={"id"}),
+                                       user_id, user_id, schedule.name))
+                imported += cursor.rowcount
+            connection.commit()
+    except Exception as e:
+        logging.error("Error importing report schedules to database: " + str(e))
+        raise e
+    if imported:
+        logging.info("Imported %d report schedules from the object storage", imported)
+    return imported
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical concurrent calls, so that only one of them is actually performed.
+
+    The first caller for a key starts the call, the callers arriving while it is in flight await the same
+    result (or exception). The call runs in its own task, so that a caller disconnecting does not cancel it
+    for the others. Nothing is kept once the call completes, this is not a cache.
+    """
+    def __init__(self):
+        self._in_flight = {}
+
+    async def do(self, key: str, call):
+        """
+        Performs the call, or joins the identical call already in flight.
+
+        Args:
+            key (str): The normalized description of the call, e.g. service, path and payload.
+            call: A function returning the coroutine to run.
+
+        Returns:
+            The result of the call.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+        else:
+            logging.info("Joining in-flight request %s", key[:200])
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            # retrieved here too, in case every caller went away before the call failed
+            logging.warning("In-flight request %s failed: %s", key[:200], task.exception())
+
+    def in_flight(self):
+        """
+        Returns the number of calls currently in flight.
+        """
+        return len(self._in_flight)
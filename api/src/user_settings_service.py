@@ -1,75 +1,180 @@
 import json
 import logging
-from database.connection import get_db_connection
+import threading
+from collections import OrderedDict
+from psycopg2.extras import Json
+from constants import USER_SETTINGS_CACHE_SIZE
+from database.connection import db_connection
+
+class SettingsCache(object):
+    """
+    Write-through LRU cache of the settings and dashboards of the users, keyed by column and user ID.
+
+    Reads are served from the cache after the first one; every write goes to the database first and then
+    replaces the cached copy, so the cache never holds settings that were not saved. The cached
+    dictionaries are shared, callers must not modify them.
+    """
+    def __init__(self, max_entries: int = USER_SETTINGS_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, column, userId):
+        with self._lock:
+            key = (column, str(userId))
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, column, userId, settings):
+        with self._lock:
+            key = (column, str(userId))
+            self._entries[key] = settings
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def add(self, column, userId, settings):
+        """
+        Caches settings read from the database, unless a write cached newer ones in the meantime.
+
+        Returns:
+            dict: The cached settings.
+        """
+        with self._lock:
+            key = (column, str(userId))
+            if key not in self._entries:
+                self._entries[key] = settings
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def invalidate(self, userId=None):
+        """
+        Removes the cached settings of a user, or of all the users.
+        """
+        with self._lock:
+            if userId is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[1] == str(userId)]:
+                del self._entries[key]
+
+settings_cache = SettingsCache()
+
+def _decode(value):
+    # JSONB values are decoded by the driver, TEXT values of a database not yet migrated are not
+    if value is None:
+        return {}
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+def _save(column, userId, settings):
+    # the UPDATE both checks that the user exists and saves the settings
+    query = "UPDATE Users SET " + column + " = %s WHERE UserID = %s RETURNING UserID"
+    with db_connection() as (connection, cursor):
+        cursor.execute(query, (Json(settings), userId))
+        updated = cursor.fetchone()
+        connection.commit()
+    if not updated:
+        logging.error("User is not present in the database")
+        return False
+    settings_cache.set(column, userId, settings)
+    return True
+
+def _load(column, userId):
+    settings = settings_cache.get(column, userId)
+    if settings is not None:
+        return settings
+    query = "SELECT " + column + " FROM Users WHERE UserID = %s"
+    with db_connection() as (connection, cursor):
+        cursor.execute(query, (userId,))
+        row = cursor.fetchone()
+    # unknown users are not cached
+    if not row:
+        return {}
+    return settings_cache.add(column, userId, _decode(row[0]))
 
 def persist_user_settings(userId, settings):
     """
     Persist user settings to the database.
 
-    This function retrieves the past settings for a given user. If past settings exist,
-    it updates the settings in the database. If no past settings exist, it inserts new settings
-    into the database.
+    The settings of the user are replaced, in the same statement that checks that the user exists,
+    and the cached copy is updated.
 
     Args:
         userId (int): The ID of the user whose settings are to be persisted.
         settings (dict): A dictionary containing the user settings to be saved.
 
+    Returns:
+        bool: True if the settings are saved, False if the user is not present in the database.
+
     Raises:
         Exception: If there is an error while saving the user settings to the database.
     """
-    logging.info("Checking if user is present in the database")
-    if verify_user_presence(userId) == False:
-        logging.error("User is not present in the database")
-        return False
-    logging.info("User is present in the database")
-    
-    query = "UPDATE Users SET UserSettings = %s WHERE UserID = %s"
-    values = (json.dumps(settings), userId)
-
     logging.info("Saving user settings to database")
     try:
-        connection, cursor = get_db_connection()
-        cursor.execute(query, values)
-        connection.commit()
+        if not _save("UserSettings", userId, settings):
+            return False
         logging.info("User settings saved successfully")
-
         return True
     except Exception as e:
         logging.error("Error saving user settings to database: " + str(e))
         raise e
-    finally:
-        cursor.close()
-        connection.close()
-    
+
+def update_user_settings(userId, changes):
+    """
+    Update some of the user settings in the database.
+
+    The given keys are merged into the stored JSONB settings by the database, the other keys are kept.
+
+    Args:
+        userId (int): The ID of the user whose settings are to be updated.
+        changes (dict): The settings to add or replace.
+
+    Returns:
+        dict: The updated settings, or None if the user is not present in the database.
+
+    Raises:
+        Exception: If there is an error while saving the user settings to the database.
+    """
+    query = ("UPDATE Users SET UserSettings = COALESCE(UserSettings, '{}'::jsonb) || %s "
+             "WHERE UserID = %s RETURNING UserSettings")
+    logging.info("Updating user settings in database")
+    try:
+        with db_connection() as (connection, cursor):
+            cursor.execute(query, (Json(changes), userId))
+            row = cursor.fetchone()
+            connection.commit()
+        if not row:
+            logging.error("User is not present in the database")
+            return None
+        settings = _decode(row[0])
+        settings_cache.set("UserSettings", userId, settings)
+        return settings
+    except Exception as e:
+        logging.error("Error updating user settings in database: " + str(e))
+        raise e
+
 def retrieve_user_settings(userId):
     """
-    Retrieve user settings from the database.
+    Retrieve user settings, from the cache or from the database.
 
     Args:
         userId (str): The ID of the user for whom to retrieve settings.
     Returns:
         dict: A dictionary containing the user settings.
     """
-    query = "SELECT UserSettings FROM Users WHERE UserID = %s"
-    values = (userId,)
-
-    logging.info("Retrieving user settings from database")
+    logging.info("Retrieving user settings")
     try:
-        connection, cursor = get_db_connection()
-        cursor.execute(query, values)
-        settings = cursor.fetchone()
-
-        if settings and settings[0] is not None:
-            return json.loads(settings[0])
-        else:
-            return {}
+        return _load("UserSettings", userId)
     except Exception as e:
         logging.error("Error retrieving user settings from database: " + str(e))
         raise e
-    finally:
-        cursor.close()
-        connection.close()
-    
+
 def verify_user_presence(userId):
     """
     Verifies if a user is present in the database.
@@ -87,84 +192,54 @@ def verify_user_presence(userId):
     values = (userId,)
 
     try:
-        connection, cursor = get_db_connection()
-        cursor.execute(query, values)
-        result = cursor.fetchone()[0]
-        connection.commit()
+        with db_connection() as (connection, cursor):
+            cursor.execute(query, values)
+            result = cursor.fetchone()[0]
     except Exception as e:
         logging.error("Error while checking the presence of the user: " + str(e))
         raise e
-    finally:
-        cursor.close()
-        connection.close()
 
     return result > 0
 
 def load_dashboard_settings(userId):
     """
-    Retrieve user dashboard settings from the database.
+    Retrieve user dashboard settings, from the cache or from the database.
 
     Args:
         userId (str): The ID of the user for whom to retrieve settings.
     Returns:
         dict: A dictionary containing the user dashboard settings.
     """
-    query = "SELECT UserDashboards FROM Users WHERE UserID = %s"
-    values = (userId,)
-
-    logging.info("Retrieving user dashboard settings from database")
+    logging.info("Retrieving user dashboard settings")
     try:
-        connection, cursor = get_db_connection()
-        cursor.execute(query, values)
-        settings = cursor.fetchone()
-
-        if settings and settings[0] is not None:
-            return json.loads(settings[0])
-        else:
-            return {}
+        return _load("UserDashboards", userId)
     except Exception as e:
         logging.error("Error retrieving user dashboard settings from database: " + str(e))
         raise e
-    finally:
-        cursor.close()
-        connection.close()
 
 def persist_dashboard_settings(userId, settings):
     """
     Persist user dashboard settings to the database.
 
-    This function retrieves the past dashboard settings for a given user. If past settings exist,
-    it updates the settings in the database. If no past settings exist, it inserts new settings
-    into the database.
+    The dashboard settings of the user are replaced, in the same statement that checks that the user
+    exists, and the cached copy is updated.
 
     Args:
         userId (int): The ID of the user whose dashboard settings are to be persisted.
         settings (dict): A dictionary containing the user dashboard settings to be saved.
 
+    Returns:
+        bool: True if the settings are saved, False if the user is not present in the database.
+
     Raises:
         Exception: If there is an error while saving the user dashboard settings to the database.
     """
-    logging.info("Checking if user is present in the database")
-    if verify_user_presence(userId) == False:
-        logging.error("User is not present in the database")
-        return False
-
-    logging.info("User is present in the database")    
-    query = "UPDATE Users SET UserDashboards = %s WHERE UserID = %s"
-    values = (json.dumps(settings), userId)
     logging.info("Saving user dashboard settings to database")
-    
     try:
-        connection, cursor = get_db_connection()
-        cursor.execute(query, values)
-        connection.commit()
+        if not _save("UserDashboards", userId, settings):
+            return False
         logging.info("User dashboard settings saved successfully")
         return True
-    
     except Exception as e:
         logging.error("Error saving user dashboard settings to database: " + str(e))
         raise e
-    
-    finally:
-        cursor.close()
-        connection.close()
\ No newline at end of file
@@ -0,0 +1,175 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import admission
+from admission import INTERACTIVE, SCHEDULED, AdmissionController
+from app import app
+
+API_KEY = "gui-key"
+
+class TestAdmissionController(unittest.TestCase):
+
+    def test_limits_concurrent_runs(self):
+        running = []
+        peak = []
+
+        async def run(controller):
+            async with controller.admit():
+                running.append(1)
+                peak.append(len(running))
+                await asyncio.sleep(0.01)
+                running.pop()
+
+        async def scenario():
+            controller = AdmissionController("test", limit=2, queue_size=10, queue_timeout=1)
+            await asyncio.gather(*(run(controller) for _ in range(6)))
+            return controller.getDict()
+
+        stats = asyncio.run(scenario())
+
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(stats["admitted"], 6)
+        self.assertEqual(stats["active"], 0)
+        self.assertEqual(stats["queued"], 0)
+
+    def test_rejects_when_queue_is_full(self):
+        async def scenario():
+            controller = AdmissionController("test", limit=1, queue_size=1, queue_timeout=1)
+            release = asyncio.Event()
+
+            async def hold():
+                async with controller.admit():
+                    await release.wait()
+
+            holder = asyncio.ensure_future(hold())
+            waiter = asyncio.ensure_future(hold())
+            await asyncio.sleep(0)
+            with self.assertRaises(HTTPException) as context:
+                async with controller.admit():
+                    pass
+            release.set()
+            await asyncio.gather(holder, waiter)
+            return context.exception, controller.getDict()
+
+        exception, stats = asyncio.run(scenario())
+
+        self.assertEqual(exception.status_code, 429)
+        self.assertIn("Retry-After", exception.headers)
+        self.assertEqual(stats["rejected"], 1)
+        self.assertEqual(stats["admitted"], 2)
+        self.assertEqual(stats["active"], 0)
+
+    def test_times_out_in_the_queue(self):
+        async def scenario():
+            controller = AdmissionController("test", limit=1, queue_size=5, queue_timeout=0.01)
+            async with controller.admit():
+                with self.assertRaises(HTTPException) as context:
+                    async with controller.admit():
+                        pass
+                queued = controller.queued()
+            return context.exception, queued, controller.getDict()
+
+        exception, queued, stats = asyncio.run(scenario())
+
+        self.assertEqual(exception.status_code, 503)
+        self.assertEqual(queued, 0)
+        self.assertEqual(stats["timedOut"], 1)
+        self.assertEqual(stats["active"], 0)
+
+    def test_interactive_before_scheduled(self):
+        order = []
+
+        async def run(controller, name, priority):
+            async with controller.admit(priority):
+                order.append(name)
+
+        async def scenario():
+            controller = AdmissionController("test", limit=1, queue_size=5, queue_timeout=1)
+            async with controller.admit():
+                tasks = [asyncio.ensure_future(run(controller, "scheduled", SCHEDULED)),
+                         asyncio.ensure_future(run(controller, "interactive", INTERACTIVE))]
+                await asyncio.sleep(0)
+                stats = controller.getDict()
+            await asyncio.gather(*tasks)
+            return stats
+
+        stats = asyncio.run(scenario())
+
+        self.assertEqual(order, ["interactive", "scheduled"])
+        self.assertEqual(stats["queued"], 1)
+        self.assertEqual(stats["queuedScheduled"], 1)
+
+    def test_scheduled_and_unbounded_work_is_not_rejected(self):
+        order = []
+
+        async def run(controller, name, priority, bounded):
+            async with controller.admit(priority, bounded):
+                order.append(name)
+
+        async def scenario():
+            controller = AdmissionController("test", limit=1, queue_size=0, queue_timeout=0.01)
+            async with controller.admit():
+                tasks = [asyncio.ensure_future(run(controller, "scheduled", SCHEDULED, True)),
+                         asyncio.ensure_future(run(controller, "job", INTERACTIVE, False))]
+                await asyncio.sleep(0.05)
+            await asyncio.gather(*tasks)
+            return controller.getDict()
+
+        stats = asyncio.run(scenario())
+
+        self.assertEqual(order, ["job", "scheduled"])
+        self.assertEqual(stats["rejected"], 0)
+        self.assertEqual(stats["timedOut"], 0)
+        self.assertEqual(stats["active"], 0)
+
+    def test_cancelled_waiter_leaves_the_queue(self):
+        async def hold(controller):
+            async with controller.admit():
+                pass
+
+        async def scenario():
+            controller = AdmissionController("test", limit=1, queue_size=5, queue_timeout=1)
+            async with controller.admit():
+                task = asyncio.ensure_future(hold(controller))
+                await asyncio.sleep(0)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                queued = controller.queued()
+            return queued, controller.getDict()
+
+        queued, stats = asyncio.run(scenario())
+
+        self.assertEqual(queued, 0)
+        self.assertEqual(stats["active"], 0)
+
+@patch('api_auth.api_auth.retrieve_keys', side_effect={"gui": API_KEY}.get)
+class TestReportAdmission(unittest.TestCase):
+
+    def test_scheduled_flag_does_not_skip_the_queue(self, _):
+        # no free slot and no place in the queue
+        full = AdmissionController("reports", limit=0, queue_size=0, queue_timeout=0.01)
+        report = {"name": "weekly", "type": "Standard", "period": "week", "status": True,
+                  "email": "user@example.com", "kpis": ["power"], "machines": ["Laser Cutter"]}
+
+        with patch.dict(admission.admission, {"reports": full}):
+            for is_scheduled in ("false", "true"):
+                response = TestClient(app).post("/smartfactory/reports/generate",
+                                                params={"is_scheduled": is_scheduled},
+                                                headers={"X-API-Key": API_KEY},
+                                                json={"userId": "1", "params": report})
+                self.assertEqual(response.status_code, 429)
+                self.assertIn("Retry-After", response.headers)
+
+        self.assertEqual(full.getDict()["rejected"], 2)
+        self.assertEqual(full.getDict()["queuedScheduled"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
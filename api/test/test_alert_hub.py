@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from alert_hub import AlertHub
+
+class TestAlertHub(unittest.TestCase):
+
+    def test_publish_to_subscribers(self):
+        async def scenario():
+            hub = AlertHub()
+            hub.bind(asyncio.get_running_loop())
+            first = hub.subscribe("1")
+            second = hub.subscribe("1")
+            other = hub.subscribe("2")
+
+            # alerts are published from the threads that save them
+            thread = threading.Thread(target=hub.publish, args=({"1": [{"alertId": 5}]},))
+            thread.start()
+            thread.join()
+
+            received = [await asyncio.wait_for(queue.get(), 1) for queue in (first, second)]
+            return received, other.qsize(), hub.connections()
+
+        received, other_size, connections = asyncio.run(scenario())
+
+        self.assertEqual(received, [{"alertId": 5}, {"alertId": 5}])
+        self.assertEqual(other_size, 0)
+        self.assertEqual(connections, 3)
+
+    def test_slow_subscriber_drops_oldest(self):
+        async def scenario():
+            hub = AlertHub(queue_size=2)
+            hub.bind(asyncio.get_running_loop())
+            queue = hub.subscribe("1")
+            hub.publish({"1": [{"alertId": 1}, {"alertId": 2}, {"alertId": 3}]})
+            await asyncio.sleep(0)
+            return [queue.get_nowait(), queue.get_nowait()], hub.dropped
+
+        received, dropped = asyncio.run(scenario())
+
+        self.assertEqual(received, [{"alertId": 2}, {"alertId": 3}])
+        self.assertEqual(dropped, 1)
+
+    def test_unsubscribe(self):
+        async def scenario():
+            hub = AlertHub()
+            queue = hub.subscribe("1")
+            hub.unsubscribe("1", queue)
+            return hub.connections()
+
+        self.assertEqual(asyncio.run(scenario()), 0)
+
+    def test_publish_without_loop(self):
+        # nothing is delivered before the app lifespan binds the hub
+        AlertHub().publish({"1": [{"alertId": 1}]})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from api_auth.api_auth import ApiKeyCache
+
+KEYS = {"gui": "gui-key", "data": "data-key"}
+
+class TestApiKeyCache(unittest.TestCase):
+
+    @patch('api_auth.api_auth.retrieve_keys')
+    def test_keys_are_cached(self, mock_retrieve_keys):
+        mock_retrieve_keys.side_effect = KEYS.get
+        cache = ApiKeyCache(ttl=300, refresh_interval=5)
+
+        self.assertTrue(cache.verify("gui-key", ["gui", "data"]))
+        self.assertTrue(cache.verify("data-key", ["gui", "data"]))
+        self.assertEqual(mock_retrieve_keys.call_count, 2)
+
+    @patch('api_auth.api_auth.time.monotonic')
+    @patch('api_auth.api_auth.retrieve_keys')
+    def test_refresh_on_miss_is_rate_limited(self, mock_retrieve_keys, mock_monotonic):
+        mock_retrieve_keys.side_effect = KEYS.get
+        mock_monotonic.return_value = 100.0
+        cache = ApiKeyCache(ttl=300, refresh_interval=5)
+
+        self.assertFalse(cache.verify("wrong-key", ["gui"]))
+        self.assertFalse(cache.verify("wrong-key", ["gui"]))
+        self.assertEqual(mock_retrieve_keys.call_count, 1)
+
+        mock_monotonic.return_value = 106.0
+        mock_retrieve_keys.side_effect = {"gui": "rotated-key"}.get
+        self.assertTrue(cache.verify("rotated-key", ["gui"]))
+        self.assertEqual(mock_retrieve_keys.call_count, 2)
+
+    @patch('api_auth.api_auth.time.monotonic')
+    @patch('api_auth.api_auth.retrieve_keys')
+    def test_expired_keys_are_reloaded(self, mock_retrieve_keys, mock_monotonic):
+        mock_retrieve_keys.side_effect = KEYS.get
+        mock_monotonic.return_value = 100.0
+        cache = ApiKeyCache(ttl=300, refresh_interval=5)
+        cache.verify("gui-key", ["gui"])
+
+        mock_monotonic.return_value = 401.0
+        cache.verify("gui-key", ["gui"])
+        self.assertEqual(mock_retrieve_keys.call_count, 2)
+
+    @patch('api_auth.api_auth.retrieve_keys')
+    def test_invalidate(self, mock_retrieve_keys):
+        mock_retrieve_keys.side_effect = KEYS.get
+        cache = ApiKeyCache(ttl=300, refresh_interval=5)
+        cache.verify("gui-key", ["gui"])
+
+        cache.invalidate("gui")
+        cache.verify("gui-key", ["gui"])
+        self.assertEqual(mock_retrieve_keys.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
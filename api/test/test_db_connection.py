@@ -5,7 +5,9 @@ import sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/database')))
 
-from connection import get_db_connection, query_db, query_db_with_params, close_connection
+import connection
+from connection import get_db_connection, query_db, query_db_with_params, close_connection, ConnectionPool, \
+    PoolTimeout, db_connection
 
 class TestDatabaseUtils(unittest.TestCase):
 
@@ -109,6 +111,57 @@ class TestDatabaseUtils(unittest.TestCase):
         mock_cursor.close.assert_called_once()
         mock_connection.close.assert_called_once()
 
+class TestConnectionPool(unittest.TestCase):
+
+    @patch('connection.pool.ThreadedConnectionPool')
+    def test_getconn_putconn(self, mock_pool_class):
+        mock_connection = MagicMock(closed=0)
+        mock_pool_class.return_value.getconn.return_value = mock_connection
+
+        connection_pool = ConnectionPool(1, 2, 0.1, 30)
+        self.assertIs(connection_pool.getconn(), mock_connection)
+        connection_pool.putconn(mock_connection)
+
+        mock_pool_class.return_value.putconn.assert_called_once_with(mock_connection)
+
+    @patch('connection.pool.ThreadedConnectionPool')
+    def test_pool_size_limit(self, mock_pool_class):
+        mock_pool_class.return_value.getconn.side_effect = lambda: MagicMock(closed=0)
+
+        connection_pool = ConnectionPool(1, 2, 0.1, 30)
+        connection_pool.getconn()
+        connection_pool.getconn()
+
+        with self.assertRaises(PoolTimeout):
+            connection_pool.getconn()
+
+    @patch('connection.pool.ThreadedConnectionPool')
+    def test_broken_connection_is_replaced(self, mock_pool_class):
+        broken_connection = MagicMock(closed=1)
+        healthy_connection = MagicMock(closed=0)
+        mock_pool_class.return_value.getconn.side_effect = [broken_connection, healthy_connection]
+
+        connection_pool = ConnectionPool(1, 2, 0.1, 30)
+
+        self.assertIs(connection_pool.getconn(), healthy_connection)
+        mock_pool_class.return_value.putconn.assert_called_once_with(broken_connection, close=True)
+
+    @patch('connection.get_pool')
+    def test_db_connection_returns_connection_on_error(self, mock_get_pool):
+        mock_connection = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connection.cursor.return_value = mock_cursor
+        mock_get_pool.return_value.getconn.return_value = mock_connection
+
+        with self.assertRaises(ValueError):
+            with db_connection() as (conn, cursor):
+                self.assertIs(conn, mock_connection)
+                self.assertIs(cursor, mock_cursor)
+                raise ValueError("Query failed")
+
+        mock_cursor.close.assert_called_once()
+        mock_get_pool.return_value.putconn.assert_called_once_with(mock_connection)
+
 # Run the tests
 if __name__ == '__main__':
     unittest.main()
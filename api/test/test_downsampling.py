@@ -0,0 +1,70 @@
+import unittest
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from downsampling import lttb_indices, minmax_indices, downsample_series
+
+class TestLttb(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.arange(1000, dtype=float)
+        self.y = np.sin(self.x / 20.0)
+
+    def test_lttb_keeps_bounds_and_size(self):
+        indices = lttb_indices(self.x, self.y, 100)
+
+        self.assertEqual(len(indices), 100)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], 999)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+
+    def test_lttb_short_series_untouched(self):
+        indices = lttb_indices(self.x[:10], self.y[:10], 100)
+        np.testing.assert_array_equal(indices, np.arange(10))
+
+    def test_lttb_keeps_spike(self):
+        y = np.zeros(1000)
+        y[500] = 100.0
+        indices = lttb_indices(self.x, y, 20)
+        self.assertIn(500, indices)
+
+    def test_lttb_too_few_points(self):
+        with self.assertRaises(ValueError):
+            lttb_indices(self.x, self.y, 2)
+
+class TestMinMax(unittest.TestCase):
+
+    def test_minmax_keeps_extremes(self):
+        x = np.arange(1000, dtype=float)
+        y = np.random.default_rng(0).normal(size=1000)
+        indices = minmax_indices(x, y, 100)
+
+        self.assertLessEqual(len(indices), 100)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertIn(int(np.argmax(y)), indices)
+        self.assertIn(int(np.argmin(y)), indices)
+
+class TestDownsampleSeries(unittest.TestCase):
+
+    def test_downsample_series(self):
+        dates = np.arange(np.datetime64("2024-01-01"), np.datetime64("2024-12-31"))
+        series = {"name": "Machine1", "kpi": "working_time_sum",
+                  "timestamp": [str(d) for d in dates], "values": list(range(len(dates)))}
+
+        result = downsample_series(series, 50)
+
+        self.assertEqual(len(result["timestamp"]), 50)
+        self.assertEqual(len(result["values"]), 50)
+        self.assertEqual(result["timestamp"][0], "2024-01-01")
+        self.assertEqual(result["timestamp"][-1], "2024-12-30")
+
+    def test_downsample_series_invalid_method(self):
+        with self.assertRaises(ValueError):
+            downsample_series({"timestamp": ["2024-01-01"], "values": [1.0]}, 10, "random")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from database.druid_query_builder import build_native_query, build_time_boundary_query, max_time, select_machines, \
+    split_kpi_id, to_rows, to_columnar
+
+class TestSplitKpiId(unittest.TestCase):
+
+    def test_split_kpi_id_success(self):
+        self.assertEqual(split_kpi_id("working_time_sum"), ("working_time", "sum"))
+        self.assertEqual(split_kpi_id("cost_avg"), ("cost", "avg"))
+
+    def test_split_kpi_id_invalid(self):
+        for kpi_id in ["working_time", "_sum", "working_time_total", ""]:
+            with self.assertRaises(ValueError):
+                split_kpi_id(kpi_id)
+
+class TestBuildNativeQuery(unittest.TestCase):
+
+    def test_group_by_multiple_machines_and_kpis(self):
+        query = build_native_query(["working_time_sum", "idle_time_max"], "2024-03-01", "2024-04-01",
+                                   ["Machine1", "Machine2"], "P1D")
+
+        self.assertEqual(query["queryType"], "groupBy")
+        self.assertEqual(query["dimensions"], ["name"])
+        self.assertEqual(query["intervals"], ["2024-03-01/2024-04-01"])
+        self.assertEqual(query["granularity"], {"type": "period", "period": "P1D", "timeZone": "UTC"})
+        self.assertEqual(query["filter"]["fields"][0], {"type": "in", "dimension": "kpi",
+                                                        "values": ["working_time", "idle_time"]})
+        self.assertEqual(query["filter"]["fields"][1], {"type": "in", "dimension": "name",
+                                                        "values": ["Machine1", "Machine2"]})
+        self.assertEqual([agg["aggregator"]["name"] for agg in query["aggregations"]],
+                         ["working_time_sum", "idle_time_max"])
+        self.assertEqual([agg["aggregator"]["fieldName"] for agg in query["aggregations"]], ["sum", "max"])
+
+    def test_timeseries_single_machine(self):
+        query = build_native_query(["working_time_sum"], "2024-03-01", "2024-04-01", ["Machine1"])
+
+        self.assertEqual(query["queryType"], "timeseries")
+        self.assertEqual(query["granularity"], "all")
+        self.assertNotIn("dimensions", query)
+
+    def test_avg_aggregator_uses_post_aggregation(self):
+        query = build_native_query(["working_time_sum"], "2024-03-01", "2024-04-01", ["Machine1"],
+                                   aggregator="avg")
+
+        self.assertEqual(len(query["aggregations"]), 2)
+        self.assertEqual(query["postAggregations"][0]["name"], "working_time_sum")
+        self.assertEqual(query["postAggregations"][0]["type"], "expression")
+        # the average of a bucket without rows of the KPI is null, not 0 / 0
+        self.assertEqual(query["postAggregations"][0]["expression"],
+                         'if("working_time_sum__count" > 0, "working_time_sum__sum" / "working_time_sum__count", null)')
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            build_native_query(["working_time"], "2024-03-01", "2024-04-01", ["Machine1"])
+        with self.assertRaises(ValueError):
+            build_native_query(["working_time_sum"], "2024-03-01", "2024-04-01", ["Machine1"], "P1H")
+        with self.assertRaises(ValueError):
+            build_native_query(["working_time_sum"], "2024-03-01", "2024-04-01", ["Machine1"], aggregator="count")
+        with self.assertRaises(ValueError):
+            build_native_query(["working_time_sum"], "2024-03-01", "2024-04-01", [])
+
+class TestResponseShapes(unittest.TestCase):
+
+    def setUp(self):
+        self.kpi_ids = ["working_time_sum", "idle_time_sum"]
+        self.query = build_native_query(self.kpi_ids, "2024-03-01", "2024-03-03", ["Machine1", "Machine2"], "P1D")
+        self.response = [
+            {"version": "v1", "timestamp": "2024-03-01T00:00:00.000Z",
+             "event": {"name": "Machine1", "working_time_sum": 10.0, "idle_time_sum": 2.0}},
+            {"version": "v1", "timestamp": "2024-03-01T00:00:00.000Z",
+             "event": {"name": "Machine2", "working_time_sum": 8.0, "idle_time_sum": None}},
+            {"version": "v1", "timestamp": "2024-03-02T00:00:00.000Z",
+             "event": {"name": "Machine1", "working_time_sum": 12.0, "idle_time_sum": 1.0}},
+        ]
+
+    def test_to_rows(self):
+        rows = to_rows(self.query, self.response, self.kpi_ids, "P1D")
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0], {"name": "Machine1", "timestamp": "2024-03-01",
+                                   "working_time_sum": 10.0, "idle_time_sum": 2.0})
+
+    def test_to_columnar(self):
+        result = to_columnar(self.query, self.response, self.kpi_ids, "P1D")
+
+        self.assertEqual(len(result["series"]), 3)
+        self.assertEqual(result["series"][0], {"name": "Machine1", "kpi": "working_time_sum",
+                                               "timestamp": ["2024-03-01", "2024-03-02"], "values": [10.0, 12.0]})
+        self.assertEqual(result["series"][2], {"name": "Machine2", "kpi": "working_time_sum",
+                                               "timestamp": ["2024-03-01"], "values": [8.0]})
+
+    def test_timeseries_rows_carry_machine_name(self):
+        query = build_native_query(["working_time_sum"], "2024-03-01", "2024-04-01", ["Machine1"])
+        response = [{"timestamp": "2024-03-01T00:00:00.000Z", "result": {"working_time_sum": 42.0}}]
+
+        self.assertEqual(to_rows(query, response, ["working_time_sum"]),
+                         [{"name": "Machine1", "working_time_sum": 42.0}])
+        self.assertEqual(to_columnar(query, response, ["working_time_sum"]),
+                         {"series": [{"name": "Machine1", "kpi": "working_time_sum", "values": [42.0]}]})
+
+    def test_avg_of_empty_filtered_bucket(self):
+        kpi_ids = ["working_time_sum", "idle_time_sum"]
+        query = build_native_query(kpi_ids, "2024-03-01", "2024-03-03", ["Machine1", "Machine2"], "P1D",
+                                   aggregator="avg")
+        # Machine2 has rows of working_time only on 2024-03-01: the idle_time filter matches none of them,
+        # Druid returns null, or NaN for a 0 / 0 quotient
+        response = [
+            {"version": "v1", "timestamp": "2024-03-01T00:00:00.000Z",
+             "event": {"name": "Machine1", "working_time_sum": 10.0, "idle_time_sum": 2.0}},
+            {"version": "v1", "timestamp": "2024-03-01T00:00:00.000Z",
+             "event": {"name": "Machine2", "working_time_sum": 8.0, "idle_time_sum": None}},
+            {"version": "v1", "timestamp": "2024-03-02T00:00:00.000Z",
+             "event": {"name": "Machine2", "working_time_sum": float("nan"), "idle_time_sum": float("nan")}},
+        ]
+
+        rows = to_rows(query, response, kpi_ids, "P1D")
+        self.assertEqual(rows[1], {"name": "Machine2", "timestamp": "2024-03-01",
+                                   "working_time_sum": 8.0, "idle_time_sum": None})
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(to_columnar(query, response, kpi_ids, "P1D")["series"], [
+            {"name": "Machine1", "kpi": "working_time_sum", "timestamp": ["2024-03-01"], "values": [10.0]},
+            {"name": "Machine1", "kpi": "idle_time_sum", "timestamp": ["2024-03-01"], "values": [2.0]},
+            {"name": "Machine2", "kpi": "working_time_sum", "timestamp": ["2024-03-01"], "values": [8.0]},
+        ])
+
+    def test_select_machines(self):
+        self.assertEqual(select_machines(self.query, self.response, ["Machine2"]), [self.response[1]])
+        self.assertEqual(select_machines(self.query, self.response, ["Machine1", "Machine3"]),
+                         [self.response[0], self.response[2]])
+        self.assertEqual(select_machines(self.query, None, ["Machine1"]), [])
+        # a timeseries query only has one machine
+        query = build_native_query(["working_time_sum"], "2024-03-01", "2024-04-01", ["Machine1"])
+        response = [{"timestamp": "2024-03-01T00:00:00.000Z", "result": {"working_time_sum": 42.0}}]
+        self.assertIs(select_machines(query, response, ["Machine1"]), response)
+
+    def test_time_boundary(self):
+        self.assertEqual(build_time_boundary_query(),
+                         {"queryType": "timeBoundary", "dataSource": "timeseries", "bound": "maxTime"})
+        response = [{"timestamp": "2024-10-19T00:00:00.000Z", "result": {"maxTime": "2024-10-19T00:00:00.000Z"}}]
+
+        self.assertEqual(max_time(response), "2024-10-19T00:00:00.000Z")
+        self.assertIsNone(max_time([]))
+
+if __name__ == '__main__':
+    unittest.main()
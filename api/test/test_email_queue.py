@@ -0,0 +1,135 @@
+import re
+import smtplib
+import socketserver
+import threading
+import unittest
+from email.message import EmailMessage
+from unittest.mock import patch
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from email_queue import EmailQueue
+
+
+class RecordingSMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Serves a connection with the subset of SMTP used by smtplib, without authentication.
+    """
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        mailfrom, rcpttos = None, []
+        self.reply("220 localhost SMTP")
+        for line in self.rfile:
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                mailfrom, rcpttos = re.search(r"<(.*?)>", command).group(1), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                rcpttos.append(re.search(r"<(.*?)>", command).group(1))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                for data in self.rfile:
+                    if data in (b".\r\n", b".\n"):
+                        break
+                self.server.messages.append((mailfrom, rcpttos))
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class RecordingSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Local SMTP server that records the received messages and the number of connections.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RecordingSMTPHandler)
+        self.messages = []
+        self.connections = 0
+
+
+def build_message(to_email):
+    message = EmailMessage()
+    message['From'] = 'noreply@smartfactory.com'
+    message['To'] = to_email
+    message['Subject'] = 'Test'
+    message.set_content('Hello')
+    return message
+
+
+class TestEmailQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.server = RecordingSMTPServer()
+        self.loop = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self.loop.start()
+        self.env = patch.dict(os.environ, {
+            'SMTP_SERVER': '127.0.0.1',
+            'SMTP_PORT': str(self.server.server_address[1]),
+            'SMTP_EMAIL': 'noreply@smartfactory.com',
+            'SMTP_PASSWORD': 'password',
+        })
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.loop.join(1)
+
+    def test_messages_share_one_connection(self):
+        email_queue = EmailQueue(batch_size=10, idle_timeout=5)
+        for i in range(25):
+            email_queue.put(build_message(f'user{i}@example.com'))
+        email_queue.stop()
+
+        self.assertEqual(len(self.server.messages), 25)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(email_queue.sent, 25)
+        self.assertEqual(self.server.messages[0], ('noreply@smartfactory.com', ['user0@example.com']))
+
+    def test_retry_after_connection_failure(self):
+        email_queue = EmailQueue(retry_backoff=0.01, idle_timeout=5)
+        real_connect = email_queue._connect
+        attempts = []
+
+        def flaky_connect():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            return real_connect()
+
+        with patch.object(email_queue, '_connect', side_effect=flaky_connect):
+            email_queue.put(build_message('user@example.com'))
+            email_queue.stop()
+
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertEqual(email_queue.failed, 0)
+
+    def test_give_up_after_max_retries(self):
+        email_queue = EmailQueue(max_retries=2, retry_backoff=0.01, idle_timeout=5)
+
+        with patch.object(email_queue, '_connect', side_effect=ConnectionRefusedError()) as mock_connect:
+            email_queue.put(build_message('user@example.com'))
+            email_queue.stop()
+
+        self.assertEqual(mock_connect.call_count, 3)
+        self.assertEqual(email_queue.failed, 1)
+        self.assertEqual(self.server.messages, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from fastapi.testclient import TestClient
+
+import app as app_module
+from app import app
+
+API_KEY = "gui-key"
+
+TIMEFRAME = {"start_date": "2024-03-01", "end_date": "2024-03-03"}
+
+GROUP_BY_RESPONSE = [
+    {"version": "v1", "timestamp": "2024-03-01T00:00:00.000Z",
+     "event": {"name": "Machine1", "working_time_sum": 10.0, "idle_time_sum": 2.0}},
+    {"version": "v1", "timestamp": "2024-03-01T00:00:00.000Z",
+     "event": {"name": "Machine2", "working_time_sum": 8.0, "idle_time_sum": 3.0}},
+    {"version": "v1", "timestamp": "2024-03-02T00:00:00.000Z",
+     "event": {"name": "Machine1", "working_time_sum": 12.0, "idle_time_sum": None}},
+]
+
+def widget(widget_id, kpi, machines, **params):
+    return dict({"widgetId": widget_id, "kpi": kpi, "timeframe": TIMEFRAME, "machines": machines,
+                 "group_time": "P1D"}, **params)
+
+@patch('api_auth.api_auth.retrieve_keys', side_effect={"gui": API_KEY}.get)
+@patch('app.run_historical_query')
+class TestHistoricalBatch(unittest.TestCase):
+
+    def setUp(self):
+        app_module.response_cache.invalidate()
+        self.addCleanup(app_module.response_cache.invalidate)
+        self.client = TestClient(app)
+
+    def post(self, queries):
+        return self.client.post("/smartfactory/historical/batch", json=queries, headers={"X-API-Key": API_KEY})
+
+    def test_merged_query_is_split_per_widget(self, mock_run, _):
+        mock_run.return_value = GROUP_BY_RESPONSE
+
+        response = self.post([widget("working", "working_time_sum", ["Machine1"]),
+                              widget("idle", "idle_time_sum", ["Machine2"])])
+
+        self.assertEqual(response.status_code, 200)
+        mock_run.assert_called_once()
+        query = mock_run.call_args.args[0]
+        self.assertEqual(query["queryType"], "groupBy")
+        self.assertEqual(query["filter"]["fields"][1]["values"], ["Machine1", "Machine2"])
+        self.assertEqual(response.json(), {"data": {
+            "working": [{"name": "Machine1", "timestamp": "2024-03-01", "working_time_sum": 10.0},
+                        {"name": "Machine1", "timestamp": "2024-03-02", "working_time_sum": 12.0}],
+            "idle": [{"name": "Machine2", "timestamp": "2024-03-01", "idle_time_sum": 3.0}],
+        }, "errors": {}})
+
+    def test_invalid_widget_does_not_fail_the_batch(self, mock_run, _):
+        mock_run.return_value = GROUP_BY_RESPONSE
+
+        response = self.post([widget("working", "working_time_sum", ["Machine1", "Machine2"]),
+                              widget("broken", "idle_time_sum", ["Machine2"], aggregator="median")])
+
+        self.assertEqual(response.status_code, 200)
+        mock_run.assert_called_once()
+        body = response.json()
+        self.assertEqual(len(body["data"]["working"]), 3)
+        self.assertNotIn("broken", body["data"])
+        self.assertEqual(body["errors"], {"broken": {"status_code": 400, "detail": "Invalid aggregator value"}})
+
+    def test_cached_widget_is_not_queried(self, mock_run, _):
+        mock_run.return_value = GROUP_BY_RESPONSE
+        first = self.post([widget("working", "working_time_sum", ["Machine1", "Machine2"])])
+        mock_run.reset_mock()
+
+        # the same query, under another widget id
+        response = self.post([widget("copy", "working_time_sum", ["Machine2", "Machine1"])])
+
+        self.assertEqual(response.status_code, 200)
+        mock_run.assert_not_called()
+        self.assertEqual(response.json()["data"]["copy"], first.json()["data"]["working"])
+
+    def test_duplicate_widget_ids(self, mock_run, _):
+        response = self.post([widget("working", "working_time_sum", ["Machine1"]),
+                              widget("working", "idle_time_sum", ["Machine2"]),
+                              widget(None, "idle_time_sum", ["Machine1"]),
+                              widget("2", "idle_time_sum", ["Machine2"])])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "Duplicate widgetId: 2, working")
+        mock_run.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from http_clients import DownstreamClients, service_urls, rag_agent_path
+
+ENV = {
+    "KB_HOST": "kb-host", "KB_PORT": "8001",
+    "RAG_API_ENDPOINT": "http://rag-host:8002/agent/chat",
+    "API_KEY": "secret",
+}
+
+class TestDownstreamClients(unittest.TestCase):
+
+    @patch.dict(os.environ, ENV)
+    def test_service_urls(self):
+        urls = service_urls()
+
+        self.assertEqual(urls["kb"], "http://kb-host:8001")
+        self.assertEqual(urls["rag"], "http://rag-host:8002/")
+        self.assertEqual(rag_agent_path(), "/agent/chat")
+
+    @patch.dict(os.environ, ENV)
+    def test_clients_are_reused(self):
+        clients = DownstreamClients()
+        kb_client = clients.get("kb")
+
+        self.assertIs(clients.get("kb"), kb_client)
+        self.assertIsNot(clients.get("rag"), kb_client)
+        self.assertEqual(kb_client.headers["x-api-key"], "secret")
+        self.assertEqual(str(kb_client.base_url), "http://kb-host:8001")
+
+        asyncio.run(clients.close())
+        self.assertTrue(kb_client.is_closed)
+        self.assertIsNot(clients.get("kb"), kb_client)
+
+if __name__ == '__main__':
+    unittest.main()
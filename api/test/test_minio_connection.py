@@ -0,0 +1,51 @@
+import sys
+import os
+import unittest
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from database.minio_connection import parse_byte_range, upload_bytes
+
+class TestMinioConnection(unittest.TestCase):
+
+    def test_upload_bytes_from_memory(self):
+        client = MagicMock()
+        client.bucket_exists.return_value = True
+
+        self.assertTrue(upload_bytes(client, "reports", "1/report.pdf", b"%PDF-1.4", "application/pdf"))
+
+        args, kwargs = client.put_object.call_args
+        self.assertEqual(args[:2], ("reports", "1/report.pdf"))
+        self.assertEqual(args[2].read(), b"%PDF-1.4")
+        self.assertEqual(kwargs["length"], 8)
+        self.assertEqual(kwargs["content_type"], "application/pdf")
+        client.make_bucket.assert_not_called()
+
+    def test_upload_bytes_creates_bucket(self):
+        client = MagicMock()
+        client.bucket_exists.return_value = False
+
+        upload_bytes(client, "reports", "1/report.pdf", b"data", "application/pdf")
+
+        client.make_bucket.assert_called_once_with("reports")
+
+    def test_parse_byte_range(self):
+        self.assertEqual(parse_byte_range("bytes=0-9", 100), (0, 10))
+        self.assertEqual(parse_byte_range("bytes=90-", 100), (90, 10))
+        self.assertEqual(parse_byte_range("bytes=-10", 100), (90, 10))
+        self.assertEqual(parse_byte_range("bytes=-500", 100), (0, 100))
+        self.assertEqual(parse_byte_range("bytes=95-200", 100), (95, 5))
+
+    def test_parse_byte_range_whole_object(self):
+        self.assertIsNone(parse_byte_range(None, 100))
+        self.assertIsNone(parse_byte_range("bytes=0-1,5-6", 100))
+        self.assertIsNone(parse_byte_range("items=0-1", 100))
+
+    def test_parse_byte_range_not_satisfiable(self):
+        for range_header in ("bytes=100-", "bytes=10-5", "bytes=-0"):
+            with self.assertRaises(ValueError):
+                parse_byte_range(range_header, 100)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,11 +2,13 @@ import unittest
 from unittest.mock import patch, MagicMock
 import smtplib
 import sys
+from datetime import datetime
 import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 
-from notification_service import send_email, save_alert, retrieve_alerts
+from notification_service import send_email, save_alert, save_alerts, retrieve_alerts, queue_alert_emails, \
+    encode_alert_cursor, decode_alert_cursor
 
 class TestSendEmail(unittest.TestCase):
 
@@ -86,13 +88,14 @@ class TestSendEmail(unittest.TestCase):
 
 class TestSaveAlert(unittest.TestCase):
 
-    @patch('notification_service.get_db_connection')
-    @patch('notification_service.query_db')
-    def test_save_alert_success(self, mock_query_db, mock_get_db_connection):
+    @patch('notification_service.execute_values')
+    @patch('notification_service.db_connection')
+    def test_save_alert_success(self, mock_db_connection, mock_execute_values):
         # Mock database connection and cursor
         mock_connection = MagicMock()
         mock_cursor = MagicMock()
-        mock_get_db_connection.return_value = (mock_connection, mock_cursor)
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
+        mock_execute_values.side_effect = [[(1, datetime(2023, 10, 10, 10))], [(1, 10), (1, 11)]]
 
         # Create a mock alert
         alert = MagicMock()
@@ -107,23 +110,26 @@ class TestSaveAlert(unittest.TestCase):
         alert.severity.value = 'High'
 
         # Call the function
-        save_alert(alert)
+        alert_id = save_alert(alert)
 
         # Assertions
-        mock_query_db.assert_called()
-        mock_cursor.close.assert_called()
-        mock_connection.close.assert_called()
-
-    @patch('notification_service.get_db_connection')
-    @patch('notification_service.query_db')
-    def test_save_alert_failure(self, mock_query_db, mock_get_db_connection):
+        self.assertEqual(alert_id, 1)
+        self.assertEqual(mock_execute_values.call_count, 2)
+        recipients = mock_execute_values.call_args_list[1][0][2]
+        self.assertEqual(recipients, [(1, datetime(2023, 10, 10, 10), ['user1@example.com'])])
+        mock_connection.commit.assert_called_once()
+        mock_db_connection.return_value.__exit__.assert_called()
+
+    @patch('notification_service.execute_values')
+    @patch('notification_service.db_connection')
+    def test_save_alert_failure(self, mock_db_connection, mock_execute_values):
         # Mock database connection and cursor
         mock_connection = MagicMock()
         mock_cursor = MagicMock()
-        mock_get_db_connection.return_value = (mock_connection, mock_cursor)
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
 
-        # Mock query_db to raise an exception
-        mock_query_db.side_effect = Exception("Database error")
+        # Mock the insert to raise an exception
+        mock_execute_values.side_effect = Exception("Database error")
 
         # Create a mock alert
         alert = MagicMock()
@@ -142,53 +148,184 @@ class TestSaveAlert(unittest.TestCase):
             save_alert(alert)
 
         # Assertions
-        mock_query_db.assert_called()
-        mock_cursor.close.assert_called()
-        mock_connection.close.assert_called()
+        mock_connection.commit.assert_not_called()
+        mock_db_connection.return_value.__exit__.assert_called()
+
+class TestSaveAlerts(unittest.TestCase):
+
+    @patch('notification_service.execute_values')
+    @patch('notification_service.db_connection')
+    def test_save_alerts_batch(self, mock_db_connection, mock_execute_values):
+        # Mock database connection and cursor
+        mock_connection = MagicMock()
+        mock_cursor = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
+        # RETURNING does not guarantee the order of the rows
+        triggered_at = datetime(2023, 10, 10, 10)
+        mock_execute_values.side_effect = [[(8, triggered_at), (7, triggered_at), (9, triggered_at)],
+                                           [(7, 10), (8, 10), (9, 11)]]
+
+        alerts = []
+        for i in range(3):
+            alert = MagicMock()
+            alert.title = 'Alert ' + str(i)
+            alert.triggeredAt = '2023-10-10 10:00:00'
+            alert.isPush = True
+            alert.recipients = ['FactoryFloorManager'] if i else ['SpecialtyManager', 'FactoryFloorManager']
+            alert.severity.value = 'Low'
+            alerts.append(alert)
+
+        # Call the function
+        alert_ids = save_alerts(alerts)
+
+        # Assertions
+        self.assertEqual(alert_ids, [7, 8, 9])
+        self.assertEqual(mock_execute_values.call_count, 2)
+        alert_rows = mock_execute_values.call_args_list[0][0][2]
+        self.assertEqual([row[0] for row in alert_rows], [0, 1, 2])
+        recipients = mock_execute_values.call_args_list[1][0][2]
+        self.assertEqual(recipients, [(7, triggered_at, ['SpecialtyManager', 'FactoryFloorManager']),
+                                      (8, triggered_at, ['FactoryFloorManager']),
+                                      (9, triggered_at, ['FactoryFloorManager'])])
+        mock_connection.commit.assert_called_once()
+
+    @patch('notification_service.execute_values')
+    @patch('notification_service.db_connection')
+    def test_save_alerts_updates_rollup(self, mock_db_connection, mock_execute_values):
+        mock_db_connection.return_value.__enter__.return_value = (MagicMock(), MagicMock())
+        mock_execute_values.side_effect = [[(1, datetime(2023, 10, 10, 10))], []]
+
+        alert = MagicMock()
+        alert.recipients = ['FactoryFloorManager']
+        save_alerts([alert])
+
+        # the daily rollup is maintained by the same statement that inserts the alerts
+        self.assertIn("INSERT INTO AlertDailyRollup", mock_execute_values.call_args_list[0][0][1])
+
+    @patch('notification_service.db_connection')
+    def test_save_alerts_empty(self, mock_db_connection):
+        self.assertEqual(save_alerts([]), [])
+        mock_db_connection.assert_not_called()
+
+class TestQueueAlertEmails(unittest.TestCase):
+
+    @patch('notification_service.email_queue')
+    @patch('notification_service.db_connection')
+    def test_queue_alert_emails(self, mock_db_connection, mock_email_queue):
+        # Mock database connection and cursor
+        mock_connection = MagicMock()
+        mock_cursor = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
+        mock_cursor.fetchall.return_value = [
+            ('FactoryFloorManager', 'ffm@example.com'),
+            ('SpecialtyManager', 'sm@example.com'),
+        ]
+
+        alerts = []
+        for recipients in (['FactoryFloorManager'], ['FactoryFloorManager', 'SpecialtyManager']):
+            alert = MagicMock()
+            alert.title = 'Test Alert'
+            alert.recipients = recipients
+            alert.severity.value = 'High'
+            alerts.append(alert)
+
+        # Call the function
+        queue_alert_emails(alerts)
+
+        # Assertions
+        mock_cursor.execute.assert_called_once()
+        queued = [call[0][0]['To'] for call in mock_email_queue.put.call_args_list]
+        self.assertEqual(queued, ['ffm@example.com', 'ffm@example.com', 'sm@example.com'])
 
 class TestRetrieveAlerts(unittest.TestCase):
 
-    @patch('notification_service.get_db_connection')
-    def test_retrieve_alerts_success(self, mock_get_db_connection):
+    @patch('notification_service.db_connection')
+    def test_retrieve_alerts_success(self, mock_db_connection):
         # Mock database connection and cursor
         mock_connection = MagicMock()
         mock_cursor = MagicMock()
-        mock_get_db_connection.return_value = (mock_connection, mock_cursor)
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
 
         # Mock database response
         mock_cursor.fetchall.return_value = [
-            ('1', 'Test Alert', 'Error', 'This is a test alert', '2023-10-10 10:00:00', 'Machine1', 1, '["user1@example.com"]', 'High')
+            (1, 'Test Alert', 'Error', 'This is a test alert', '2023-10-10 10:00:00', 'Machine1', True, 'High')
         ]
 
         # Call the function
-        alerts = retrieve_alerts('user1@example.com')
+        alerts = retrieve_alerts('1', True)
 
         # Assertions
         self.assertEqual(len(alerts), 1)
-        self.assertEqual(alerts[0]['alertId'], '1')
+        self.assertEqual(alerts[0]['alertId'], 1)
         self.assertEqual(alerts[0]['title'], 'Test Alert')
         self.assertEqual(alerts[0]['description'], 'This is a test alert')
+        self.assertEqual(alerts[0]['severity'], 'High')
+
+        mock_db_connection.return_value.__exit__.assert_called()
+
+    @patch('notification_service.db_connection')
+    def test_retrieve_alerts_page(self, mock_db_connection):
+        # Mock database connection and cursor
+        mock_connection = MagicMock()
+        mock_cursor = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
+        mock_cursor.fetchall.return_value = [
+            (9, 'Test Alert', 'Error', 'This is a test alert', '2023-10-10 10:00:00', 'Machine1', True, 'High'),
+            (8, 'Test Alert', 'Error', 'This is a test alert', '2023-10-09 10:00:00', 'Machine1', True, 'High')
+        ]
+        cursor = encode_alert_cursor({"triggeredAt": "2023-10-11 10:00:00", "alertId": 10})
+
+        # Call the function
+        alerts = retrieve_alerts('1', False, limit=2, cursor=cursor)
+
+        # Assertions
+        select_query, select_params = mock_cursor.execute.call_args_list[0][0]
+        self.assertIn("(a.TriggeredAt, a.AlertID) < (%s, %s)", select_query)
+        self.assertIn("LIMIT %s", select_query)
+        cursor_time = datetime(2023, 10, 11, 10, 0)
+        self.assertEqual(select_params[1:], (cursor_time, cursor_time, 10, 2))
+        # only the returned page is marked as read
+        update_params = mock_cursor.execute.call_args_list[1][0][1]
+        self.assertEqual(update_params, ('1', [9, 8]))
+        self.assertEqual([alert['alertId'] for alert in alerts], [9, 8])
+        mock_connection.commit.assert_called_once()
+
+    @patch('notification_service.db_connection')
+    def test_retrieve_alerts_nothing_new(self, mock_db_connection):
+        # Mock database connection and cursor
+        mock_connection = MagicMock()
+        mock_cursor = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
+        mock_cursor.fetchall.return_value = []
+
+        # Call the function
+        alerts = retrieve_alerts('1', True, since=datetime(2023, 10, 11))
+
+        # Assertions
+        self.assertEqual(alerts, [])
+        mock_cursor.execute.assert_called_once()
+        mock_connection.commit.assert_not_called()
 
-        mock_cursor.close.assert_called()
-        mock_connection.close.assert_called()
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_alert_cursor("not a cursor")
 
-    @patch('notification_service.get_db_connection')
-    def test_retrieve_alerts_failure(self, mock_get_db_connection):
+    @patch('notification_service.db_connection')
+    def test_retrieve_alerts_failure(self, mock_db_connection):
         # Mock database connection and cursor
         mock_connection = MagicMock()
         mock_cursor = MagicMock()
-        mock_get_db_connection.return_value = (mock_connection, mock_cursor)
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
 
         # Mock cursor to raise an exception
         mock_cursor.execute.side_effect = Exception("Database error")
 
         # Call the function and assert exception is raised
         with self.assertRaises(Exception):
-            retrieve_alerts('user1@example.com')
+            retrieve_alerts('1', True)
 
         # Assertions
-        mock_cursor.close.assert_called()
-        mock_connection.close.assert_called()
+        mock_db_connection.return_value.__exit__.assert_called()
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,111 @@
+import asyncio
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from report_jobs import ReportJobs, QUEUED, RUNNING, COMPLETED, FAILED
+
+class TestReportJobs(unittest.TestCase):
+
+    def test_job_completes_with_progress(self):
+        async def generate(job):
+            job.progress("generating")
+            await asyncio.sleep(0.01)
+            job.progress("rendering")
+            return 42
+
+        async def scenario():
+            jobs = ReportJobs(workers=1, timeout=1, retention=60)
+            job = jobs.submit("1", generate)
+            self.assertEqual(job.status, QUEUED)
+            await asyncio.sleep(0.05)
+            return jobs, job
+
+        jobs, job = asyncio.run(scenario())
+
+        self.assertEqual(job.getDict(), {"jobId": job.id, "status": COMPLETED, "stage": "rendering",
+                                         "reportId": 42, "error": None})
+        self.assertIs(jobs.get(job.id), job)
+        self.assertEqual(jobs.pending(), 0)
+
+    def test_workers_bound_concurrency(self):
+        active = []
+        peak = []
+
+        async def generate(job):
+            active.append(job.id)
+            peak.append(len(active))
+            await asyncio.sleep(0.02)
+            active.remove(job.id)
+
+        async def scenario():
+            jobs = ReportJobs(workers=2, timeout=1, retention=60)
+            submitted = [jobs.submit("1", generate) for _ in range(5)]
+            await asyncio.sleep(0.005)
+            statuses = [job.status for job in submitted]
+            await asyncio.sleep(0.2)
+            return submitted, statuses
+
+        submitted, statuses = asyncio.run(scenario())
+
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(statuses.count(RUNNING), 2)
+        self.assertEqual(statuses.count(QUEUED), 3)
+        self.assertTrue(all(job.status == COMPLETED for job in submitted))
+
+    def test_failed_and_timed_out_jobs(self):
+        async def failing(job):
+            raise ValueError("agent unavailable")
+
+        async def slow(job):
+            await asyncio.sleep(5)
+
+        async def scenario():
+            jobs = ReportJobs(workers=2, timeout=0.05, retention=60)
+            failed = jobs.submit("1", failing)
+            timed_out = jobs.submit("1", slow)
+            await asyncio.sleep(0.2)
+            return failed, timed_out
+
+        failed, timed_out = asyncio.run(scenario())
+
+        self.assertEqual((failed.status, failed.error), (FAILED, "agent unavailable"))
+        self.assertEqual(timed_out.status, FAILED)
+        self.assertIn("Timed out", timed_out.error)
+
+    def test_finished_jobs_are_evicted(self):
+        async def generate(job):
+            return 1
+
+        async def scenario():
+            jobs = ReportJobs(workers=1, timeout=1, retention=0)
+            old = jobs.submit("1", generate)
+            await asyncio.sleep(0.01)
+            new = jobs.submit("1", generate)
+            return jobs, old, new
+
+        jobs, old, new = asyncio.run(scenario())
+
+        self.assertIsNone(jobs.get(old.id))
+        self.assertIs(jobs.get(new.id), new)
+
+    def test_jobs_of_other_users_are_not_found(self):
+        async def generate(job):
+            return 1
+
+        async def scenario():
+            jobs = ReportJobs(workers=1, timeout=1, retention=60)
+            job = jobs.submit("1", generate)
+            await asyncio.sleep(0.01)
+            return jobs, job
+
+        jobs, job = asyncio.run(scenario())
+
+        self.assertIs(jobs.get(job.id, "1"), job)
+        self.assertIsNone(jobs.get(job.id, "2"))
+        self.assertIsNone(jobs.get("missing", "1"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+import unittest
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from model.task import Task
+from report_scheduler import ReportScheduler
+
+
+def make_task(func, start, delay=60, args=()):
+    start_date = datetime.fromtimestamp(start).strftime("%Y-%m-%d %H:%M:%S")
+    return Task(func=func, delay=delay, start_date=start_date, json=None, args=args)
+
+
+class TestReportScheduler(unittest.TestCase):
+
+    def test_due_tasks_are_popped_in_order_and_rescheduled(self):
+        scheduler = ReportScheduler(workers=1)
+        now = int(time.time())
+        scheduler.add("late", make_task(print, now - 10))
+        scheduler.add("early", make_task(print, now - 100))
+        scheduler.add("future", make_task(print, now + 1000))
+
+        due = scheduler.pop_due(now)
+
+        self.assertEqual([job_id for job_id, _ in due], ["early", "late"])
+        # the next runs are after now, the missed ones are skipped
+        self.assertEqual(scheduler.get("early").next_run, now - 100 + 120)
+        self.assertEqual(scheduler.get("late").next_run, now + 50)
+        self.assertEqual(scheduler.next_run(), now + 20)
+        self.assertEqual(scheduler.pop_due(now), [])
+
+    def test_replaced_and_removed_tasks(self):
+        scheduler = ReportScheduler(workers=1)
+        now = int(time.time())
+        scheduler.add("1", make_task(print, now - 10))
+        scheduler.add("1", make_task(print, now + 500))
+        scheduler.add("2", make_task(print, now - 5))
+        scheduler.remove("2")
+
+        self.assertEqual(scheduler.pop_due(now), [])
+        self.assertEqual(scheduler.next_run(), now + 500)
+        self.assertIsNone(scheduler.get("2"))
+
+        scheduler.remove("1")
+        self.assertIsNone(scheduler.next_run())
+
+    def test_tasks_run_when_due(self):
+        runs = []
+
+        async def report(name):
+            runs.append(name)
+
+        def blocking_report(name):
+            runs.append((name, threading.current_thread().name))
+
+        async def scenario():
+            scheduler = ReportScheduler(workers=2)
+            loop_task = asyncio.create_task(scheduler.run())
+            await asyncio.sleep(0.01)
+            # added while the scheduler is sleeping on an empty heap
+            scheduler.add("async", make_task(report, time.time() - 1, args=("async",)))
+            scheduler.add("sync", make_task(blocking_report, time.time() - 1, args=("sync",)))
+            await asyncio.sleep(0.2)
+            loop_task.cancel()
+            await asyncio.gather(loop_task, return_exceptions=True)
+            await scheduler.stop()
+
+        asyncio.run(scenario())
+
+        self.assertIn("async", runs)
+        sync_runs = [run for run in runs if isinstance(run, tuple)]
+        self.assertEqual(len(sync_runs), 1)
+        # plain functions run off the event loop thread
+        self.assertTrue(sync_runs[0][1].startswith("report-worker"))
+
+    def test_slow_task_times_out(self):
+        finished = []
+
+        async def slow_report():
+            await asyncio.sleep(5)
+            finished.append(True)
+
+        async def scenario():
+            scheduler = ReportScheduler(workers=1, timeout=0.05)
+            loop_task = asyncio.create_task(scheduler.run())
+            scheduler.add("slow", make_task(slow_report, time.time() - 1))
+            with self.assertLogs(level="ERROR") as logs:
+                await asyncio.sleep(0.2)
+            loop_task.cancel()
+            await asyncio.gather(loop_task, return_exceptions=True)
+            await scheduler.stop()
+            return logs.output
+
+        output = asyncio.run(scenario())
+
+        self.assertEqual(finished, [])
+        self.assertTrue(any("timed out" in line for line in output))
+
+    def test_runs_of_a_task_do_not_overlap(self):
+        running = []
+        peak = []
+
+        async def slow_report():
+            running.append(1)
+            peak.append(len(running))
+            try:
+                await asyncio.sleep(0.3)
+            finally:
+                running.pop()
+
+        def blocking_report():
+            running.append(1)
+            peak.append(len(running))
+            time.sleep(0.3)
+            running.pop()
+
+        async def scenario(func, timeout):
+            # due every 50 ms, runs for 300 ms
+            scheduler = ReportScheduler(workers=4, timeout=timeout)
+            loop_task = asyncio.create_task(scheduler.run())
+            scheduler.add("slow", make_task(func, time.time() - 1, delay=0.05))
+            with self.assertLogs(level="WARNING") as logs:
+                await asyncio.sleep(0.5)
+            loop_task.cancel()
+            await asyncio.gather(loop_task, return_exceptions=True)
+            await scheduler.stop()
+            return scheduler.skipped, logs.output
+
+        for func, timeout in ((slow_report, 10), (blocking_report, 10), (blocking_report, 0.05)):
+            peak.clear()
+            skipped, output = asyncio.run(scenario(func, timeout))
+            time.sleep(0.4)  # the thread of the last run ends
+
+            self.assertEqual(max(peak), 1)
+            self.assertLessEqual(len(peak), 2)
+            self.assertGreater(skipped, 0)
+            self.assertTrue(any("still in progress" in line for line in output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import sys
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from report_service import find_report_by_fingerprint, object_name, report_fingerprint, save_report
+
+class TestReportService(unittest.TestCase):
+
+    def mock_cursor(self, mock_db_connection):
+        mock_cursor = MagicMock()
+        mock_connection = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
+        return mock_connection, mock_cursor
+
+    def test_fingerprint_is_normalized(self):
+        fingerprint = report_fingerprint("01/10/2024 - 08/10/2024", ["energy", "idle_time"], ["m1", "m2"], "w1")
+
+        self.assertEqual(len(fingerprint), 64)
+        self.assertEqual(fingerprint, report_fingerprint(" 01/10/2024 - 08/10/2024", ["idle_time", "energy", "energy"],
+                                                         ["m2", "m1"], "w1"))
+
+    def test_fingerprint_changes_with_content_and_data(self):
+        fingerprint = report_fingerprint("01/10/2024 - 08/10/2024", ["energy"], ["m1"], "w1")
+
+        self.assertNotEqual(fingerprint, report_fingerprint("01/10/2024 - 09/10/2024", ["energy"], ["m1"], "w1"))
+        self.assertNotEqual(fingerprint, report_fingerprint("01/10/2024 - 08/10/2024", ["energy"], ["m2"], "w1"))
+        self.assertNotEqual(fingerprint, report_fingerprint("01/10/2024 - 08/10/2024", ["energy"], ["m1"], "w2"))
+
+    @patch('report_service.db_connection')
+    def test_find_report_by_fingerprint(self, mock_db_connection):
+        _, mock_cursor = self.mock_cursor(mock_db_connection)
+        mock_cursor.fetchone.return_value = ("/reports/artifacts/abc.pdf",)
+
+        self.assertEqual(find_report_by_fingerprint("abc"), "/reports/artifacts/abc.pdf")
+        self.assertEqual(mock_cursor.execute.call_args[0][1], ("abc",))
+
+        mock_cursor.fetchone.return_value = None
+        self.assertIsNone(find_report_by_fingerprint("abc"))
+
+    @patch('report_service.db_connection')
+    def test_save_report(self, mock_db_connection):
+        mock_connection, mock_cursor = self.mock_cursor(mock_db_connection)
+        mock_cursor.fetchone.return_value = (5,)
+
+        report_id = save_report("2", "weekly.pdf", None, "/reports/artifacts/abc.pdf", "abc")
+
+        self.assertEqual(report_id, 5)
+        values = mock_cursor.execute.call_args[0][1]
+        self.assertEqual(values[:3], ("weekly.pdf", "Standard", 2))
+        self.assertEqual(values[4:], ("/reports/artifacts/abc.pdf", "Test", "abc"))
+        mock_connection.commit.assert_called_once()
+
+    def test_object_name(self):
+        self.assertEqual(object_name("/reports/1/weekly.pdf"), "1/weekly.pdf")
+        self.assertEqual(object_name("/reports/artifacts/abc.pdf"), "artifacts/abc.pdf")
+
+if __name__ == '__main__':
+    unittest.main()
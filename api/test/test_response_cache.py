@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from response_cache import ResponseCache, normalize_key, etag_matches
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_normalize_key_ignores_dict_order(self):
+        self.assertEqual(normalize_key({"a": 1, "b": [1, 2]}), normalize_key({"b": [1, 2], "a": 1}))
+
+    def test_set_and_get(self):
+        cache = ResponseCache()
+        entry = cache.set("kpi", "", {"kpis": [1, 2]}, 60)
+
+        self.assertIs(cache.get("kpi", ""), entry)
+        self.assertIsNone(cache.get("machines", ""))
+        self.assertTrue(entry.etag.startswith('W/"') and entry.etag.endswith('"'))
+
+    def test_same_content_same_etag(self):
+        cache = ResponseCache()
+        self.assertEqual(cache.set("kpi", "a", [1], 60).etag, cache.set("kpi", "b", [1], 60).etag)
+        self.assertNotEqual(cache.set("kpi", "a", [1], 60).etag, cache.set("kpi", "b", [2], 60).etag)
+
+    @patch('response_cache.time.monotonic')
+    def test_expired_entry(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        cache = ResponseCache()
+        cache.set("kpi", "", [1], 10)
+
+        mock_monotonic.return_value = 111.0
+        self.assertIsNone(cache.get("kpi", ""))
+
+    def test_lru_eviction_by_entries(self):
+        cache = ResponseCache(max_entries=2)
+        cache.set("historical", "a", [1], 60)
+        cache.set("historical", "b", [2], 60)
+        cache.get("historical", "a")
+        cache.set("historical", "c", [3], 60)
+
+        self.assertIsNotNone(cache.get("historical", "a"))
+        self.assertIsNone(cache.get("historical", "b"))
+        self.assertIsNotNone(cache.get("historical", "c"))
+
+    def test_eviction_by_size(self):
+        cache = ResponseCache(max_bytes=20)
+        cache.set("historical", "a", "x" * 10, 60)
+        cache.set("historical", "b", "y" * 10, 60)
+
+        self.assertIsNone(cache.get("historical", "a"))
+        self.assertIsNotNone(cache.get("historical", "b"))
+
+    def test_invalidate_namespace(self):
+        cache = ResponseCache()
+        cache.set("kpi", "", [1], 60)
+        cache.set("machines", "", [2], 60)
+        cache.invalidate("kpi")
+
+        self.assertIsNone(cache.get("kpi", ""))
+        self.assertIsNotNone(cache.get("machines", ""))
+
+    def test_not_modified_response(self):
+        entry = ResponseCache().set("kpi", "", [1], 60)
+
+        self.assertEqual(entry.to_response().status_code, 200)
+        self.assertEqual(entry.to_response(entry.etag).status_code, 304)
+        self.assertEqual(entry.to_response('"other", ' + entry.etag).status_code, 304)
+        self.assertEqual(entry.to_response('"other"').status_code, 200)
+        self.assertTrue(etag_matches("*", entry.etag))
+
+    def test_etag_is_weak_and_varies_by_encoding(self):
+        entry = ResponseCache().set("kpi", "", [1], 60)
+
+        self.assertEqual(entry.to_response().headers["Vary"], "Accept-Encoding")
+        self.assertEqual(entry.to_response(entry.etag).headers["Vary"], "Accept-Encoding")
+        # the tag matches with or without the weak prefix
+        self.assertEqual(entry.to_response(entry.etag[2:]).status_code, 304)
+        self.assertTrue(etag_matches('W/"other", ' + entry.etag, entry.etag))
+        self.assertFalse(etag_matches('W/"other"', entry.etag))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import json
+import sys
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from model.report import ScheduledReport
+from schedule_service import save_schedule, retrieve_schedules, load_schedules, import_legacy_schedules
+
+def make_schedule(id=None, name="weekly"):
+    return ScheduledReport(id=id, name=name, recurrence="Weekly", status=True, email="user@example.com",
+                           startDate="2024-12-01 08:00:00", kpis=["energy"], machines=["m1"])
+
+class TestScheduleService(unittest.TestCase):
+
+    def mock_cursor(self, mock_db_connection):
+        mock_cursor = MagicMock()
+        mock_connection = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
+        return mock_connection, mock_cursor
+
+    @patch('schedule_service.db_connection')
+    def test_save_new_schedule_gets_id_from_sequence(self, mock_db_connection):
+        mock_connection, mock_cursor = self.mock_cursor(mock_db_connection)
+        mock_cursor.fetchone.return_value = (7,)
+
+        schedule = save_schedule(1, make_schedule())
+
+        self.assertEqual(schedule.id, 7)
+        query, values = mock_cursor.execute.call_args[0]
+        self.assertIn("INSERT INTO ReportSchedules", query)
+        self.assertEqual(values[:2], (1, "weekly"))
+        self.assertNotIn("id", json.loads(values[2]))
+        mock_connection.commit.assert_called_once()
+
+    @patch('schedule_service.db_connection')
+    def test_save_existing_schedule_keeps_its_name(self, mock_db_connection):
+        mock_connection, mock_cursor = self.mock_cursor(mock_db_connection)
+        mock_cursor.fetchone.return_value = ("original",)
+
+        schedule = save_schedule(1, make_schedule(id=3, name="renamed"))
+
+        self.assertEqual(schedule.id, 3)
+        self.assertEqual(schedule.name, "original")
+        query, values = mock_cursor.execute.call_args[0]
+        self.assertIn("UPDATE ReportSchedules", query)
+        self.assertEqual(json.loads(values[0])["name"], "original")
+        self.assertEqual(values[1], 3)
+
+    @patch('schedule_service.db_connection')
+    def test_save_schedule_of_another_user_is_inserted(self, mock_db_connection):
+        _, mock_cursor = self.mock_cursor(mock_db_connection)
+        mock_cursor.fetchone.side_effect = [None, (8,)]
+
+        schedule = save_schedule(2, make_schedule(id=3))
+
+        self.assertEqual(schedule.id, 8)
+        self.assertIn("INSERT INTO ReportSchedules", mock_cursor.execute.call_args[0][0])
+
+    @patch('schedule_service.db_connection')
+    def test_retrieve_schedules(self, mock_db_connection):
+        _, mock_cursor = self.mock_cursor(mock_db_connection)
+        settings = make_schedule().model_dump_json(exclude={"id"})
+        mock_cursor.fetchall.return_value = [(3, settings)]
+
+        schedules = retrieve_schedules(1)
+
+        self.assertEqual(len(schedules), 1)
+        self.assertEqual(schedules[0]["id"], 3)
+        self.assertEqual(schedules[0]["name"], "weekly")
+        query, values = mock_cursor.execute.call_args[0]
+        self.assertIn("WHERE UserID = %s", query)
+        self.assertEqual(values, (1,))
+
+    @patch('schedule_service.db_connection')
+    def test_load_schedules(self, mock_db_connection):
+        _, mock_cursor = self.mock_cursor(mock_db_connection)
+        settings = make_schedule().model_dump_json(exclude={"id"})
+        mock_cursor.fetchall.return_value = [(3, 1, "owner@example.com", settings)]
+
+        schedules = load_schedules()
+
+        user_id, email, schedule = schedules[0]
+        self.assertEqual((user_id, email), (1, "owner@example.com"))
+        self.assertEqual(ScheduledReport.model_validate(schedule).id, 3)
+
+    def mock_minio(self, blobs):
+        mock_minio = MagicMock()
+        mock_minio.list_objects.return_value = [MagicMock(object_name=name) for name in blobs]
+        mock_minio.get_object.side_effect = lambda bucket, name: MagicMock(**{"read.return_value": blobs[name]})
+        return mock_minio
+
+    @patch('schedule_service.db_connection')
+    def test_import_legacy_schedules(self, mock_db_connection):
+        mock_connection, mock_cursor = self.mock_cursor(mock_db_connection)
+        # the second schedule of user 1 is already in the database
+        rowcounts = iter([-1, 1, 0, 1])
+        mock_cursor.execute.side_effect = lambda *args: setattr(mock_cursor, "rowcount", next(rowcounts, None))
+        minio = self.mock_minio({
+            "1/weekly_scheduling.json": make_schedule(id=1, name="weekly").model_dump_json().encode(),
+            "1/daily_scheduling.json": make_schedule(id=2, name="daily").model_dump_json().encode(),
+            "2/weekly_scheduling.json": make_schedule(id=1, name="weekly").model_dump_json().encode(),
+            "1/settings.json": b"{}",
+            "3/broken_scheduling.json": b"{",
+        })
+
+        self.assertEqual(import_legacy_schedules(minio), 2)
+
+        lock, *inserts = mock_cursor.execute.call_args_list
+        self.assertIn("pg_advisory_xact_lock", lock[0][0])
+        self.assertEqual(len(inserts), 3)
+        query, values = inserts[0][0]
+        self.assertIn("NOT EXISTS (SELECT 1 FROM ReportSchedules WHERE UserID = %s AND Name = %s)", query)
+        self.assertIn("EXISTS (SELECT 1 FROM Users WHERE UserID = %s)", query)
+        self.assertEqual([call[0][1][:2] for call in inserts], [(1, "weekly"), (1, "daily"), (2, "weekly")])
+        self.assertEqual(values[3:], (1, 1, "weekly"))
+        self.assertNotIn("id", json.loads(values[2]))
+        mock_connection.commit.assert_called_once()
+
+    @patch('schedule_service.db_connection')
+    def test_import_without_legacy_schedules(self, mock_db_connection):
+        minio = self.mock_minio({"1/settings.json": b"{}"})
+
+        self.assertEqual(import_legacy_schedules(minio), 0)
+
+        mock_db_connection.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import asyncio
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from single_flight import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_are_coalesced(self):
+        calls = []
+
+        async def call(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value
+
+        async def scenario():
+            single_flight = SingleFlight()
+            results = await asyncio.gather(
+                single_flight.do("a", lambda: call(1)),
+                single_flight.do("a", lambda: call(2)),
+                single_flight.do("b", lambda: call(3)),
+            )
+            return results, single_flight.in_flight()
+
+        results, in_flight = asyncio.run(scenario())
+
+        self.assertEqual(results, [1, 1, 3])
+        self.assertEqual(calls, [1, 3])
+        self.assertEqual(in_flight, 0)
+
+    def test_sequential_calls_are_not_cached(self):
+        calls = []
+
+        async def call():
+            calls.append(1)
+            return len(calls)
+
+        async def scenario():
+            single_flight = SingleFlight()
+            return [await single_flight.do("a", call), await single_flight.do("a", call)]
+
+        self.assertEqual(asyncio.run(scenario()), [1, 2])
+
+    def test_exception_is_shared(self):
+        async def call():
+            await asyncio.sleep(0.01)
+            raise ValueError("downstream failed")
+
+        async def scenario():
+            single_flight = SingleFlight()
+            return await asyncio.gather(single_flight.do("a", call), single_flight.do("a", call),
+                                        return_exceptions=True)
+
+        results = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    def test_cancelled_caller_does_not_cancel_others(self):
+        async def call():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        async def scenario():
+            single_flight = SingleFlight()
+            first = asyncio.ensure_future(single_flight.do("a", call))
+            second = asyncio.ensure_future(single_flight.do("a", call))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(scenario()), "done")
+
+if __name__ == '__main__':
+    unittest.main()
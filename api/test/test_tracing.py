@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import httpx
+from fastapi import FastAPI
+
+import tracing
+from tracing import FileExporter, InMemoryCollector, TracingMiddleware, current_span, format_traces, inject, \
+    instrument_http_clients, parse_traceparent, set_exporter, start_span, traced
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+REPOSITORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+TRACING_COPIES = [os.path.join(REPOSITORY, path) for path in
+                  ("data-processing/tracing.py", "kb/src/tracing.py", "kpi-engine/src/tracing.py", "rag/tracing.py")]
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.collector = InMemoryCollector()
+        self.previous = set_exporter(self.collector)
+
+    def tearDown(self):
+        set_exporter(self.previous)
+
+    def test_parse_traceparent(self):
+        self.assertEqual(parse_traceparent("00-" + TRACE_ID + "-" + PARENT_ID + "-01"), (TRACE_ID, PARENT_ID))
+        self.assertEqual(parse_traceparent("01-" + TRACE_ID + "-" + PARENT_ID + "-01-future"), (TRACE_ID, PARENT_ID))
+        self.assertIsNone(parse_traceparent(None))
+        self.assertIsNone(parse_traceparent("00-" + TRACE_ID + "-" + PARENT_ID))
+        self.assertIsNone(parse_traceparent("ff-" + TRACE_ID + "-" + PARENT_ID + "-01"))
+        self.assertIsNone(parse_traceparent("00-" + "0" * 32 + "-" + PARENT_ID + "-01"))
+        self.assertIsNone(parse_traceparent("00-" + TRACE_ID + "-" + PARENT_ID + "-01-extra"))
+
+    def test_nested_spans(self):
+        with start_span("request", "00-" + TRACE_ID + "-" + PARENT_ID + "-01") as parent:
+            with start_span("postgres") as child:
+                self.assertIs(current_span(), child)
+                self.assertEqual(inject({"a": "b"}), {"a": "b", "traceparent": child.traceparent()})
+            self.assertIs(current_span(), parent)
+        self.assertIsNone(current_span())
+        self.assertEqual(inject(), {})
+
+        child_dict, parent_dict = self.collector.spans()
+        self.assertEqual(parent_dict["traceId"], TRACE_ID)
+        self.assertEqual(parent_dict["parentId"], PARENT_ID)
+        self.assertEqual(child_dict["traceId"], TRACE_ID)
+        self.assertEqual(child_dict["parentId"], parent.span_id)
+        self.assertEqual(child.traceparent(), "00-" + TRACE_ID + "-" + child.span_id + "-01")
+
+    def test_failed_span(self):
+        with self.assertRaises(ValueError):
+            with start_span("druid.query"):
+                raise ValueError("bad query")
+        span, = self.collector.spans()
+        self.assertEqual(span["status"], "error")
+        self.assertEqual(span["error"], "ValueError: bad query")
+
+    def test_traced_coroutine(self):
+        @traced("llm.invoke", model="test")
+        async def invoke():
+            return current_span().name
+
+        self.assertEqual(asyncio.run(invoke()), "llm.invoke")
+        span, = self.collector.spans()
+        self.assertEqual(span["attributes"], {"model": "test"})
+
+    def test_middleware_continues_the_trace_downstream(self):
+        instrument_http_clients()
+        received = {}
+
+        downstream = FastAPI()
+
+        @downstream.get("/kpi")
+        async def kpi():
+            return {"ok": True}
+
+        downstream.add_middleware(TracingMiddleware)
+
+        upstream = FastAPI()
+
+        @upstream.get("/dashboard")
+        async def dashboard():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=downstream), base_url="http://kpi") as client:
+                response = await client.get("/kpi")
+            received["traceparent"] = response.headers["traceparent"]
+            return {"ok": True}
+
+        upstream.add_middleware(TracingMiddleware)
+
+        async def scenario():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=upstream), base_url="http://api") as client:
+                return await client.get("/dashboard", headers={"traceparent": "00-" + TRACE_ID + "-" + PARENT_ID + "-01"})
+
+        response = asyncio.run(scenario())
+
+        self.assertEqual(response.status_code, 200)
+        spans = {span["name"]: span for span in self.collector.spans(TRACE_ID)}
+        self.assertEqual(set(spans), {"HTTP GET api", "GET /dashboard", "HTTP GET kpi", "GET /kpi"})
+        # the client continues the trace context set on the request
+        self.assertEqual(spans["HTTP GET api"]["parentId"], PARENT_ID)
+        self.assertEqual(spans["GET /dashboard"]["parentId"], spans["HTTP GET api"]["spanId"])
+        self.assertEqual(spans["HTTP GET kpi"]["parentId"], spans["GET /dashboard"]["spanId"])
+        self.assertEqual(spans["GET /kpi"]["parentId"], spans["HTTP GET kpi"]["spanId"])
+        self.assertEqual(spans["GET /kpi"]["attributes"]["http.status_code"], 200)
+        self.assertEqual(response.headers["traceparent"],
+                         "00-" + TRACE_ID + "-" + spans["GET /dashboard"]["spanId"] + "-01")
+        self.assertEqual(received["traceparent"], "00-" + TRACE_ID + "-" + spans["GET /kpi"]["spanId"] + "-01")
+
+    def test_file_exporter_and_format(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces.jsonl")
+            exporter = FileExporter(path)
+            set_exporter(exporter)
+            with start_span("GET /reports"):
+                with start_span("minio.get_object"):
+                    pass
+            exporter.close()
+            with open(path, encoding="utf-8") as file:
+                spans = [json.loads(line) for line in file]
+
+        self.assertEqual([span["name"] for span in spans], ["minio.get_object", "GET /reports"])
+        lines = format_traces(spans).splitlines()
+        self.assertEqual(lines[0], "trace " + spans[0]["traceId"])
+        self.assertTrue(lines[1].startswith("  [" + tracing.SERVICE_NAME + "] GET /reports "))
+        self.assertTrue(lines[2].startswith("    [" + tracing.SERVICE_NAME + "] minio.get_object "))
+
+    def test_default_exporter(self):
+        with patch.object(tracing, "TRACE_EXPORTER", "none"):
+            self.assertIsNone(tracing._default_exporter())
+        with patch.object(tracing, "TRACE_EXPORTER", "memory"):
+            self.assertIs(tracing._default_exporter(), tracing.collector)
+        self.assertEqual(tracing._service_directory(), "api")
+
+    @unittest.skipUnless(all(os.path.exists(path) for path in TRACING_COPIES), "not in the repository")
+    def test_copies_are_identical(self):
+        # the services are built from their own directories, each has a copy of the module
+        with open(tracing.__file__, "rb") as file:
+            source = file.read()
+        for path in TRACING_COPIES:
+            with open(path, "rb") as file:
+                self.assertEqual(file.read(), source, path + " differs from api/src/tracing.py, copy it again")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,75 +5,171 @@ from unittest.mock import patch, MagicMock
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 
-from user_settings_service import persist_user_settings, retrieve_user_settings, verify_user_presence
+from user_settings_service import persist_user_settings, retrieve_user_settings, verify_user_presence, \
+    load_dashboard_settings, persist_dashboard_settings, update_user_settings, settings_cache, SettingsCache
 
 class TestUserSettingsService(unittest.TestCase):
 
-    @patch('user_settings_service.get_db_connection')
-    @patch('user_settings_service.verify_user_presence')
-    def test_persist_user_settings_success(self, mock_verify_user_presence, mock_get_db_connection):
-        mock_verify_user_presence.return_value = True
+    def setUp(self):
+        settings_cache.invalidate()
+
+    @patch('user_settings_service.db_connection')
+    def test_persist_user_settings_success(self, mock_db_connection):
         mock_cursor = MagicMock()
         mock_connection = MagicMock()
-        mock_get_db_connection.return_value = (mock_connection, mock_cursor)
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
+        mock_cursor.fetchone.return_value = (1,)
 
         result = persist_user_settings(1, {"theme": "dark"})
         self.assertTrue(result)
         mock_cursor.execute.assert_called_once()
+        self.assertIn("RETURNING UserID", mock_cursor.execute.call_args[0][0])
         mock_connection.commit.assert_called_once()
 
-    @patch('user_settings_service.get_db_connection')
-    @patch('user_settings_service.verify_user_presence')
-    def test_persist_user_settings_user_not_present(self, mock_verify_user_presence, mock_get_db_connection):
-        mock_verify_user_presence.return_value = False
+    @patch('user_settings_service.db_connection')
+    def test_persist_user_settings_user_not_present(self, mock_db_connection):
+        mock_cursor = MagicMock()
+        mock_connection = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
+        mock_cursor.fetchone.return_value = None
 
         result = persist_user_settings(1, {"theme": "dark"})
         self.assertFalse(result)
-        mock_get_db_connection.assert_not_called()
+        mock_cursor.execute.assert_called_once()
+        self.assertIsNone(settings_cache.get("UserSettings", 1))
 
-    @patch('user_settings_service.get_db_connection')
-    def test_retrieve_user_settings_success(self, mock_get_db_connection):
+    @patch('user_settings_service.db_connection')
+    def test_retrieve_user_settings_success(self, mock_db_connection):
         mock_cursor = MagicMock()
         mock_connection = MagicMock()
-        mock_get_db_connection.return_value = (mock_connection, mock_cursor)
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
         mock_cursor.fetchone.return_value = ('{"theme": "dark"}',)
 
         result = retrieve_user_settings(1)
         self.assertEqual(result, {"theme": "dark"})
         mock_cursor.execute.assert_called_once()
 
-    @patch('user_settings_service.get_db_connection')
-    def test_retrieve_user_settings_no_settings(self, mock_get_db_connection):
+    @patch('user_settings_service.db_connection')
+    def test_retrieve_user_settings_no_settings(self, mock_db_connection):
         mock_cursor = MagicMock()
         mock_connection = MagicMock()
-        mock_get_db_connection.return_value = (mock_connection, mock_cursor)
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
         mock_cursor.fetchone.return_value = (None,)
 
         result = retrieve_user_settings(1)
         self.assertEqual(result, {})
         mock_cursor.execute.assert_called_once()
 
-    @patch('user_settings_service.get_db_connection')
-    def test_verify_user_presence_user_exists(self, mock_get_db_connection):
+    @patch('user_settings_service.db_connection')
+    def test_verify_user_presence_user_exists(self, mock_db_connection):
         mock_cursor = MagicMock()
         mock_connection = MagicMock()
-        mock_get_db_connection.return_value = (mock_connection, mock_cursor)
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
         mock_cursor.fetchone.return_value = (1,)
 
         result = verify_user_presence(1)
         self.assertTrue(result)
         mock_cursor.execute.assert_called_once()
 
-    @patch('user_settings_service.get_db_connection')
-    def test_verify_user_presence_user_not_exists(self, mock_get_db_connection):
+    @patch('user_settings_service.db_connection')
+    def test_verify_user_presence_user_not_exists(self, mock_db_connection):
         mock_cursor = MagicMock()
         mock_connection = MagicMock()
-        mock_get_db_connection.return_value = (mock_connection, mock_cursor)
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
         mock_cursor.fetchone.return_value = (0,)
 
         result = verify_user_presence(1)
         self.assertFalse(result)
         mock_cursor.execute.assert_called_once()
 
+    @patch('user_settings_service.db_connection')
+    def test_retrieve_user_settings_is_cached(self, mock_db_connection):
+        mock_cursor = MagicMock()
+        mock_connection = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
+        mock_cursor.fetchone.return_value = ({"theme": "dark"},)
+
+        self.assertEqual(retrieve_user_settings(1), {"theme": "dark"})
+        self.assertEqual(retrieve_user_settings("1"), {"theme": "dark"})
+        mock_cursor.execute.assert_called_once()
+
+    @patch('user_settings_service.db_connection')
+    def test_persist_writes_through_the_cache(self, mock_db_connection):
+        mock_cursor = MagicMock()
+        mock_connection = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
+        mock_cursor.fetchone.return_value = (1,)
+
+        persist_dashboard_settings(1, {"dashboards": []})
+        persist_user_settings(1, {"theme": "light"})
+
+        self.assertEqual(load_dashboard_settings(1), {"dashboards": []})
+        self.assertEqual(retrieve_user_settings(1), {"theme": "light"})
+        self.assertEqual(mock_cursor.execute.call_count, 2)
+
+    @patch('user_settings_service.db_connection')
+    def test_update_user_settings_merges(self, mock_db_connection):
+        mock_cursor = MagicMock()
+        mock_connection = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
+        mock_cursor.fetchone.return_value = ({"theme": "dark", "language": "en"},)
+
+        settings = update_user_settings(1, {"language": "en"})
+
+        self.assertEqual(settings, {"theme": "dark", "language": "en"})
+        self.assertIn("|| %s", mock_cursor.execute.call_args[0][0])
+        self.assertEqual(retrieve_user_settings(1), settings)
+        mock_cursor.execute.assert_called_once()
+
+        mock_cursor.fetchone.return_value = None
+        self.assertIsNone(update_user_settings(2, {"language": "en"}))
+
+    @patch('user_settings_service.db_connection')
+    def test_write_during_a_read_is_not_overwritten(self, mock_db_connection):
+        mock_cursor = MagicMock()
+        mock_connection = MagicMock()
+        mock_db_connection.return_value.__enter__.return_value = (mock_connection, mock_cursor)
+
+        def read_then_write():
+            # another request saves new settings after the read, before the read is cached
+            settings_cache.set("UserSettings", 1, {"theme": "light"})
+            return ({"theme": "dark"},)
+        mock_cursor.fetchone.side_effect = read_then_write
+
+        self.assertEqual(retrieve_user_settings(1), {"theme": "light"})
+        self.assertEqual(settings_cache.get("UserSettings", 1), {"theme": "light"})
+
+    def test_add_checks_and_inserts_under_one_lock(self):
+        cache = SettingsCache()
+        acquisitions = []
+
+        class CountingLock(object):
+            def __init__(self, lock):
+                self.lock = lock
+
+            def __enter__(self):
+                acquisitions.append(1)
+                return self.lock.__enter__()
+
+            def __exit__(self, *exc_info):
+                return self.lock.__exit__(*exc_info)
+        cache._lock = CountingLock(cache._lock)
+
+        self.assertEqual(cache.add("UserSettings", 1, {"theme": "dark"}), {"theme": "dark"})
+        self.assertEqual(len(acquisitions), 1)
+        self.assertEqual(cache.get("UserSettings", 1), {"theme": "dark"})
+
+    def test_cache_is_bounded(self):
+        cache = SettingsCache(max_entries=2)
+        cache.set("UserSettings", 1, {"a": 1})
+        cache.set("UserSettings", 2, {"b": 2})
+        cache.get("UserSettings", 1)
+        cache.set("UserSettings", 3, {"c": 3})
+
+        self.assertEqual(cache.get("UserSettings", 1), {"a": 1})
+        self.assertIsNone(cache.get("UserSettings", 2))
+        # a read does not replace settings cached by a write
+        self.assertEqual(cache.add("UserSettings", 3, {"c": 0}), {"c": 3})
+
 if __name__ == '__main__':
     unittest.main()
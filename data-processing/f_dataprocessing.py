@@ -10,7 +10,6 @@ import xgboost as xgb
 from xgboost import XGBRegressor
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import GridSearchCV
-from sklearn.model_selection import ParameterGrid
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 from model import Severity, Alert
@@ -28,6 +27,7 @@ import requests
 from datetime import datetime, timedelta
 
 from XAI_forecasting import ForecastExplainer
+import xgb_search
 from storage.storage_operations import insert_model_to_storage, retrieve_model_from_storage
 
 
@@ -44,6 +44,21 @@ from storage.storage_operations import insert_model_to_storage, retrieve_model_f
 
 observation_window = 15
 
+# threads of an xgboost training, all the cores if None. The training workers set it, so that they
+# share the cores instead of each using all of them
+xgb_nthread = None
+
+_druid_sessions = {}  # process ID -> requests.Session, every worker process keeps its own connections
+
+def druid_session():
+  """
+  Returns the HTTP session of this process to the Druid router, created at the first call.
+  """
+  session = _druid_sessions.get(os.getpid())
+  if session is None:
+    session = _druid_sessions[os.getpid()] = requests.Session()
+  return session
+
 def execute_druid_query(body):
     """
     Executes a SQL query on a Druid instance.
@@ -57,7 +72,7 @@ def execute_druid_query(body):
     }
     url = "http://router:8888/druid/v2/sql"
     try:
-        response = requests.post(url, headers=headers, json=body)
+        response = druid_session().post(url, headers=headers, json=body)
         response.raise_for_status()  # Raise an error for bad status codes
         return response.json()  # Return the JSON response
     except requests.exceptions.RequestException as e:
@@ -285,80 +300,17 @@ def optimize_ARIMA(endog, order_list, d):
 
 def xgboost_parameter_select(X_train,y_train):
   """
-  Perform hyperparameter tuning for XGBoost.
+  Perform hyperparameter tuning for XGBoost, with the search method configured in xgb_search
+  (successive halving over the boosting rounds by default).
 
   :param X_train: Training features
   :param y_train: Training labels
-  :return: The best XGBoost model
+  :return: The best XGBoost model, and the budget and outcome of the search
   """
-  # Define the XGBoost regressor
-  xgb_model = XGBRegressor(objective="reg:squarederror", random_state=42)
-
-  # Define a small parameter grid
-  param_grid = {
-      "n_estimators": [50, 100, 200, 300, 400],
-      "max_depth": [3, 5, 7],
-      "learning_rate": [0.01, 0.1, 0.2],
-  }
-  param_combinations = list(ParameterGrid(param_grid))
-  # ParameterGrid
-  # Set up GridSearchCV
-  # grid_search = GridSearchCV(estimator=xgb_model, param_grid=param_grid, cv=3, scoring="neg_mean_squared_error", verbose=1)
-
-  # Perform the grid search
-  # grid_search.fit(X_train, y_train)
-
-  # Best parameters and model performance
-  # print("Best Parameters:", grid_search.best_params_)
-
-  # Data preparation (replace with your dataset)
-  dtrain = xgb.DMatrix(X_train, label=y_train)
-
-  # Perform cross-validation
-  best_params = None
-  best_score = float("inf")
-  best_model = None
-
-  for params in param_combinations:
-      # Create XGBoost parameters
-      xgb_params = {
-          "max_depth": params["max_depth"],
-          "eta": params["learning_rate"],
-          "objective": "reg:squarederror",
-      }
-
-      # Perform cross-validation
-      cv_results = xgb.cv(
-          params=xgb_params,
-          dtrain=dtrain,
-          num_boost_round=params["n_estimators"],
-          nfold=3,
-          metrics="rmse",
-          early_stopping_rounds=10,
-          seed=42,
-      )
-
-      # Extract the best RMSE score
-      mean_rmse = cv_results["test-rmse-mean"].min()
-      best_iteration = cv_results["test-rmse-mean"].idxmin()
-
-      # Update best parameters if score improves
-      if mean_rmse < best_score:
-          best_score = mean_rmse
-          best_params = params
-          best_model = xgb.train(
-            params=xgb_params,
-            dtrain=dtrain,
-            num_boost_round=best_iteration + 1,  # Use the optimal number of iterations
-        )
-
-    # Print the best parameters and score
-    # print("Best Parameters:", best_params)
-    # print("Best RMSE:", best_score)
-
-
-
-  return best_model
+  booster, search = xgb_search.select(X_train, y_train, nthread=xgb_nthread)
+  print(f"xgboost {search['method']} search: {search['best_params']} in {search['seconds']} s, "
+        f"{search['boosting_rounds']} boosting rounds")
+  return booster, search
 
 
 def custom_tts(data, labels, window_size = 20):
@@ -497,14 +449,15 @@ def characterize_KPI(machine, kpi):
       # model.fit(X_train, y_train)
 
       # booster = model.get_booster()
-      booster = xgboost_parameter_select(X_train,y_train)
+      booster, search = xgboost_parameter_select(X_train,y_train)
       model_bytes = booster.save_raw()
       encoded_model = base64.b64encode(model_bytes).decode('utf-8')
       a_dict['model'] = {
         'name': 'xgboost',
         'xgb_bytes': encoded_model,
         'metadata': {
-            'trained_on': str(datetime.today().date())},
+            'trained_on': str(datetime.today().date()),
+            'search': search},
             # 'hyperparameters': model.get_params()},
       }
     ############################
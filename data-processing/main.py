@@ -2,15 +2,19 @@ import f_dataprocessing
 import uvicorn
 
 from storage.storage_operations import retrieve_all_models_from_storage
+from training_jobs import TrainingJobs
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, Depends
+from fastapi.responses import ORJSONResponse
+from fastapi import FastAPI, Depends, HTTPException
+from brotli_asgi import BrotliMiddleware
 import os
 import datetime
 import asyncio
 
 from api_auth.api_auth import get_verify_api_key
+from tracing import TracingMiddleware, instrument_http_clients
 
-from model import Json_out, Json_in, Json_out_el, LimeExplainationItem, Severity
+from model import Json_out, Json_in, Severity
 from dotenv import load_dotenv
 from pathlib import Path
 from typing import List
@@ -67,10 +71,17 @@ async def lifespan(app: FastAPI):
     try:
         yield
     finally:
+        training_jobs.shutdown()
         scheduler_task.cancel()
         await scheduler_task
 
-app = FastAPI(lifespan = lifespan)
+app = FastAPI(lifespan = lifespan, default_response_class=ORJSONResponse)
+
+# the forecast models are trained in a pool of worker processes
+training_jobs = TrainingJobs()
+
+app.add_middleware(BrotliMiddleware, minimum_size=int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 1024)),
+                   gzip_fallback=True)
 
 app.add_middleware(
     CORSMiddleware,
@@ -80,6 +91,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# added last, so that the server span covers the other middlewares
+app.add_middleware(TracingMiddleware)
+instrument_http_clients()
+
 env_path = Path(__file__).resolve().parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
@@ -104,22 +119,59 @@ def retrieve_models(api_key: str = Depends(get_verify_api_key(["ai-agent","api-l
     return availableModels
 
 @app.post("/data-processing/train_models")
-def train_selected_models(JSONS: Json_in,api_key: str = Depends(get_verify_api_key(["ai-agent","api-layer"]))):
+def train_selected_models(JSONS: Json_in, background: bool = False,
+                          api_key: str = Depends(get_verify_api_key(["ai-agent","api-layer"]))):
     """
-    Creates and trains the forecast model for the requested machines/KPIs
+    Creates and trains the forecast model for the requested machines/KPIs.
+    The models are trained in parallel, in a pool of worker processes
 
     args:
     JSONS: the list of machine/kpi the user wishes to use
+    background: if True, returns at once the id of the training job, whose progress
+        is polled with /data-processing/train_models/{job_id}
+
+    Returns:
+    the status of the job, with the outcome of every trained model
+    """
+    job = training_jobs.submit([(json_in.Machine_Name, json_in.KPI_Name) for json_in in JSONS.value])
+    print(f"Starting training for the {len(job.models)} requested models in job {job.id}. this may take a while...")
+    if background:
+        return ORJSONResponse(job.getDict(), status_code=202)
+    job.wait()
+    summary = job.getDict()
+    print(f"training job {job.id} completed in {summary['elapsed']} s: {summary['outcomes']}")
+    return summary
+
+@app.get("/data-processing/train_models/{job_id}")
+def get_training_job(job_id: str, api_key: str = Depends(get_verify_api_key(["ai-agent","api-layer"]))):
+    """
+    Returns the progress of a training job: the models trained so far, with their outcome
+
+    args:
+    job_id: the id returned by /data-processing/train_models
     """
-    n_models = len(JSONS.value)
+    job = training_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return job.getDict()
 
-    print(f"Starting training for the {n_models} requested models. this may take a while...")
-    curr_model = 1
-    for json_in in JSONS.value:
-        f_dataprocessing.characterize_KPI(json_in.Machine_Name,json_in.KPI_Name )
-        print(f"{curr_model} model created of {n_models}")
-        curr_model+=1
-    print("all models created succesfully")
+def empty_prediction(machine, KPI_Name, error_message=""):
+    """
+    Returns the output of a prediction without results, as a dictionary with the fields of Json_out_el
+    """
+    return {
+        "Machine_Name": machine,
+        "KPI_Name": KPI_Name,
+        "Predicted_value": [],
+        "Lower_bound": [],
+        "Upper_bound": [],
+        "Confidence_score": [],
+        "Lime_explaination": [],
+        "Measure_unit": "",
+        "Date_prediction": [],
+        "Error_message": error_message,
+        "Forecast": True
+    }
 
 # ACTUAL PREDICTIONS
 @app.post("/data-processing/predict", response_model = Json_out)
@@ -155,19 +207,7 @@ def predict(JSONS: Json_in, api_key: str = Depends(get_verify_api_key(["ai-agent
             
             machine = json_in.Machine_Name#['Machine_Name'] #direttamente valore DB
             KPI_Name = json_in.KPI_Name#['KPI_Name']
-            json_out_el = Json_out_el(
-                Machine_Name= machine,
-                KPI_Name= KPI_Name,
-                Predicted_value=[],
-                Lower_bound=[],
-                Upper_bound=[],
-                Confidence_score=[],
-                Lime_explaination=[],
-                Measure_unit="",
-                Date_prediction=[],
-                Error_message="",
-                Forecast=True
-            )
+            json_out_el = empty_prediction(machine, KPI_Name)
             if json_in.Date_prediction is not None:
 
                 API_key = os.getenv('my_key')
@@ -190,56 +230,37 @@ def predict(JSONS: Json_in, api_key: str = Depends(get_verify_api_key(["ai-agent
                                 result = f_dataprocessing.make_prediction(machine, KPI_Name, horizon)
                                 print(f"the output data is: {result['Predicted_value']}")
 
-                                json_out_el.Predicted_value = result['Predicted_value']
-                                json_out_el.Lower_bound = result['Lower_bound']
-                                json_out_el.Upper_bound = result['Upper_bound']
-                                json_out_el.Measure_unit = KPI_data["unit_measure"]
-                                json_out_el.Confidence_score = result['Confidence_score']
+                                json_out_el['Predicted_value'] = result['Predicted_value']
+                                json_out_el['Lower_bound'] = result['Lower_bound']
+                                json_out_el['Upper_bound'] = result['Upper_bound']
+                                json_out_el['Measure_unit'] = KPI_data["unit_measure"]
+                                json_out_el['Confidence_score'] = result['Confidence_score']
 
                                 Lime_exp = []
                                 for exp in result['Lime_explaination']:
-                                    Lime_exp.append([LimeExplainationItem(date_info=item[0], value=item[1]) for item in exp])
-                                json_out_el.Lime_explaination = Lime_exp
-                                json_out_el.Date_prediction = result['Date_prediction']  
+                                    Lime_exp.append([{"date_info": str(item[0]), "value": float(item[1])} for item in exp])
+                                json_out_el['Lime_explaination'] = Lime_exp
+                                json_out_el['Date_prediction'] = result['Date_prediction']  
                             else:
                                 if status == -1:
-                                    json_out_el.Error_message = 'Error: the time-series is constant, forecast is meaningless'
+                                    json_out_el['Error_message'] = 'Error: the time-series is constant, forecast is meaningless'
                                 else:
-                                    json_out_el.Error_message = 'Error: could not preprocess the data'
+                                    json_out_el['Error_message'] = 'Error: could not preprocess the data'
 
                         else:
-                            json_out_el.Error_message = 'Error: invalid selected date for forecast'
+                            json_out_el['Error_message'] = 'Error: invalid selected date for forecast'
                     else:
-                        json_out_el.Error_message = f'Error:, the KPI {KPI_Name} of {machine} is not forecastable' 
+                        json_out_el['Error_message'] = f'Error:, the KPI {KPI_Name} of {machine} is not forecastable' 
                 else:
-                    json_out_el.Error_message = f'Error:, the KPI {KPI_Name} does not exist for {machine}'
+                    json_out_el['Error_message'] = f'Error:, the KPI {KPI_Name} does not exist for {machine}'
                 out_dicts.append(json_out_el)
             else:
-                json_out_el.Error_message = f'Error:, no date received for the prediction'
-        json_out = Json_out(
-        value=out_dicts
-        )
-        return json_out.dict()
+                json_out_el['Error_message'] = f'Error:, no date received for the prediction'
+        # the dictionaries have the shape of Json_out, they are serialized without validating them again
+        return ORJSONResponse({"value": out_dicts})
     else:
-        json_out_el = Json_out_el(
-        Machine_Name = "",
-        KPI_Name= "",
-        Predicted_value=[],
-        Lower_bound=[],
-        Upper_bound=[],
-        Confidence_score=[],
-        Lime_explaination=[],
-        Measure_unit="",
-        Date_prediction=[],
-        Error_message="Received input is not valid",
-        Forecast=True)
-
-        out_dicts.append(json_out_el)
-        
-        json_out = Json_out(
-        value=out_dicts
-        )
-        return json_out.dict()
+        out_dicts.append(empty_prediction("", "", "Received input is not valid"))
+        return ORJSONResponse({"value": out_dicts})
         
 def new_data_polling():
     """
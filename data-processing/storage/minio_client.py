@@ -6,10 +6,15 @@ from pathlib import Path
 env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
+_clients = {}  # process ID -> Minio, every worker process keeps its own connections
+
 def get_minio_client():
-    return Minio(
-        os.getenv('MINIO_HOST') + os.getenv('MINIO_ADDRESS'),
-        access_key=os.getenv('MINIO_ROOT_USER'),
-        secret_key=os.getenv('MINIO_ROOT_PASSWORD'),
-        secure=False
-    )
\ No newline at end of file
+    client = _clients.get(os.getpid())
+    if client is None:
+        client = _clients[os.getpid()] = Minio(
+            os.getenv('MINIO_HOST') + os.getenv('MINIO_ADDRESS'),
+            access_key=os.getenv('MINIO_ROOT_USER'),
+            secret_key=os.getenv('MINIO_ROOT_PASSWORD'),
+            secure=False
+        )
+    return client
\ No newline at end of file
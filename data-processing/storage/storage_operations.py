@@ -3,6 +3,8 @@ from .postgres_client import get_postgres_connection
 import io
 import json
 
+from tracing import start_span
+
 # Insert a JSON model into the bucket
 def insert_model_to_storage(bucket_name, file_name, json_data, kpi, machine_name):
     client = get_minio_client()
@@ -12,13 +14,14 @@ def insert_model_to_storage(bucket_name, file_name, json_data, kpi, machine_name
         json_bytes = json.dumps(json_data).encode('utf-8')
         
         # Upload JSON data
-        client.put_object(
-            bucket_name,
-            file_name,
-            data=io.BytesIO(json_bytes),
-            length=len(json_bytes),
-            content_type="application/json"
-        )
+        with start_span("minio.put_object", bucket=bucket_name, object=file_name, size=len(json_bytes)):
+            client.put_object(
+                bucket_name,
+                file_name,
+                data=io.BytesIO(json_bytes),
+                length=len(json_bytes),
+                content_type="application/json"
+            )
         print(f"File '{file_name}' uploaded to bucket '{bucket_name}'.")
 
         # Insert record into PostgreSQL
@@ -31,9 +34,10 @@ def insert_model_to_storage(bucket_name, file_name, json_data, kpi, machine_name
             VALUES (%s, %s, %s)
             RETURNING ID;
             """
-            cursor.execute(insert_query, (kpi, machine_name, model_path))
-            record_id = cursor.fetchone()[0]
-            conn.commit()
+            with start_span("postgres", **{"db.system": "postgresql"}):
+                cursor.execute(insert_query, (kpi, machine_name, model_path))
+                record_id = cursor.fetchone()[0]
+                conn.commit()
             print(f"Record inserted into PostgreSQL with ID: {record_id}")
         except Exception as e:
             print("Error inserting into PostgreSQL:", e)
@@ -56,8 +60,9 @@ def retrieve_model_from_storage(kpi, machine_name):
         SELECT ModelPath FROM Models
         WHERE KPI = %s AND MachineName = %s;
         """
-        cursor.execute(select_query, (kpi, machine_name))
-        result = cursor.fetchone()
+        with start_span("postgres", **{"db.system": "postgresql"}):
+            cursor.execute(select_query, (kpi, machine_name))
+            result = cursor.fetchone()
         if result is None:
             print(f"No record found for KPI: {kpi} and MachineName: {machine_name}")
             return None
@@ -66,10 +71,11 @@ def retrieve_model_from_storage(kpi, machine_name):
 
         # Retrieve JSON object from MinIO
         client = get_minio_client()
-        response = client.get_object(bucket_name, file_name)
-        json_data = json.load(response)
-        response.close()
-        response.release_conn()
+        with start_span("minio.get_object", bucket=bucket_name, object=file_name):
+            response = client.get_object(bucket_name, file_name)
+            json_data = json.load(response)
+            response.close()
+            response.release_conn()
         print(f"JSON data retrieved for KPI: {kpi} and MachineName: {machine_name}")
         return json_data
     except Exception as e:
@@ -90,8 +96,9 @@ def retrieve_all_models_from_storage():
         select_query = """
         SELECT KPI, MachineName, ModelPath FROM Models;
         """
-        cursor.execute(select_query)
-        results = cursor.fetchall()
+        with start_span("postgres", **{"db.system": "postgresql"}):
+            cursor.execute(select_query)
+            results = cursor.fetchall()
 
         all_models = []
         client = get_minio_client()
@@ -101,10 +108,11 @@ def retrieve_all_models_from_storage():
 
             try:
                 # Retrieve JSON object from MinIO
-                response = client.get_object(bucket_name, file_name)
-                json_data = json.load(response)
-                response.close()
-                response.release_conn()
+                with start_span("minio.get_object", bucket=bucket_name, object=file_name):
+                    response = client.get_object(bucket_name, file_name)
+                    json_data = json.load(response)
+                    response.close()
+                    response.release_conn()
 
                 all_models.append({
                     "KPI": kpi,
@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+import unittest
+from concurrent.futures import Future
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+
+import main
+from training_jobs import COMPLETED, CONSTANT, FAILED, QUEUED, RUNNING, TRAINED, TrainingJob, TrainingJobs
+
+API_KEY = "api-layer-key"
+
+
+def train(machine, kpi):
+    # runs in the worker processes, in place of the training of the model
+    if kpi == "crash":
+        os._exit(1)  # the worker dies, as when it is killed for running out of memory
+    if kpi == "error":
+        raise ValueError("no data for " + machine)
+    time.sleep(0.05)
+    return {"Machine_Name": machine, "KPI_Name": kpi, "status": CONSTANT if kpi == "constant" else TRAINED,
+            "error": None, "seconds": 0.05}
+
+
+class TestTrainingJob(unittest.TestCase):
+
+    def test_state_transitions(self):
+        job = TrainingJob([("Laser Cutter", "power"), ("Laser Cutter", "cost")])
+        futures = [Future(), Future()]
+        job.futures.extend(futures)
+        self.assertEqual(job.status(), QUEUED)
+
+        futures[0].set_running_or_notify_cancel()
+        self.assertEqual(job.status(), RUNNING)
+
+        futures[0].set_result(train("Laser Cutter", "power"))
+        job._finished("Laser Cutter", "power", futures[0])
+        self.assertEqual(job.status(), RUNNING)
+        self.assertFalse(job.wait(0))
+
+        futures[1].cancel()
+        job._finished("Laser Cutter", "cost", futures[1])
+        self.assertEqual(job.status(), COMPLETED)
+        self.assertTrue(job.wait(0))
+        summary = job.getDict()
+        self.assertEqual(summary["completed"], 2)
+        self.assertEqual(summary["outcomes"], {TRAINED: 1, FAILED: 1})
+        self.assertEqual(summary["results"][1]["error"], "cancelled")
+
+
+class TestTrainingJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs = TrainingJobs(workers=2, retention=60, train=train)
+
+    def tearDown(self):
+        self.jobs.shutdown()
+
+    def test_job_results(self):
+        job = self.jobs.submit([("Laser Cutter", "power"), ("Laser Cutter", "constant"), ("Riveting", "error"),
+                                ("Laser Cutter", "power")])
+
+        self.assertTrue(job.wait(60))
+        summary = job.getDict()
+        self.assertEqual(summary["status"], COMPLETED)
+        self.assertEqual(summary["total"], 3)
+        self.assertEqual(summary["completed"], 3)
+        self.assertEqual(summary["outcomes"], {TRAINED: 1, CONSTANT: 1, FAILED: 1})
+        results = {result["KPI_Name"]: result for result in summary["results"]}
+        self.assertEqual(results["error"]["error"], "no data for Riveting")
+        self.assertIs(self.jobs.get(job.id), job)
+
+    def test_empty_job(self):
+        job = self.jobs.submit([])
+
+        self.assertTrue(job.wait(0))
+        self.assertEqual(job.getDict()["status"], COMPLETED)
+
+    def test_recovers_from_a_dead_worker(self):
+        broken = self.jobs.submit([("Laser Cutter", "crash")])
+        self.assertTrue(broken.wait(60))
+        result, = broken.getDict()["results"]
+        self.assertEqual(result["status"], FAILED)
+
+        job = self.jobs.submit([("Laser Cutter", "power"), ("Riveting", "power")])
+
+        self.assertTrue(job.wait(60))
+        self.assertEqual(job.getDict()["outcomes"], {TRAINED: 2})
+
+
+@patch('api_auth.api_auth.retrieve_keys', side_effect={"api-layer": API_KEY}.get)
+class TestTrainingEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs = TrainingJobs(workers=1, retention=60, train=train)
+        patcher = patch.object(main, "training_jobs", self.jobs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.jobs.shutdown)
+        # without the with block the lifespan, and its Druid polling, does not run
+        self.client = TestClient(main.app)
+
+    def post(self, models, **params):
+        return self.client.post("/data-processing/train_models", params=params, headers={"X-API-Key": API_KEY},
+                                json={"value": [{"Machine_Name": machine, "KPI_Name": kpi} for machine, kpi in models]})
+
+    def get(self, job_id):
+        return self.client.get("/data-processing/train_models/" + job_id, headers={"X-API-Key": API_KEY})
+
+    def test_train_and_wait(self, _):
+        response = self.post([("Laser Cutter", "power"), ("Riveting", "error")])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], COMPLETED)
+        self.assertEqual(response.json()["outcomes"], {TRAINED: 1, FAILED: 1})
+
+    def test_train_in_background_and_poll(self, _):
+        response = self.post([("Laser Cutter", "power"), ("Laser Cutter", "constant")], background="true")
+
+        self.assertEqual(response.status_code, 202)
+        self.assertIn(response.json()["status"], (QUEUED, RUNNING))
+        self.assertEqual(response.json()["total"], 2)
+        job_id = response.json()["jobId"]
+        self.assertTrue(self.jobs.get(job_id).wait(60))
+        response = self.get(job_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], COMPLETED)
+        self.assertEqual(response.json()["outcomes"], {TRAINED: 1, CONSTANT: 1})
+
+    def test_unknown_job(self, _):
+        self.assertEqual(self.get("missing").status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
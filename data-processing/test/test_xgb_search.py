@@ -0,0 +1,136 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pandas as pd
+
+import f_dataprocessing
+import xgb_search
+from xgb_search import EARLY_STOPPING_ROUNDS, NFOLD, Candidate, Search, cv_folds, select
+
+# a grid small enough for the tests: the depth 1 trees cannot learn the product of the features, and the
+# small learning rate is far from converged in 81 rounds, so the best candidate is max_depth 4, eta 0.3
+PARAM_GRID = {
+    "n_estimators": [9, 27, 81],
+    "max_depth": [1, 4],
+    "learning_rate": [0.01, 0.3],
+}
+
+
+def dataset(rows=300, noise=0.1, seed=0):
+    rng = np.random.RandomState(seed)
+    X = rng.uniform(-1, 1, size=(rows, 4))
+    y = X[:, 0] * X[:, 1] * 4 + X[:, 2] + rng.normal(scale=noise, size=rows)
+    return X, y
+
+
+@patch.dict(xgb_search.PARAM_GRID, PARAM_GRID)
+class TestXgbSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.X, self.y = dataset()
+
+    def test_cv_folds(self):
+        folds = cv_folds(10)
+
+        self.assertEqual(len(folds), NFOLD)
+        self.assertEqual(sorted(np.concatenate([test for _, test in folds])), list(range(10)))
+        for train, test in folds:
+            self.assertEqual(sorted(np.concatenate([train, test])), list(range(10)))
+
+    def test_train_to_stops_at_the_round_budget(self):
+        candidate = Candidate(4, 0.3, self.X, self.y, cv_folds(len(self.y)), nthread=1)
+
+        self.assertEqual(candidate.train_to(5), 5 * NFOLD)
+        self.assertEqual(candidate.rounds, 5)
+        self.assertEqual(len(candidate.curve()), 5)
+        # the training continues from the trained boosters
+        self.assertEqual(candidate.train_to(8), 3 * NFOLD)
+        self.assertEqual(candidate.rounds, 8)
+        self.assertEqual(candidate.train_to(8), 0)
+        rmse, rounds = candidate.best()
+        self.assertEqual(rmse, min(candidate.curve()))
+        self.assertLessEqual(rounds, 8)
+
+    def test_train_to_stops_early(self):
+        # pure noise: the validation error stops improving after a few rounds
+        X, _ = dataset()
+        y = np.random.RandomState(1).normal(size=len(X))
+        candidate = Candidate(6, 1.0, X, y, cv_folds(len(y)), nthread=1)
+
+        trained = candidate.train_to(1000)
+
+        self.assertLess(candidate.rounds, 1000)
+        self.assertTrue(candidate.stopped())
+        self.assertEqual(candidate.rounds - candidate.best()[1], EARLY_STOPPING_ROUNDS)
+        self.assertEqual(trained, candidate.rounds * NFOLD)
+        self.assertEqual(candidate.train_to(1000), 0)
+
+    def test_halving_keeps_the_best_candidates(self):
+        search = Search(self.X, self.y, parallel=2, nthread=1)
+        candidates = [search.candidate(max_depth, learning_rate) for max_depth in PARAM_GRID["max_depth"]
+                      for learning_rate in PARAM_GRID["learning_rate"]]
+        try:
+            search.halving(candidates, 9, 81, 3)
+        finally:
+            search.pool.shutdown()
+
+        best = search.best()
+        self.assertEqual((best.max_depth, best.learning_rate), (4, 0.3))
+        self.assertEqual(best.best()[0], min(candidate.best()[0] for candidate in candidates))
+        # only the best of the first rung goes on to the next ones
+        self.assertEqual(sorted(candidate.rounds for candidate in candidates), [9, 9, 9, 81])
+        self.assertEqual(search.boosting_rounds, (9 * 3 + 81) * NFOLD)
+
+    def test_methods_select_the_best_candidate(self):
+        results = {method: select(self.X, self.y, method=method, eta=3, min_rounds=9, parallel=2, nthread=2)
+                   for method in ("grid", "halving", "hyperband")}
+
+        grid = results["grid"][1]
+        self.assertEqual(grid["candidates"], 4)
+        for method, (booster, search) in results.items():
+            self.assertEqual(search["method"], method)
+            self.assertEqual(search["best_params"], grid["best_params"])
+            self.assertEqual(search["best_params"]["max_depth"], 4)
+            self.assertEqual(search["best_params"]["learning_rate"], 0.3)
+            self.assertEqual(search["best_rmse"], grid["best_rmse"])
+            self.assertEqual(booster.num_boosted_rounds(), search["best_params"]["n_estimators"])
+        self.assertLess(results["halving"][1]["boosting_rounds"], grid["boosting_rounds"])
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            select(self.X, self.y, method="random")
+
+
+@patch.dict(xgb_search.PARAM_GRID, PARAM_GRID)
+class TestCharacterizeKPI(unittest.TestCase):
+
+    @patch('f_dataprocessing.save_model_data')
+    @patch('f_dataprocessing.data_load')
+    @patch('f_dataprocessing.load_model')
+    def test_search_is_stored_in_the_model_metadata(self, mock_load_model, mock_data_load, mock_save_model_data):
+        mock_load_model.return_value = f_dataprocessing.create_model_data()
+        days = pd.date_range("2024-01-01", periods=200, freq="D")
+        rng = np.random.RandomState(0)
+        values = 10 + np.sin(np.arange(len(days)) / 5) + rng.normal(scale=0.1, size=len(days))
+        mock_data_load.return_value = ([str(day.date()) for day in days], list(values))
+
+        self.assertEqual(f_dataprocessing.characterize_KPI("Laser Cutter", "power"), 0)
+
+        machine, kpi, stored = mock_save_model_data.call_args.args
+        self.assertEqual((machine, kpi), ("Laser Cutter", "power"))
+        self.assertEqual(stored["model"]["name"], "xgboost")
+        search = stored["model"]["metadata"]["search"]
+        self.assertEqual(search["method"], xgb_search.XGB_SEARCH_METHOD)
+        self.assertEqual(search["max_rounds"], 81)
+        self.assertEqual(search["nfold"], NFOLD)
+        self.assertEqual(set(search["best_params"]), {"max_depth", "learning_rate", "n_estimators"})
+        self.assertGreater(search["boosting_rounds"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
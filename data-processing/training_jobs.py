@@ -0,0 +1,198 @@
+"""
+Training of the forecast models in a pool of worker processes.
+
+Every model of a job is trained by its own task, so the models of a job, and of concurrent jobs, are trained
+in parallel. Every worker process opens its own Druid, MinIO and PostgreSQL connections.
+"""
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import f_dataprocessing
+
+TRAINING_WORKERS = int(os.getenv('TRAINING_WORKERS', os.cpu_count() or 1))
+TRAINING_JOB_RETENTION = float(os.getenv('TRAINING_JOB_RETENTION', 86400))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+
+# outcomes of the training of a model
+TRAINED = "trained"
+CONSTANT = "constant"
+NOT_PREPROCESSED = "preprocessing error"
+FAILED = "failed"
+
+
+def init_worker(threads):
+    """
+    Runs once in every worker process, before its first training.
+
+    :param threads: the threads of an xgboost training, so that the workers share the cores
+    """
+    f_dataprocessing.xgb_nthread = threads
+
+
+def train_model(machine, kpi):
+    """
+    Trains and stores the model of a KPI, in a worker process.
+
+    :param machine: the machine name
+    :param kpi: the KPI name
+    :return: the outcome of the training, as a dictionary
+    """
+    started = time.time()
+    error = None
+    try:
+        status = f_dataprocessing.characterize_KPI(machine, kpi)
+        outcome = TRAINED if status == 0 else CONSTANT if status == -1 else NOT_PREPROCESSED
+    except Exception as e:
+        outcome = FAILED
+        error = str(e)
+    return {
+        "Machine_Name": machine,
+        "KPI_Name": kpi,
+        "status": outcome,
+        "error": error,
+        "seconds": round(time.time() - started, 3),
+    }
+
+
+class TrainingJob(object):
+    """
+    State of the training of a list of models: the outcome of every model trained so far.
+    """
+    def __init__(self, models):
+        self.id = uuid.uuid4().hex
+        self.models = models
+        self.results = []  # in the order the trainings finish
+        self.futures = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def _finished(self, machine, kpi, future):
+        # called by the pool when the training of a model ends
+        if future.cancelled():
+            result = {"Machine_Name": machine, "KPI_Name": kpi, "status": FAILED, "error": "cancelled",
+                      "seconds": 0}
+        elif future.exception() is not None:
+            result = {"Machine_Name": machine, "KPI_Name": kpi, "status": FAILED, "error": str(future.exception()),
+                      "seconds": 0}
+        else:
+            result = future.result()
+        print(f"Training job {self.id}: model for {machine}, {kpi} {result['status']}")
+        with self._lock:
+            self.results.append(result)
+            if len(self.results) == len(self.models):
+                self.finished_at = time.time()
+                self._done.set()
+
+    def wait(self, timeout=None):
+        """
+        Waits for the end of the job.
+
+        :param timeout: the seconds to wait, forever if None
+        :return: True if the job ended
+        """
+        return self._done.wait(timeout)
+
+    def status(self):
+        if self._done.is_set():
+            return COMPLETED
+        if any(future.running() or future.done() for future in self.futures):
+            return RUNNING
+        return QUEUED
+
+    def getDict(self):
+        with self._lock:
+            results = list(self.results)
+            finished_at = self.finished_at
+        outcomes = {}
+        for result in results:
+            outcomes[result["status"]] = outcomes.get(result["status"], 0) + 1
+        return {
+            "jobId": self.id,
+            "status": self.status(),
+            "total": len(self.models),
+            "completed": len(results),
+            "outcomes": outcomes,
+            "elapsed": round((finished_at or time.time()) - self.created_at, 3),
+            "results": results,
+        }
+
+
+class TrainingJobs(object):
+    """
+    Trains the models in a pool of `workers` processes, by default one per core.
+
+    The workers are started with spawn, as forking a process that already ran xgboost may deadlock its
+    thread pool. The state of the finished jobs is kept for `retention` seconds, for the client to poll it.
+    `train` trains a model in a worker, from the machine and KPI names; it must be a module level function,
+    to be sent to the workers.
+    """
+    def __init__(self, workers: int = TRAINING_WORKERS, retention: float = TRAINING_JOB_RETENTION,
+                 train=train_model):
+        self.workers = max(1, workers)
+        self.retention = retention
+        self.train = train
+        self.jobs = {}  # job ID -> TrainingJob
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=init_worker, initargs=(threads,))
+        return self._pool
+
+    def submit(self, models):
+        """
+        Submits the training of a list of models.
+
+        :param models: the (machine, KPI) pairs to train, the repeated ones are trained once
+        :return: the TrainingJob, which ends when all the models are trained
+        """
+        models = list(dict.fromkeys(models))
+        with self._lock:
+            self._evict()
+            job = TrainingJob(models)
+            self.jobs[job.id] = job
+            if not models:
+                job.finished_at = time.time()
+                job._done.set()
+            for machine, kpi in models:
+                try:
+                    future = self._executor().submit(self.train, machine, kpi)
+                except BrokenProcessPool:
+                    # a worker died, e.g. out of memory: the pool is replaced for the next trainings
+                    print("The training pool is broken, starting a new one")
+                    self._pool.shutdown(wait=False)
+                    self._pool = None
+                    future = self._executor().submit(self.train, machine, kpi)
+                job.futures.append(future)
+                future.add_done_callback(lambda future, machine=machine, kpi=kpi: job._finished(machine, kpi, future))
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _evict(self):
+        expiry = time.time() - self.retention
+        for job_id in [job.id for job in self.jobs.values() if job.finished_at is not None and job.finished_at < expiry]:
+            del self.jobs[job_id]
+
+    def shutdown(self):
+        """
+        Stops the workers, the queued trainings are cancelled.
+        """
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,219 @@
+"""
+Hyperparameter search of the xgboost forecast models.
+
+The candidates are the (max_depth, learning_rate) pairs of PARAM_GRID. The number of boosting rounds is not
+searched as a separate dimension: a candidate is trained round after round, and the cross-validation score
+of every number of rounds up to the largest n_estimators is read off its learning curve. Training stops when
+the score does not improve for EARLY_STOPPING_ROUNDS rounds.
+
+The search methods:
+- halving: successive halving over boosting rounds. All the candidates are trained for `min_rounds`
+  rounds, the best 1/eta of them are trained for eta times more rounds, and so on up to the largest
+  n_estimators. A candidate kept in the next rung continues from its boosters instead of starting over.
+- hyperband: runs successive halving brackets with fewer candidates and more starting rounds, so that the
+  candidates that learn slowly are not all dropped after a few rounds. The brackets share the trained
+  boosters, a candidate is never trained twice for the same rounds.
+- grid: every candidate is trained up to the largest n_estimators.
+
+The candidates of a rung are evaluated in parallel, in threads: xgboost releases the GIL while training.
+"""
+import math
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import xgboost as xgb
+
+PARAM_GRID = {
+    "n_estimators": [50, 100, 200, 300, 400],
+    "max_depth": [3, 5, 7],
+    "learning_rate": [0.01, 0.1, 0.2],
+}
+NFOLD = 3
+EARLY_STOPPING_ROUNDS = 10
+SEED = 42
+
+XGB_SEARCH_METHOD = os.getenv('XGB_SEARCH_METHOD', 'halving')
+XGB_SEARCH_ETA = int(os.getenv('XGB_SEARCH_ETA', 3))
+XGB_SEARCH_MIN_ROUNDS = int(os.getenv('XGB_SEARCH_MIN_ROUNDS', min(PARAM_GRID["n_estimators"])))
+# candidates trained at the same time, 0 for one per core, up to the number of candidates
+XGB_SEARCH_PARALLEL = int(os.getenv('XGB_SEARCH_PARALLEL', 0))
+
+METHODS = ("halving", "hyperband", "grid")
+
+
+def cv_folds(n_rows, nfold=NFOLD, seed=SEED):
+    """
+    Splits the rows in shuffled folds, as xgb.cv does.
+
+    :param n_rows: the number of training rows
+    :return: list of (train indices, test indices), one per fold
+    """
+    indices = np.random.RandomState(seed).permutation(n_rows)
+    folds = np.array_split(indices, nfold)
+    return [(np.concatenate(folds[:i] + folds[i + 1:]), folds[i]) for i in range(nfold)]
+
+
+class Candidate(object):
+    """
+    Cross-validation of a pair of parameters, trained incrementally: one booster per fold, whose training
+    is continued round by round when the candidate gets more rounds.
+    """
+    def __init__(self, max_depth, learning_rate, X_train, y_train, folds, nthread=None):
+        self.max_depth = max_depth
+        self.learning_rate = learning_rate
+        self.params = {
+            "max_depth": max_depth,
+            "eta": learning_rate,
+            "objective": "reg:squarederror",
+            "eval_metric": "rmse",
+            "seed": SEED,
+        }
+        if nthread is not None:
+            self.params["nthread"] = nthread
+        # every candidate has its own matrices, as they are trained in different threads
+        self.folds = [(xgb.DMatrix(X_train[train], label=y_train[train]),
+                       xgb.DMatrix(X_train[test], label=y_train[test])) for train, test in folds]
+        self.boosters = [xgb.Booster(self.params, [dtrain, dtest]) for dtrain, dtest in self.folds]
+        self.curves = [[] for _ in folds]  # test RMSE after every round, per fold
+        self.rounds = 0
+
+    def curve(self):
+        """
+        Returns the mean test RMSE of the folds after every round, as the test-rmse-mean of xgb.cv.
+        """
+        return np.mean(self.curves, axis=0) if self.rounds else np.array([])
+
+    def best(self):
+        """
+        Returns the best mean RMSE and the number of rounds that reaches it, inf if not trained yet.
+        """
+        curve = self.curve()
+        if len(curve) == 0:
+            return float("inf"), 0
+        best_round = int(np.argmin(curve))
+        return float(curve[best_round]), best_round + 1
+
+    def stopped(self):
+        """
+        True if the score did not improve in the last EARLY_STOPPING_ROUNDS rounds.
+        """
+        _, best_rounds = self.best()
+        return self.rounds > 0 and self.rounds - best_rounds >= EARLY_STOPPING_ROUNDS
+
+    def train_to(self, rounds):
+        """
+        Continues the training of the folds up to `rounds` rounds, or less if the score stops improving.
+
+        :return: the rounds trained, summed over the folds
+        """
+        trained = 0
+        while self.rounds < rounds and not self.stopped():
+            for booster, curve, (dtrain, dtest) in zip(self.boosters, self.curves, self.folds):
+                booster.update(dtrain, self.rounds)
+                # e.g. "[12]\ttest-rmse:0.52"
+                curve.append(float(booster.eval(dtest, "test", self.rounds).rsplit(":", 1)[1]))
+            self.rounds += 1
+            trained += len(self.folds)
+        return trained
+
+
+class Search(object):
+    """
+    State of a search: the candidates trained so far, shared by the brackets of hyperband.
+    """
+    def __init__(self, X_train, y_train, parallel, nthread):
+        self.X_train = np.asarray(X_train)
+        self.y_train = np.asarray(y_train)
+        self.folds = cv_folds(len(self.y_train))
+        self.candidates = {}  # (max_depth, learning_rate) -> Candidate
+        self.nthread = nthread
+        self.pool = ThreadPoolExecutor(parallel)
+        self.boosting_rounds = 0
+
+    def candidate(self, max_depth, learning_rate):
+        key = (max_depth, learning_rate)
+        if key not in self.candidates:
+            self.candidates[key] = Candidate(max_depth, learning_rate, self.X_train, self.y_train, self.folds,
+                                             self.nthread)
+        return self.candidates[key]
+
+    def train(self, candidates, rounds):
+        self.boosting_rounds += sum(self.pool.map(lambda candidate: candidate.train_to(rounds), candidates))
+
+    def halving(self, candidates, min_rounds, max_rounds, eta):
+        """
+        Runs successive halving from `min_rounds` rounds, keeping the best 1/eta of the candidates per rung.
+        """
+        rounds = min(min_rounds, max_rounds)
+        while True:
+            self.train(candidates, rounds)
+            if rounds >= max_rounds:
+                return
+            candidates = sorted(candidates, key=lambda candidate: candidate.best()[0])
+            candidates = candidates[:max(1, len(candidates) // eta)]
+            rounds = min(max_rounds, rounds * eta)
+
+    def best(self):
+        return min(self.candidates.values(), key=lambda candidate: candidate.best()[0])
+
+
+def select(X_train, y_train, method=XGB_SEARCH_METHOD, eta=XGB_SEARCH_ETA, min_rounds=XGB_SEARCH_MIN_ROUNDS,
+           parallel=XGB_SEARCH_PARALLEL, nthread=None):
+    """
+    Searches the parameters of the xgboost model and trains it on all the data with the best ones.
+
+    :param X_train: training features
+    :param y_train: training labels
+    :param method: halving, hyperband or grid
+    :param eta: the fraction of the candidates kept in every rung is 1/eta, and the rounds grow eta times
+    :param min_rounds: the rounds of the candidates in the first rung
+    :param parallel: candidates trained at the same time, 0 for one per core
+    :param nthread: the threads of the search, shared by the parallel candidates, all the cores if None
+    :return: the trained booster, and the budget and outcome of the search as a dictionary
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown search method {method}, expected one of {', '.join(METHODS)}")
+    started = time.time()
+    grid = [(max_depth, learning_rate) for max_depth in PARAM_GRID["max_depth"]
+            for learning_rate in PARAM_GRID["learning_rate"]]
+    max_rounds = max(PARAM_GRID["n_estimators"])
+    threads = nthread or os.cpu_count() or 1
+    parallel = max(1, min(parallel or threads, len(grid)))
+    search = Search(X_train, y_train, parallel, max(1, threads // parallel))
+    try:
+        if method == "grid":
+            search.halving([search.candidate(*key) for key in grid], max_rounds, max_rounds, eta)
+        elif method == "halving":
+            search.halving([search.candidate(*key) for key in grid], min_rounds, max_rounds, eta)
+        else:
+            rng = random.Random(SEED)
+            s_max = int(math.log(max_rounds / min_rounds, eta)) if max_rounds > min_rounds else 0
+            for s in range(s_max, -1, -1):
+                n = min(len(grid), math.ceil((s_max + 1) / (s + 1) * eta ** s))
+                keys = rng.sample(grid, n)
+                search.halving([search.candidate(*key) for key in keys], max(1, round(max_rounds / eta ** s)),
+                               max_rounds, eta)
+    finally:
+        search.pool.shutdown()
+
+    best = search.best()
+    best_rmse, best_rounds = best.best()
+    params = dict(best.params, nthread=threads)
+    booster = xgb.train(params, xgb.DMatrix(search.X_train, label=search.y_train), num_boost_round=best_rounds)
+    return booster, {
+        "method": method,
+        "eta": eta,
+        "min_rounds": min_rounds,
+        "max_rounds": max_rounds,
+        "nfold": NFOLD,
+        "candidates": len(search.candidates),
+        "parallel": parallel,
+        "boosting_rounds": search.boosting_rounds,
+        "best_params": {"max_depth": best.max_depth, "learning_rate": best.learning_rate,
+                        "n_estimators": best_rounds},
+        "best_rmse": round(best_rmse, 6),
+        "seconds": round(time.time() - started, 3),
+    }
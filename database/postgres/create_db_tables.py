@@ -45,6 +45,269 @@ def get_postgres_cursor():
         print(f"Error connecting to PostgreSQL database: {error}")
         return None, None
 
+def create_tables(conn, cur):
+    """
+    Creates the tables and the functions managing the alert partitions, migrating the tables of older databases.
+
+    Args:
+        conn: The connection to the PostgreSQL database.
+        cur: A cursor of the connection.
+    """
+    # Queries for creating tables
+    create_table_queries = [
+        """
+        CREATE TABLE IF NOT EXISTS Users (
+        UserID SERIAL PRIMARY KEY,
+        Username VARCHAR(255) NOT NULL,
+        Email VARCHAR(255) NOT NULL,
+        Role VARCHAR(255) NOT NULL,
+        Password VARCHAR(255) NOT NULL,
+        SiteName VARCHAR(255) NOT NULL,
+        UserSettings JSONB,
+        UserDashboards JSONB,
+        UserSchedules TEXT
+        )
+        """,
+        # The settings of the databases created with TEXT columns are converted to JSONB
+        """
+        DO $$
+        BEGIN
+            IF (SELECT data_type FROM information_schema.columns
+                WHERE table_name = 'users' AND column_name = 'usersettings') = 'text' THEN
+                ALTER TABLE Users ALTER COLUMN UserSettings TYPE JSONB USING UserSettings::jsonb,
+                                  ALTER COLUMN UserDashboards TYPE JSONB USING UserDashboards::jsonb;
+            END IF;
+        END
+        $$
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Reports (
+        ReportID SERIAL PRIMARY KEY,
+        Name VARCHAR(100) NOT NULL,
+        Type VARCHAR(100) NOT NULL,
+        OwnerID INT NOT NULL,
+        GeneratedAt TIMESTAMP NOT NULL,
+        FilePath TEXT NOT NULL,
+        SiteName VARCHAR(100) NOT NULL,
+        Fingerprint CHAR(64),
+        FOREIGN KEY (OwnerID) REFERENCES Users(UserID)
+        )
+        """,
+        # Reports with the same fingerprint share the same PDF, generated once
+        """
+        ALTER TABLE Reports ADD COLUMN IF NOT EXISTS Fingerprint CHAR(64)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_reports_fingerprint ON Reports (Fingerprint, GeneratedAt)
+        """,
+        # The unpartitioned alert tables of older databases are renamed, with their indexes and sequences, and
+        # their rows are copied to the partitioned tables once created
+        """
+        DO $$
+        DECLARE
+            index_name TEXT;
+        BEGIN
+            IF to_regclass('alerts') IS NOT NULL
+               AND NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'alerts'::regclass) THEN
+                FOR index_name IN
+                    SELECT indexname FROM pg_indexes
+                    WHERE schemaname = current_schema() AND tablename IN ('alerts', 'alertrecipients')
+                LOOP
+                    EXECUTE format('ALTER INDEX %I RENAME TO %I', index_name, index_name || '_unpartitioned');
+                END LOOP;
+                ALTER SEQUENCE IF EXISTS alerts_alertid_seq RENAME TO alerts_unpartitioned_alertid_seq;
+                ALTER SEQUENCE IF EXISTS alertrecipients_id_seq RENAME TO alertrecipients_unpartitioned_id_seq;
+                ALTER TABLE IF EXISTS AlertRecipients RENAME TO AlertRecipients_unpartitioned;
+                ALTER TABLE Alerts RENAME TO Alerts_unpartitioned;
+            END IF;
+        END
+        $$
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Alerts (
+        AlertID SERIAL,
+        Title VARCHAR(100) NOT NULL,
+        Type VARCHAR(50) NOT NULL,
+        Description VARCHAR(255) NOT NULL,
+        TriggeredAt TIMESTAMP NOT NULL,
+        MachineName VARCHAR(50) NOT NULL,
+        isPush BOOLEAN DEFAULT FALSE,
+        Severity VARCHAR(10) NOT NULL
+        CHECK (Severity IN ('Low', 'Medium', 'High')),
+        PRIMARY KEY (AlertID, TriggeredAt)
+        ) PARTITION BY RANGE (TriggeredAt)
+        """,
+        # AlertRecipients is partitioned by the TriggeredAt of its alert, so that the partitions of a month
+        # are dropped together; for the same reason it has no foreign key to Alerts
+        """
+        CREATE TABLE IF NOT EXISTS AlertRecipients (
+        ID SERIAL,
+        AlertID INT NOT NULL,
+        UserID INT NOT NULL,
+        TriggeredAt TIMESTAMP NOT NULL,
+        Read BOOLEAN NOT NULL DEFAULT FALSE,
+        PRIMARY KEY (ID, TriggeredAt),
+        UNIQUE(AlertID, UserID, TriggeredAt),
+        FOREIGN KEY (UserID) REFERENCES Users(UserID) ON DELETE CASCADE
+        ) PARTITION BY RANGE (TriggeredAt)
+        """,
+        # The default partitions hold the alerts outside of the monthly partitions (e.g. replayed history)
+        """
+        CREATE TABLE IF NOT EXISTS Alerts_default PARTITION OF Alerts DEFAULT
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS AlertRecipients_default PARTITION OF AlertRecipients DEFAULT
+        """,
+        # The recipients take the TriggeredAt of their alert; the rows land in the default partitions, and
+        # create_alert_partitions moves those of the current months to the monthly partitions
+        """
+        DO $$
+        BEGIN
+            IF to_regclass('alerts_unpartitioned') IS NOT NULL THEN
+                INSERT INTO Alerts (AlertID, Title, Type, Description, TriggeredAt, MachineName, isPush, Severity)
+                SELECT AlertID, Title, Type, Description, TriggeredAt, MachineName, isPush, Severity
+                FROM Alerts_unpartitioned;
+                PERFORM setval(pg_get_serial_sequence('alerts', 'alertid'),
+                               COALESCE((SELECT MAX(AlertID) FROM Alerts), 0) + 1, false);
+                IF to_regclass('alertrecipients_unpartitioned') IS NOT NULL THEN
+                    INSERT INTO AlertRecipients (ID, AlertID, UserID, TriggeredAt, Read)
+                    SELECT r.ID, r.AlertID, r.UserID, a.TriggeredAt, r.Read
+                    FROM AlertRecipients_unpartitioned r JOIN Alerts_unpartitioned a ON a.AlertID = r.AlertID;
+                    PERFORM setval(pg_get_serial_sequence('alertrecipients', 'id'),
+                                   COALESCE((SELECT MAX(ID) FROM AlertRecipients), 0) + 1, false);
+                    DROP TABLE AlertRecipients_unpartitioned;
+                END IF;
+                DROP TABLE Alerts_unpartitioned;
+            END IF;
+        END
+        $$
+        """,
+        # Number of alerts per machine, type and severity per day, kept up to date by the API layer
+        """
+        CREATE TABLE IF NOT EXISTS AlertDailyRollup (
+        AlertDate DATE NOT NULL,
+        MachineName VARCHAR(50) NOT NULL,
+        Type VARCHAR(50) NOT NULL,
+        Severity VARCHAR(10) NOT NULL,
+        AlertCount INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (AlertDate, MachineName, Type, Severity)
+        )
+        """,
+        # Indexes for the paginated retrieval of the alerts of a user
+        """
+        CREATE INDEX IF NOT EXISTS idx_alertrecipients_user_read ON AlertRecipients (UserID, Read)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_alerts_triggeredat ON Alerts (TriggeredAt, AlertID)
+        """,
+        # Report schedules, the settings are the JSON of the schedule; the scheduler of the API layer
+        # is rebuilt from this table at startup
+        """
+        CREATE TABLE IF NOT EXISTS ReportSchedules (
+        ScheduleID SERIAL PRIMARY KEY,
+        UserID INT NOT NULL,
+        Name VARCHAR(100) NOT NULL,
+        Settings TEXT NOT NULL,
+        FOREIGN KEY (UserID) REFERENCES Users(UserID) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_reportschedules_user ON ReportSchedules (UserID)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Models (
+        ID SERIAL PRIMARY KEY,
+        KPI VARCHAR(50) NOT NULL,
+        MachineName VARCHAR(50) NOT NULL,
+        ModelPath TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Microservices (
+        ServiceID VARCHAR(20) PRIMARY KEY,
+        Key VARCHAR(50) NOT NULL
+        )
+        """
+    ]
+
+    # Execute table creation queries
+    for query in create_table_queries:
+        cur.execute(query)
+        conn.commit()
+
+    print("Tables created successfully")
+
+    # Functions to manage the monthly partitions of the alerts, called periodically by the API layer
+    alert_partition_functions = [
+        """
+        CREATE OR REPLACE FUNCTION create_alert_partitions(months_ahead INT) RETURNS VOID AS $$
+        DECLARE
+            first_month DATE := date_trunc('month', now())::date;
+            month_start DATE;
+            month_end DATE;
+            parent TEXT;
+            partition_name TEXT;
+        BEGIN
+            FOR i IN 0..months_ahead LOOP
+                month_start := (first_month + make_interval(months => i))::date;
+                month_end := (month_start + interval '1 month')::date;
+                FOREACH parent IN ARRAY ARRAY['alerts', 'alertrecipients'] LOOP
+                    partition_name := parent || '_' || to_char(month_start, 'YYYY_MM');
+                    CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+                    -- A partition cannot be created while the default partition holds rows of its month:
+                    -- they are moved out of the default partition and inserted again once it exists
+                    EXECUTE format('CREATE TEMP TABLE alert_partition_rows ON COMMIT DROP AS '
+                                   'SELECT * FROM %I WHERE TriggeredAt >= %L AND TriggeredAt < %L',
+                                   parent || '_default', month_start, month_end);
+                    EXECUTE format('DELETE FROM %I WHERE TriggeredAt >= %L AND TriggeredAt < %L',
+                                   parent || '_default', month_start, month_end);
+                    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                                   partition_name, parent, month_start, month_end);
+                    EXECUTE format('INSERT INTO %I SELECT * FROM alert_partition_rows', parent);
+                    DROP TABLE alert_partition_rows;
+                END LOOP;
+            END LOOP;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION drop_alert_partitions(retention_months INT) RETURNS INT AS $$
+        DECLARE
+            cutoff DATE := (date_trunc('month', now()) - make_interval(months => retention_months))::date;
+            partition_name TEXT;
+            dropped INT := 0;
+        BEGIN
+            FOR partition_name IN
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname IN ('alerts', 'alertrecipients') AND c.relname ~ '_[0-9]{4}_[0-9]{2}$'
+            LOOP
+                IF to_date(right(partition_name, 7), 'YYYY_MM') < cutoff THEN
+                    EXECUTE format('DROP TABLE %I', partition_name);
+                    dropped := dropped + 1;
+                END IF;
+            END LOOP;
+            DELETE FROM AlertRecipients_default WHERE TriggeredAt < cutoff;
+            DELETE FROM Alerts_default WHERE TriggeredAt < cutoff;
+            RETURN dropped;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    ]
+    for query in alert_partition_functions:
+        cur.execute(query)
+    cur.execute("SELECT create_alert_partitions(%s)", (int(os.getenv('ALERT_PARTITIONS_AHEAD', 2)),))
+    # Roll up the alerts created before the rollup table existed
+    cur.execute("""
+    INSERT INTO AlertDailyRollup (AlertDate, MachineName, Type, Severity, AlertCount)
+    SELECT TriggeredAt::date, MachineName, Type, Severity, COUNT(*) FROM Alerts
+    WHERE NOT EXISTS (SELECT 1 FROM AlertDailyRollup)
+    GROUP BY 1, 2, 3, 4
+    """)
+    conn.commit()
+    print("Alert partitions created successfully")
+
 if __name__ == "__main__":
     """
     Main entry point of the script. Manages table creation and data operations.
@@ -61,79 +324,7 @@ if __name__ == "__main__":
     if cur:
         print("Cursor obtained successfully")
 
-        # Queries for creating tables
-        create_table_queries = [
-            """
-            CREATE TABLE IF NOT EXISTS Users (
-            UserID SERIAL PRIMARY KEY,
-            Username VARCHAR(255) NOT NULL,
-            Email VARCHAR(255) NOT NULL,
-            Role VARCHAR(255) NOT NULL,
-            Password VARCHAR(255) NOT NULL,
-            SiteName VARCHAR(255) NOT NULL,
-            UserSettings TEXT,
-            UserDashboards TEXT,
-            UserSchedules TEXT
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS Reports (
-            ReportID SERIAL PRIMARY KEY,
-            Name VARCHAR(100) NOT NULL,
-            Type VARCHAR(100) NOT NULL,
-            OwnerID INT NOT NULL,
-            GeneratedAt TIMESTAMP NOT NULL,
-            FilePath TEXT NOT NULL,
-            SiteName VARCHAR(100) NOT NULL,
-            FOREIGN KEY (OwnerID) REFERENCES Users(UserID)
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS Alerts (
-            AlertID SERIAL PRIMARY KEY,
-            Title VARCHAR(100) NOT NULL,
-            Type VARCHAR(50) NOT NULL,
-            Description VARCHAR(255) NOT NULL,
-            TriggeredAt TIMESTAMP NOT NULL,
-            MachineName VARCHAR(50) NOT NULL,
-            isPush BOOLEAN DEFAULT FALSE,
-            Severity VARCHAR(10) NOT NULL
-            CHECK (Severity IN ('Low', 'Medium', 'High'))
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS AlertRecipients (
-            ID SERIAL PRIMARY KEY,
-            AlertID INT NOT NULL,
-            UserID INT NOT NULL,
-            Read BOOLEAN NOT NULL DEFAULT FALSE,
-            UNIQUE(AlertID, UserID),
-            FOREIGN KEY (AlertID) REFERENCES Alerts(AlertID) ON DELETE CASCADE,
-            FOREIGN KEY (UserID) REFERENCES Users(UserID) ON DELETE CASCADE
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS Models (
-            ID SERIAL PRIMARY KEY,
-            KPI VARCHAR(50) NOT NULL,
-            MachineName VARCHAR(50) NOT NULL,
-            ModelPath TEXT NOT NULL
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS Microservices (
-            ServiceID VARCHAR(20) PRIMARY KEY,
-            Key VARCHAR(50) NOT NULL
-            )
-            """
-        ]
-
-        # Execute table creation queries
-        for query in create_table_queries:
-            cur.execute(query)
-            conn.commit()
-
-        print("Tables created successfully")
+        create_tables(conn, cur)
 
         # Insert dummy data into the Microservices table
 
@@ -0,0 +1,158 @@
+import unittest
+import os
+import sys
+import uuid
+from datetime import datetime
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../postgres')))
+
+import psycopg2
+
+from create_db_tables import create_tables
+
+# The tests running the SQL need a PostgreSQL database, e.g. "dbname=test user=postgres host=localhost";
+# every test works in a schema of its own, dropped at the end
+POSTGRES_TEST_DSN = os.getenv('POSTGRES_TEST_DSN')
+
+OLD_ALERT_TABLES = [
+    """
+    CREATE TABLE Users (
+    UserID SERIAL PRIMARY KEY,
+    Username VARCHAR(255) NOT NULL,
+    Email VARCHAR(255) NOT NULL,
+    Role VARCHAR(255) NOT NULL,
+    Password VARCHAR(255) NOT NULL,
+    SiteName VARCHAR(255) NOT NULL,
+    UserSettings TEXT,
+    UserDashboards TEXT,
+    UserSchedules TEXT
+    )
+    """,
+    """
+    CREATE TABLE Alerts (
+    AlertID SERIAL PRIMARY KEY,
+    Title VARCHAR(100) NOT NULL,
+    Type VARCHAR(50) NOT NULL,
+    Description VARCHAR(255) NOT NULL,
+    TriggeredAt TIMESTAMP NOT NULL,
+    MachineName VARCHAR(50) NOT NULL,
+    isPush BOOLEAN DEFAULT FALSE,
+    Severity VARCHAR(10) NOT NULL
+    CHECK (Severity IN ('Low', 'Medium', 'High'))
+    )
+    """,
+    """
+    CREATE TABLE AlertRecipients (
+    ID SERIAL PRIMARY KEY,
+    AlertID INT NOT NULL,
+    UserID INT NOT NULL,
+    Read BOOLEAN NOT NULL DEFAULT FALSE,
+    UNIQUE(AlertID, UserID),
+    FOREIGN KEY (AlertID) REFERENCES Alerts(AlertID) ON DELETE CASCADE,
+    FOREIGN KEY (UserID) REFERENCES Users(UserID) ON DELETE CASCADE
+    )
+    """,
+    "CREATE INDEX idx_alertrecipients_user_read ON AlertRecipients (UserID, Read)",
+    "CREATE INDEX idx_alerts_triggeredat ON Alerts (TriggeredAt, AlertID)",
+]
+
+
+class TestCreateTablesOrder(unittest.TestCase):
+
+    def test_alert_migration_wraps_the_partitioned_tables(self):
+        cur = MagicMock()
+        create_tables(MagicMock(), cur)
+        queries = [" ".join(call.args[0].split()) for call in cur.execute.call_args_list]
+
+        def position(text):
+            return next(i for i, query in enumerate(queries) if text in query)
+
+        rename = position("ALTER TABLE Alerts RENAME TO Alerts_unpartitioned")
+        copy = position("FROM Alerts_unpartitioned")
+        self.assertLess(rename, position("CREATE TABLE IF NOT EXISTS Alerts ("))
+        self.assertGreater(copy, position("CREATE TABLE IF NOT EXISTS AlertRecipients_default"))
+        self.assertLess(copy, position("SELECT create_alert_partitions"))
+
+
+@unittest.skipUnless(POSTGRES_TEST_DSN, "POSTGRES_TEST_DSN is not set")
+class TestCreateTablesPostgres(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = psycopg2.connect(POSTGRES_TEST_DSN)
+        self.cur = self.conn.cursor()
+        self.schema = "test_create_db_tables_" + uuid.uuid4().hex[:8]
+        self.cur.execute(f"CREATE SCHEMA {self.schema}")
+        self.cur.execute(f"SET search_path TO {self.schema}")
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.rollback()
+        self.cur.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        self.conn.commit()
+        self.cur.close()
+        self.conn.close()
+
+    def query(self, query, params=None):
+        self.cur.execute(query, params)
+        return self.cur.fetchall()
+
+    def insert_alert(self, triggered_at, user_id):
+        alert_id = self.query("""
+            INSERT INTO Alerts (Title, Type, Description, TriggeredAt, MachineName, Severity)
+            VALUES ('Drift', 'drift', 'Drift detected', %s, 'Laser Cutter', 'High') RETURNING AlertID
+            """, (triggered_at,))[0][0]
+        self.cur.execute("INSERT INTO AlertRecipients (AlertID, UserID, TriggeredAt) VALUES (%s, %s, %s)",
+                         (alert_id, user_id, triggered_at))
+        return alert_id
+
+    def test_migrates_unpartitioned_alerts(self):
+        for query in OLD_ALERT_TABLES:
+            self.cur.execute(query)
+        self.cur.execute("INSERT INTO Users (Username, Email, Role, Password, SiteName) "
+                         "VALUES ('user', 'user@example.com', 'FFM', 'x', 'site')")
+        self.cur.execute("""
+            INSERT INTO Alerts (Title, Type, Description, TriggeredAt, MachineName, Severity) VALUES
+            ('Drift', 'drift', 'Drift detected', now(), 'Laser Cutter', 'High'),
+            ('Outlier', 'outlier', 'Outlier detected', now() - interval '2 years', 'Laser Cutter', 'Low')
+            """)
+        self.cur.execute("INSERT INTO AlertRecipients (AlertID, UserID, Read) VALUES (1, 1, FALSE), (2, 1, TRUE)")
+        self.conn.commit()
+
+        create_tables(self.conn, self.cur)
+
+        self.assertEqual(self.query("SELECT COUNT(*) FROM pg_partitioned_table "
+                                    "WHERE partrelid IN ('alerts'::regclass, 'alertrecipients'::regclass)"),
+                         [(2,)])
+        self.assertEqual(self.query("SELECT to_regclass('alerts_unpartitioned'), "
+                                    "to_regclass('alertrecipients_unpartitioned')"), [(None, None)])
+        self.assertEqual(self.query("""
+            SELECT a.AlertID, a.tableoid::regclass::text, r.UserID, r.Read, r.TriggeredAt = a.TriggeredAt
+            FROM Alerts a JOIN AlertRecipients r ON r.AlertID = a.AlertID ORDER BY a.AlertID
+            """), [
+            (1, self.query("SELECT 'alerts_' || to_char(now(), 'YYYY_MM')")[0][0], 1, False, True),
+            (2, "alerts_default", 1, True, True),
+        ])
+        self.assertEqual(self.query("SELECT SUM(AlertCount) FROM AlertDailyRollup"), [(2,)])
+        self.assertEqual(self.insert_alert(datetime.now(), 1), 3)
+
+    def test_creating_a_partition_moves_the_rows_of_the_default_partition(self):
+        create_tables(self.conn, self.cur)
+        self.cur.execute("INSERT INTO Users (Username, Email, Role, Password, SiteName) "
+                         "VALUES ('user', 'user@example.com', 'FFM', 'x', 'site')")
+        month = self.query("SELECT date_trunc('month', now()) + interval '5 months'")[0][0]
+        alert_id = self.insert_alert(month, 1)
+        self.assertEqual(self.query("SELECT tableoid::regclass::text FROM Alerts"), [("alerts_default",)])
+
+        self.cur.execute("SELECT create_alert_partitions(5)")
+
+        suffix = month.strftime("%Y_%m")
+        self.assertEqual(self.query("SELECT AlertID, tableoid::regclass::text FROM Alerts"),
+                         [(alert_id, "alerts_" + suffix)])
+        self.assertEqual(self.query("SELECT AlertID, tableoid::regclass::text FROM AlertRecipients"),
+                         [(alert_id, "alertrecipients_" + suffix)])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM Alerts_default"), [(0,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,14 +8,21 @@ from owlready2 import *
 import sympy
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi import FastAPI, Depends
+from brotli_asgi import BrotliMiddleware
 import json
+import os
 from api_auth.api_auth import get_verify_api_key
+from tracing import TracingMiddleware, instrument_http_clients
 from pydantic import BaseModel
 import shutil
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+
+app.add_middleware(BrotliMiddleware, minimum_size=int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 1024)),
+                   gzip_fallback=True)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +32,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# added last, so that the server span covers the other middlewares
+app.add_middleware(TracingMiddleware)
+instrument_http_clients()
+
 ONTOLOGY_PATH = "./storage/sa_ontology.rdf"
 onto = None
 
@@ -0,0 +1,458 @@
+"""
+Request tracing across the services, with W3C trace context propagation.
+
+Every request served by an app gets a server span, joining the trace of the caller when the request has a
+`traceparent` header. Outbound `requests` and `httpx` calls get a client span and forward the trace with
+their own `traceparent` header, and the code can open spans of its own (database, Druid, MinIO, LLM calls).
+
+The finished spans go to the exporter selected by TRACE_EXPORTER:
+    memory  kept in the in-process `collector`, the most recent TRACE_BUFFER_SIZE spans
+    file    appended as JSON lines to TRACE_FILE, to be inspected offline
+    none    dropped (default)
+
+The spans are named after the service in TRACE_SERVICE_NAME, set by the Dockerfile of every service, or else
+after the directory of the service. Every service has a copy of this module, and the copies are kept
+identical: api/test/test_tracing.py checks them.
+
+The spans of a file can be printed as trees with:
+    python -m tracing traces.jsonl [trace_id]
+"""
+import argparse
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import urlsplit
+
+
+def _service_directory():
+    # e.g. api for api/src/tracing.py, data-processing for data-processing/tracing.py
+    directory = os.path.dirname(os.path.abspath(__file__))
+    if os.path.basename(directory) == "src":
+        directory = os.path.dirname(directory)
+    return os.path.basename(directory)
+
+
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME") or _service_directory()
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 10000))
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})(-.*)?$")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def parse_traceparent(header: Optional[str]):
+    """
+    Parses a W3C `traceparent` header.
+
+    Args:
+        header (str): The value of the header.
+
+    Returns:
+        tuple: The trace ID and the ID of the parent span, or None if the header is missing or invalid.
+    """
+    if not header:
+        return None
+    match = _TRACEPARENT.match(header.strip().lower())
+    if not match:
+        return None
+    version, trace_id, parent_id, _, rest = match.groups()
+    if version == "ff" or (version == "00" and rest):
+        return None
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id
+
+
+class Span(object):
+    """
+    A timed operation of a trace.
+    """
+    def __init__(self, name: str, trace_id: str = None, parent_id: str = None, kind: str = "internal",
+                 attributes: dict = None):
+        self.name = name
+        self.service = SERVICE_NAME
+        self.kind = kind
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.error = None
+        self.start = time.time()
+        self.duration = None
+        self._started = time.perf_counter()
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def fail(self, error):
+        """
+        Marks the span as failed, with the given exception or message.
+        """
+        self.status = "error"
+        self.error = error if isinstance(error, str) else type(error).__name__ + ": " + str(error)
+
+    def end(self):
+        """
+        Ends the span and hands it to the exporter. Ending a span twice has no effect.
+        """
+        if self.duration is not None:
+            return
+        self.duration = (time.perf_counter() - self._started) * 1000
+        if _exporter is not None:
+            try:
+                _exporter.export(self)
+            except Exception as e:
+                logging.error("Error exporting span: %s", str(e))
+
+    def traceparent(self):
+        """
+        Returns the `traceparent` header that makes the receiver a child of this span.
+        """
+        return "00-" + self.trace_id + "-" + self.span_id + "-01"
+
+    def getDict(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentId": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "kind": self.kind,
+            "start": self.start,
+            "durationMs": self.duration,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+def current_span():
+    """
+    Returns the span active in the current context, or None.
+    """
+    return _current_span.get()
+
+
+def open_span(name: str, traceparent: str = None, kind: str = "internal", **attributes):
+    """
+    Starts a span without making it the active one, for operations that start and end in callbacks.
+    The caller must end the span.
+
+    Args:
+        name (str): The name of the operation.
+        traceparent (str): The `traceparent` header of a remote parent, which takes precedence over the
+            active span.
+        kind (str): "server", "client" or "internal".
+
+    Returns:
+        Span: The started span, child of the remote parent or of the active span, if any.
+    """
+    remote = parse_traceparent(traceparent)
+    if remote:
+        trace_id, parent_id = remote
+    else:
+        parent = current_span()
+        trace_id, parent_id = (parent.trace_id, parent.span_id) if parent else (None, None)
+    return Span(name, trace_id, parent_id, kind, attributes)
+
+
+@contextmanager
+def start_span(name: str, traceparent: str = None, kind: str = "internal", **attributes):
+    """
+    Runs the body of a with block in a span, which is the active one until the block exits.
+
+    Usage:
+        with start_span("postgres", statement="SELECT") as span:
+            ...
+
+    An exception raised by the block marks the span as failed and is propagated.
+
+    Yields:
+        Span: The span.
+    """
+    span = open_span(name, traceparent, kind, **attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.fail(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def traced(name: str = None, **attributes):
+    """
+    Decorator that runs every call of a function, or of a coroutine function, in a span.
+
+    Args:
+        name (str): The name of the span, the qualified name of the function by default.
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(span_name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(span_name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def inject(headers: dict = None):
+    """
+    Adds the `traceparent` header of the active span to the headers of an outbound request.
+
+    Args:
+        headers (dict): The headers, copied and not modified.
+
+    Returns:
+        dict: The headers with the trace context, if a span is active.
+    """
+    headers = dict(headers or {})
+    span = current_span()
+    if span is not None:
+        headers["traceparent"] = span.traceparent()
+    return headers
+
+
+class InMemoryCollector(object):
+    """
+    Keeps the most recent spans in memory, to be inspected from a shell or a test.
+    """
+    def __init__(self, max_spans: int = TRACE_BUFFER_SIZE):
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            self._spans.append(span.getDict())
+
+    def spans(self, trace_id: str = None):
+        """
+        Returns the collected spans, of all the traces or of one trace, in the order they ended.
+        """
+        with self._lock:
+            return [span for span in self._spans if trace_id is None or span["traceId"] == trace_id]
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+class FileExporter(object):
+    """
+    Appends the spans to a file, one JSON object per line.
+    """
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.getDict(), default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+collector = InMemoryCollector()
+
+
+def _default_exporter():
+    if TRACE_EXPORTER == "file":
+        return FileExporter(TRACE_FILE)
+    if TRACE_EXPORTER == "memory":
+        return collector
+    return None
+
+
+_exporter = _default_exporter()
+
+
+def set_exporter(exporter):
+    """
+    Replaces the exporter of the finished spans; None drops them.
+
+    Returns:
+        The previous exporter.
+    """
+    global _exporter
+    previous, _exporter = _exporter, exporter
+    return previous
+
+
+class TracingMiddleware(object):
+    """
+    ASGI middleware that runs every HTTP request in a server span.
+
+    The span joins the trace of the `traceparent` header of the request, and its own `traceparent` is
+    returned in the response headers. Responses with status 5xx mark the span as failed.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        name = scope["method"] + " " + scope["path"]
+        with start_span(name, traceparent, "server", **{"http.method": scope["method"],
+                                                         "http.target": scope["path"]}) as span:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    span.set("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.fail("HTTP " + str(message["status"]))
+                    message["headers"] = list(message.get("headers", [])) + \
+                        [(b"traceparent", span.traceparent().encode("latin-1"))]
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
+
+
+def _client_span(method: str, url: str, headers):
+    parts = urlsplit(url)
+    # outside of a span, a trace context set by the caller on the request is continued
+    traceparent = headers.get("traceparent") if current_span() is None else None
+    return start_span("HTTP " + method + " " + (parts.hostname or ""), traceparent, "client",
+                      **{"http.method": method, "http.url": parts.scheme + "://" + parts.netloc + parts.path})
+
+
+def instrument_http_clients():
+    """
+    Traces the requests sent with `requests` and `httpx`, when they are installed.
+
+    Every request gets a client span and a `traceparent` header, so that the receiving service continues
+    the trace. Calling the function again has no effect.
+    """
+    try:
+        import requests
+    except ImportError:
+        requests = None
+    if requests is not None and not getattr(requests.Session.send, "traced", False):
+        send = requests.Session.send
+
+        @functools.wraps(send)
+        def traced_send(session, request, **kwargs):
+            with _client_span(request.method, request.url, request.headers) as span:
+                request.headers["traceparent"] = span.traceparent()
+                response = send(session, request, **kwargs)
+                span.set("http.status_code", response.status_code)
+                return response
+        traced_send.traced = True
+        requests.Session.send = traced_send
+
+    try:
+        import httpx
+    except ImportError:
+        httpx = None
+    if httpx is not None and not getattr(httpx.AsyncClient.send, "traced", False):
+        async_send = httpx.AsyncClient.send
+
+        @functools.wraps(async_send)
+        async def traced_async_send(client, request, *args, **kwargs):
+            with _client_span(request.method, str(request.url), request.headers) as span:
+                request.headers["traceparent"] = span.traceparent()
+                response = await async_send(client, request, *args, **kwargs)
+                span.set("http.status_code", response.status_code)
+                return response
+        traced_async_send.traced = True
+        httpx.AsyncClient.send = traced_async_send
+
+        sync_send = httpx.Client.send
+
+        @functools.wraps(sync_send)
+        def traced_sync_send(client, request, *args, **kwargs):
+            with _client_span(request.method, str(request.url), request.headers) as span:
+                request.headers["traceparent"] = span.traceparent()
+                response = sync_send(client, request, *args, **kwargs)
+                span.set("http.status_code", response.status_code)
+                return response
+        traced_sync_send.traced = True
+        httpx.Client.send = traced_sync_send
+
+
+def format_traces(spans, trace_id: str = None):
+    """
+    Formats spans as one indented tree per trace, children under their parents in start order.
+
+    Args:
+        spans (list): The spans, as dictionaries.
+        trace_id (str): Formats only this trace.
+
+    Returns:
+        str: The trees.
+    """
+    traces = {}
+    for span in spans:
+        if trace_id is None or span["traceId"] == trace_id:
+            traces.setdefault(span["traceId"], []).append(span)
+    lines = []
+    for current_trace, trace_spans in sorted(traces.items(), key=lambda item: min(s["start"] for s in item[1])):
+        ids = {span["spanId"] for span in trace_spans}
+        children = {}
+        for span in trace_spans:
+            # spans whose parent was not collected (e.g. a remote caller) are shown as roots
+            parent = span["parentId"] if span["parentId"] in ids else None
+            children.setdefault(parent, []).append(span)
+        lines.append("trace " + current_trace)
+
+        def walk(parent, depth):
+            for span in sorted(children.get(parent, []), key=lambda s: s["start"]):
+                line = "  " * depth + "[" + span["service"] + "] " + span["name"] + \
+                    " %.1f ms" % (span["durationMs"] or 0)
+                if span["status"] != "ok":
+                    line += " ERROR " + (span["error"] or "")
+                lines.append(line)
+                walk(span["spanId"], depth + 1)
+        walk(None, 1)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prints the traces of a span file as trees.")
+    parser.add_argument("path", nargs="?", default=TRACE_FILE, help="the file written by the file exporter")
+    parser.add_argument("trace_id", nargs="?", help="prints only this trace")
+    args = parser.parse_args(argv)
+    with open(args.path, encoding="utf-8") as file:
+        spans = [json.loads(line) for line in file if line.strip()]
+    print(format_traces(spans, args.trace_id))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,8 +9,11 @@ import os, time
 from pathlib import Path
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from brotli_asgi import BrotliMiddleware
 from typing import Optional
 from api_auth.api_auth import get_verify_api_key
+from tracing import TracingMiddleware, instrument_http_clients
 from fastapi import Depends
 
 env_path = Path(__file__).resolve().parent.parent / ".env"
@@ -47,7 +50,10 @@ df = pd.DataFrame.from_dict(df, orient='columns')
 
 df.rename(columns={"__time": "time"}, inplace=True)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+
+app.add_middleware(BrotliMiddleware, minimum_size=int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 1024)),
+                   gzip_fallback=True)
 
 app.add_middleware(
     CORSMiddleware,
@@ -57,6 +63,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# added last, so that the server span covers the other middlewares
+app.add_middleware(TracingMiddleware)
+instrument_http_clients()
+
 class KPIRequest(BaseModel):
     KPI_Name: Optional[str] = "no_kpi"
     Machine_Name: Optional[str] = "all_machines"
@@ -0,0 +1,151 @@
+"""
+Load test of the stack on fake backends.
+
+Starts the fake Druid and the SMTP sink in this process and every service in its own process (see
+loadtest.serve), then runs the scenarios against the API layer and prints the throughput and the latency
+percentiles of every endpoint.
+
+Usage:
+    python -m loadtest [--scenario NAME ...] [--iterations N] [--concurrency N] [--json FILE]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from loadtest.fakes import FakeDruid, SmtpSink
+from loadtest.scenarios import SCENARIOS, LoadContext
+from loadtest.serve import DRUID_PORT, HOSTS, REPO_ROOT, SERVICE_PORT, SERVICES, SMTP_PORT
+
+
+def service_environment():
+    """
+    Returns the environment of the service processes, pointing them to the fakes.
+    """
+    env = dict(os.environ)
+    env.update({
+        "LOADTEST_HOSTS": json.dumps(HOSTS),
+        "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")])),
+        "DRUID_QUERY_ENDPOINT": "http://router:" + str(DRUID_PORT) + "/druid/v2/sql",
+        "SMTP_SERVER": "smtp",
+        "SMTP_PORT": str(SMTP_PORT),
+    })
+    env.setdefault("SMTP_EMAIL", "smartfactory@localhost")
+    env.setdefault("SMTP_PASSWORD", "loadtest")
+    env.setdefault("KB_FILE_PATH", os.path.join(REPO_ROOT, "kb", "Ontology") + os.sep)
+    env.setdefault("KB_FILE_NAME", "sa_ontology.rdf")
+    return env
+
+
+def start_druid(druid: FakeDruid):
+    server = uvicorn.Server(uvicorn.Config(druid.app(), host=HOSTS["router"], port=DRUID_PORT, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="fake-druid", daemon=True)
+    thread.start()
+    return server, thread
+
+
+def wait_listening(host: str, port: int, timeout: float, process=None):
+    """
+    Waits until a port accepts connections.
+
+    Raises:
+        RuntimeError: If the process exits or the port is not open within the timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError("the process exited with code " + str(process.returncode))
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError("%s:%d not listening after %d seconds" % (host, port, timeout))
+
+
+async def run_scenarios(names, args, sink):
+    headers = {"x-api-key": args.api_key} if args.api_key else {}
+    async with httpx.AsyncClient(base_url="http://" + HOSTS["api"] + ":" + str(SERVICE_PORT), headers=headers,
+                                 timeout=httpx.Timeout(args.request_timeout),
+                                 limits=httpx.Limits(max_connections=None)) as client:
+        context = LoadContext(client, args.user_id, sink, args.seed)
+        reports = []
+        for name in names:
+            scenario = SCENARIOS[name](args.iterations, args.concurrency)
+            report = await scenario.run(context)
+            print(report.format(), flush=True)
+            reports.append(report)
+        return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test of the stack on fake Druid, LLM, MinIO and SMTP.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="a scenario to run, may be repeated (default: all)")
+    parser.add_argument("--services", nargs="+", choices=list(SERVICES), default=list(SERVICES),
+                        help="the services to start (default: all)")
+    parser.add_argument("--iterations", type=int, help="iterations of every scenario (default: per scenario)")
+    parser.add_argument("--concurrency", type=int, help="virtual users of every scenario (default: per scenario)")
+    parser.add_argument("--user-id", default=os.getenv("LOADTEST_USER_ID", "1"), help="the user the scenarios act as")
+    parser.add_argument("--api-key", default=os.getenv("LOADTEST_API_KEY", os.getenv("API_KEY")),
+                        help="the API key of the GUI")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated requests")
+    parser.add_argument("--request-timeout", type=float, default=180)
+    parser.add_argument("--startup-timeout", type=float, default=300,
+                        help="seconds to wait for every service to start")
+    parser.add_argument("--log-dir", help="directory of the logs of the services (default: a temporary one)")
+    parser.add_argument("--json", help="also writes the results to this file")
+    args = parser.parse_args(argv)
+    names = args.scenario or list(SCENARIOS)
+
+    druid_server, druid_thread = start_druid(FakeDruid())
+    sink = SmtpSink(HOSTS["smtp"], SMTP_PORT).start()
+    log_dir = args.log_dir or tempfile.mkdtemp(prefix="loadtest-")
+    os.makedirs(log_dir, exist_ok=True)
+    print("service logs in " + log_dir, flush=True)
+    processes = {}
+    try:
+        wait_listening(HOSTS["router"], DRUID_PORT, 10)
+        env = service_environment()
+        for service in args.services:
+            log = open(os.path.join(log_dir, service + ".log"), "w")
+            processes[service] = subprocess.Popen([sys.executable, "-m", "loadtest.serve", service], env=env,
+                                                  cwd=REPO_ROOT, stdout=log, stderr=subprocess.STDOUT)
+        for service, process in processes.items():
+            try:
+                wait_listening(HOSTS[service], SERVICE_PORT, args.startup_timeout, process)
+            except RuntimeError as e:
+                print("%s did not start: %s (see %s)" % (service, e, os.path.join(log_dir, service + ".log")),
+                      file=sys.stderr)
+                return 1
+            print(service + " started", flush=True)
+
+        reports = asyncio.run(run_scenarios(names, args, sink))
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as file:
+                json.dump([report.summary() for report in reports], file, indent=2)
+        return 0
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        druid_server.should_exit = True
+        druid_thread.join(5)
+        sink.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,502 @@
+"""
+Local stand-ins for the external backends of the stack: Druid, the Gemini model, MinIO and SMTP.
+
+They are deterministic, so that two runs of a scenario do the same work, and fast, so that the load test
+measures the services rather than the backends; the fake LLM has a configurable latency instead.
+"""
+import hashlib
+import io
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Body, FastAPI
+
+MACHINES = [
+    "Assembly Machine 1", "Assembly Machine 2", "Assembly Machine 3",
+    "Large Capacity Cutting Machine 1", "Large Capacity Cutting Machine 2",
+    "Medium Capacity Cutting Machine 1", "Medium Capacity Cutting Machine 2", "Medium Capacity Cutting Machine 3",
+    "Low Capacity Cutting Machine 1", "Laser Welding Machine 1", "Laser Welding Machine 2",
+    "Riveting Machine", "Testing Machine 1", "Testing Machine 2", "Testing Machine 3",
+]
+
+KPIS = [
+    "average_cycle_time", "bad_cycles", "consumption", "consumption_idle", "consumption_working", "cost",
+    "cost_idle", "cost_working", "cycles", "good_cycles", "idle_time", "offline_time", "power", "working_time",
+]
+
+def synthetic_timeseries(days: int = 90, end: datetime = None, seed: int = 0):
+    """
+    Generates the rows of the "timeseries" datasource, one per machine, KPI and day.
+
+    Args:
+        days (int): The number of days of data, ending on the day before `end`.
+        end (datetime): The end of the data, today (UTC) by default.
+        seed (int): The seed of the values; the same seed gives the same rows.
+
+    Returns:
+        list: The rows, as dictionaries with the columns of the datasource, in time order.
+    """
+    end = (end or datetime.now(timezone.utc)).replace(hour=0, minute=0, second=0, microsecond=0)
+    rng = random.Random(seed)
+    # every series oscillates around its own base value
+    bases = {(machine, kpi): rng.uniform(1, 100) for machine in MACHINES for kpi in KPIS}
+    rows = []
+    for day in range(days, 0, -1):
+        timestamp = (end - timedelta(days=day)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        for index, machine in enumerate(MACHINES):
+            for kpi in KPIS:
+                base = bases[(machine, kpi)]
+                low = base * rng.uniform(0.5, 0.9)
+                high = base * rng.uniform(1.1, 1.5)
+                avg = (low + high) / 2
+                rows.append({
+                    "__time": timestamp,
+                    "asset_id": "ast-" + str(index),
+                    "name": machine,
+                    "kpi": kpi,
+                    "sum": round(avg * 24, 4),
+                    "min": round(low, 4),
+                    "max": round(high, 4),
+                    "avg": round(avg, 4),
+                })
+    return rows
+
+
+def _parse_time(value: str):
+    value = value.strip().replace("Z", "+00:00")
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _format_time(value: datetime):
+    return value.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+class FakeDruid(object):
+    """
+    Serves the SQL and native query endpoints of Druid over synthetic rows.
+
+    The SQL endpoint understands the queries of the services: a scan of "timeseries", optionally filtered
+    by equality conditions. The native endpoint evaluates the timeseries, groupBy and timeBoundary queries
+    built by the API layer.
+    """
+    def __init__(self, rows=None):
+        self.rows = rows if rows is not None else synthetic_timeseries()
+        for row in self.rows:
+            row["_time"] = _parse_time(row["__time"])
+        self.queries = 0
+
+    def app(self):
+        """
+        Returns the FastAPI app of the fake.
+        """
+        app = FastAPI()
+
+        @app.post("/druid/v2/sql")
+        @app.post("/druid/v2/sql/")
+        def sql(body: dict = Body(...)):
+            self.queries += 1
+            return self.sql(body.get("query", ""))
+
+        @app.post("/druid/v2")
+        @app.post("/druid/v2/")
+        def native(body: dict = Body(...)):
+            self.queries += 1
+            return self.native(body)
+
+        return app
+
+    def _public(self, row):
+        return {key: value for key, value in row.items() if key != "_time"}
+
+    def sql(self, query: str):
+        """
+        Runs a SQL scan, keeping the rows that match the `column = 'value'` conditions of the query.
+        """
+        where = re.split(r"\bwhere\b", query, flags=re.IGNORECASE)
+        conditions = re.findall(r"(\w+)\s*=\s*'([^']*)'", where[1]) if len(where) > 1 else []
+        return [self._public(row) for row in self.rows
+                if all(str(row.get(column)) == value for column, value in conditions)]
+
+    def native(self, query: dict):
+        """
+        Runs a native query.
+
+        Raises:
+            ValueError: If the query type is not supported.
+        """
+        query_type = query.get("queryType")
+        if query_type == "timeBoundary":
+            if not self.rows:
+                return []
+            times = [row["_time"] for row in self.rows]
+            return [{"timestamp": _format_time(min(times)),
+                     "result": {"minTime": _format_time(min(times)), "maxTime": _format_time(max(times))}}]
+        if query_type not in ("timeseries", "groupBy"):
+            raise ValueError("Unsupported query type: " + str(query_type))
+
+        intervals = [tuple(_parse_time(part) for part in interval.split("/")) for interval in query["intervals"]]
+        rows = [row for row in self.rows
+                if any(start <= row["_time"] < end for start, end in intervals)
+                and self._matches(query.get("filter"), row)]
+        dimensions = query.get("dimensions", [])
+        groups = OrderedDict()
+        for row in sorted(rows, key=lambda row: row["_time"]):
+            bucket = self._bucket(row["_time"], query.get("granularity", "all"), intervals[0][0])
+            key = (bucket,) + tuple(row.get(dimension) for dimension in dimensions)
+            groups.setdefault(key, []).append(row)
+
+        results = []
+        for key, group in groups.items():
+            values = self._aggregate(query.get("aggregations", []), query.get("postAggregations", []), group)
+            if query_type == "timeseries":
+                results.append({"timestamp": _format_time(key[0]), "result": values})
+            else:
+                values.update(zip(dimensions, key[1:]))
+                results.append({"version": "v1", "timestamp": _format_time(key[0]), "event": values})
+        return results
+
+    def _matches(self, spec, row):
+        if spec is None:
+            return True
+        if spec["type"] == "selector":
+            return row.get(spec["dimension"]) == spec["value"]
+        if spec["type"] == "in":
+            return row.get(spec["dimension"]) in spec["values"]
+        if spec["type"] == "and":
+            return all(self._matches(field, row) for field in spec["fields"])
+        if spec["type"] == "or":
+            return any(self._matches(field, row) for field in spec["fields"])
+        if spec["type"] == "not":
+            return not self._matches(spec["field"], row)
+        raise ValueError("Unsupported filter: " + str(spec["type"]))
+
+    def _bucket(self, time_value: datetime, granularity, interval_start: datetime):
+        if granularity == "all":
+            return interval_start
+        period = granularity["period"] if isinstance(granularity, dict) else granularity
+        day = time_value.replace(hour=0, minute=0, second=0, microsecond=0)
+        if period in ("P1D", "day"):
+            return day
+        if period in ("P1W", "week"):
+            return day - timedelta(days=day.weekday())
+        if period in ("P1M", "month"):
+            return day.replace(day=1)
+        raise ValueError("Unsupported granularity: " + str(period))
+
+    def _aggregate(self, aggregations, post_aggregations, rows):
+        values = {}
+        for aggregation in aggregations:
+            selected = rows
+            if aggregation["type"] == "filtered":
+                selected = [row for row in rows if self._matches(aggregation["filter"], row)]
+                aggregation = aggregation["aggregator"]
+            fields = [row[aggregation["fieldName"]] for row in selected] if "fieldName" in aggregation else []
+            if aggregation["type"] == "count":
+                value = len(selected)
+            elif not fields:
+                value = None
+            elif aggregation["type"] == "doubleSum":
+                value = sum(fields)
+            elif aggregation["type"] == "doubleMin":
+                value = min(fields)
+            elif aggregation["type"] == "doubleMax":
+                value = max(fields)
+            else:
+                raise ValueError("Unsupported aggregator: " + str(aggregation["type"]))
+            values[aggregation["name"]] = value
+        for post_aggregation in post_aggregations:
+            if post_aggregation["type"] == "expression":
+                # only the average of the query builder: if("<count>" > 0, "<sum>" / "<count>", null)
+                denominator, numerator = (values.get(name) for name in
+                                          re.findall(r'"([^"]+)"', post_aggregation["expression"])[:2])
+            else:
+                numerator, denominator = (values.get(field["fieldName"]) for field in post_aggregation["fields"])
+            values[post_aggregation["name"]] = numerator / denominator if numerator is not None and denominator else None
+        return values
+
+
+def fake_answer(prompt: str):
+    """
+    Answers a prompt of the RAG service as the model would, deterministically.
+
+    The prompts of the pipeline (language detection, classification, query extraction, SPARQL generation)
+    get a well-formed answer, so that the requests go through the same steps as with the real model;
+    the other prompts get a text that depends only on the prompt.
+
+    Args:
+        prompt (str): The text of the prompt.
+
+    Returns:
+        str: The answer.
+    """
+    if "Language Check" in prompt:
+        match = re.search(r'USER QUERY: "(.*?)"\s*\n', prompt, re.S)
+        return "English-" + (match.group(1) if match else prompt)
+    if "Task: Classify with one of the labels" in prompt:
+        text = prompt.rsplit("Text:", 1)[-1].lower()
+        for keyword, label in (("predict", "predictions"), ("report", "report"), ("dashboard", "dashboard"),
+                               ("new kpi", "new_kpi"), ("calculate", "kpi_calc"), ("compute", "kpi_calc")):
+            if keyword in text:
+                return label
+        return "kb_q"
+    if "matched LIST_1 IDs" in prompt:
+        machine = MACHINES[int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16) % len(MACHINES)]
+        if "time window_prediction" in prompt:
+            return "OUTPUT: (['" + machine + "'], ['working_time_sum'], <<last, 7, days>; <next, 7, days>>)"
+        if "next" in prompt.rsplit("INPUT:", 1)[-1].lower() or "predict" in prompt.rsplit("INPUT:", 1)[-1].lower():
+            return "OUTPUT: (['" + machine + "'], ['working_time_sum'], <next, 7, days>)"
+        return "OUTPUT: (['" + machine + "'], ['working_time_sum'], <last, 7, days>)"
+    if "SPARQL" in prompt and ("SELECT" in prompt or "UPDATE" in prompt) and "intent" in prompt.lower():
+        return "SELECT"
+    if "SPARQL" in prompt and "Generate" in prompt:
+        return ("PREFIX sa-ontology: <http://www.semanticweb.org/raffi/ontologies/2024/10/sa-ontology#>\n"
+                "SELECT ?kpi ?description WHERE { ?kpi sa-ontology:description ?description . } LIMIT 5")
+    if "bindings" in prompt and "textualResponse" in prompt:
+        return json.dumps({"bindings": [{"bar_chart": "working_time"}, {"line_chart": "consumption"},
+                                        {"pie_chart": "cost"}, {"area_chart": "idle_time"}],
+                           "textualResponse": "Working time, consumption, cost and idle time at a glance."})
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+    return "Synthetic answer " + digest + ". The values are within the expected range for the period."
+
+
+def fake_chat_model_class():
+    """
+    Builds the class of the fake LLM, a drop-in replacement for ChatGoogleGenerativeAI.
+
+    The class is built on demand, since langchain_core is only installed with the RAG service.
+
+    Returns:
+        type: A LangChain chat model answering with fake_answer, after LOADTEST_LLM_LATENCY seconds.
+    """
+    import os
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    class FakeChatModel(BaseChatModel):
+        model: str = "fake"
+        latency: float = float(os.getenv("LOADTEST_LLM_LATENCY", 0.2))
+
+        @property
+        def _llm_type(self):
+            return "fake-chat-model"
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            prompt = "\n".join(str(message.content) for message in messages)
+            if self.latency:
+                time.sleep(self.latency)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=fake_answer(prompt)))])
+
+    return FakeChatModel
+
+
+class _StoredObject(object):
+    def __init__(self, data: bytes, content_type: str):
+        self.data = data
+        self.content_type = content_type
+        self.last_modified = datetime.now(timezone.utc)
+
+    @property
+    def size(self):
+        return len(self.data)
+
+
+class _ObjectResponse(object):
+    """
+    The response of InMemoryMinio.get_object, with the methods of the urllib3 response returned by MinIO.
+    """
+    def __init__(self, data: bytes, content_type: str):
+        self._body = io.BytesIO(data)
+        self.headers = {"Content-Length": str(len(data)), "Content-Type": content_type}
+
+    def read(self, amt=None):
+        return self._body.read(amt)
+
+    def stream(self, amt=64 * 1024):
+        while True:
+            chunk = self._body.read(amt)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class InMemoryMinio(object):
+    """
+    Thread safe in-memory substitute of the MinIO client, for the methods used by the services.
+    """
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _object(self, bucket_name, object_name):
+        from minio.error import S3Error
+        with self._lock:
+            stored = self._buckets.get(bucket_name, {}).get(object_name)
+        if stored is None:
+            raise S3Error("NoSuchKey", "Object does not exist", object_name, None, None, None)
+        return stored
+
+    def bucket_exists(self, bucket_name):
+        with self._lock:
+            return bucket_name in self._buckets
+
+    def make_bucket(self, bucket_name):
+        with self._lock:
+            self._buckets.setdefault(bucket_name, {})
+
+    def put_object(self, bucket_name, object_name, data, length=-1, content_type="application/octet-stream", **kwargs):
+        content = data.read() if length < 0 else data.read(length)
+        with self._lock:
+            self._buckets.setdefault(bucket_name, {})[object_name] = _StoredObject(content, content_type)
+
+    def fput_object(self, bucket_name, object_name, file_path, content_type="application/octet-stream", **kwargs):
+        with open(file_path, "rb") as file:
+            self.put_object(bucket_name, object_name, file, content_type=content_type)
+
+    def get_object(self, bucket_name, object_name, offset=0, length=0, **kwargs):
+        stored = self._object(bucket_name, object_name)
+        end = offset + length if length else stored.size
+        return _ObjectResponse(stored.data[offset:end], stored.content_type)
+
+    def fget_object(self, bucket_name, object_name, file_path, **kwargs):
+        stored = self._object(bucket_name, object_name)
+        with open(file_path, "wb") as file:
+            file.write(stored.data)
+
+    def stat_object(self, bucket_name, object_name, **kwargs):
+        return self._object(bucket_name, object_name)
+
+    def remove_object(self, bucket_name, object_name, **kwargs):
+        with self._lock:
+            self._buckets.get(bucket_name, {}).pop(object_name, None)
+
+    def list_objects(self, bucket_name, prefix=None, **kwargs):
+        with self._lock:
+            names = [name for name in self._buckets.get(bucket_name, {}) if not prefix or name.startswith(prefix)]
+        return [type("Object", (), {"object_name": name, "bucket_name": bucket_name})() for name in names]
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+
+    def _reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+
+    def handle(self):
+        sink = self.server.sink
+        self._reply("220 loadtest SMTP sink ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("latin-1").rstrip("\r\n")
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self._reply("250-loadtest")
+                self._reply("250-AUTH PLAIN LOGIN")
+                self._reply("250 8BITMIME")
+            elif verb == "HELO":
+                self._reply("250 loadtest")
+            elif verb == "AUTH":
+                # any credentials are accepted, the challenges are only answered to follow the protocol
+                words = command.split()
+                mechanism = words[1].upper() if len(words) > 1 else ""
+                challenges = {"PLAIN": [""], "LOGIN": ["VXNlcm5hbWU6", "UGFzc3dvcmQ6"]}.get(mechanism, [])
+                for challenge in challenges[len(words) - 2:]:
+                    self._reply("334 " + challenge)
+                    self.rfile.readline()
+                self._reply("235 Authentication successful")
+            elif verb == "MAIL":
+                sender, recipients = command.split(":", 1)[1].strip(), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip())
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                data = io.BytesIO()
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    data.write(data_line[1:] if data_line.startswith(b"..") else data_line)
+                sink.deliver(sender, recipients, data.getvalue())
+                sender, recipients = None, []
+                self._reply("250 OK: queued")
+            elif verb in ("RSET", "NOOP"):
+                if verb == "RSET":
+                    sender, recipients = None, []
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _SmtpServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class SmtpSink(object):
+    """
+    Local SMTP server that accepts every message and keeps the count, the size and the time of delivery.
+
+    Authentication is advertised and any credentials are accepted, so that the services log in as they
+    would on the real server. Only the headers of the most recent messages are kept.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, keep: int = 100):
+        self._server = _SmtpServer((host, port), _SmtpHandler)
+        self._server.sink = self
+        self._thread = None
+        self._lock = threading.Lock()
+        self.messages = 0
+        self.bytes = 0
+        self.recent = []
+        self.delivered_at = []
+        self.keep = keep
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def deliver(self, sender, recipients, data: bytes):
+        headers = data.split(b"\r\n\r\n", 1)[0].decode("latin-1")
+        subject = re.search(r"^Subject: (.*)$", headers, re.M)
+        with self._lock:
+            self.messages += 1
+            self.bytes += len(data)
+            self.delivered_at.append(time.time())
+            self.recent.append({"from": sender, "to": recipients, "subject": subject.group(1).strip() if subject else None})
+            del self.recent[:-self.keep]
+
+    def delivered_since(self, since: float):
+        """
+        Returns the number of messages delivered after the given time.
+        """
+        with self._lock:
+            return sum(1 for delivered in self.delivered_at if delivered >= since)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="smtp-sink", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
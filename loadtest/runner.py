@@ -0,0 +1,147 @@
+"""
+Runs the load test scenarios and collects the latency of every request, per endpoint.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, p: float):
+    """
+    Returns the p-th percentile of the values, with the nearest-rank method.
+
+    Args:
+        values (list): The values, sorted in ascending order.
+        p (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, or None if there are no values.
+    """
+    if not values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+
+class EndpointStats(object):
+    """
+    Latencies and outcomes of the requests to an endpoint.
+    """
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    def record(self, seconds: float, status):
+        self.latencies.append(seconds)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors += 1
+
+    def summary(self, elapsed: float):
+        """
+        Returns the count, errors, throughput and latency percentiles (in milliseconds) of the endpoint.
+        """
+        latencies = sorted(self.latencies)
+        summary = OrderedDict([
+            ("count", len(latencies)),
+            ("errors", self.errors),
+            ("rps", len(latencies) / elapsed if elapsed else 0.0),
+        ])
+        for p in PERCENTILES:
+            value = percentile(latencies, p)
+            summary["p" + str(p)] = value * 1000 if value is not None else None
+        summary["max"] = latencies[-1] * 1000 if latencies else None
+        summary["statuses"] = dict(self.statuses)
+        return summary
+
+
+class LoadReport(object):
+    """
+    Results of a scenario: the stats of every endpoint and the counters of the fake backends.
+    """
+    def __init__(self, scenario: str):
+        self.scenario = scenario
+        self.endpoints = OrderedDict()
+        self.counters = OrderedDict()
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def record(self, endpoint: str, seconds: float, status):
+        self.endpoints.setdefault(endpoint, EndpointStats()).record(seconds, status)
+
+    def count(self, name: str, value):
+        self.counters[name] = value
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def summary(self):
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        return {
+            "scenario": self.scenario,
+            "elapsed": elapsed,
+            "endpoints": OrderedDict((name, stats.summary(elapsed)) for name, stats in self.endpoints.items()),
+            "counters": dict(self.counters),
+        }
+
+    def format(self):
+        """
+        Formats the results as a table, one line per endpoint.
+        """
+        summary = self.summary()
+        lines = ["scenario %s: %.1f s" % (self.scenario, summary["elapsed"])]
+        header = "  %-48s %7s %7s %8s" % ("endpoint", "count", "errors", "req/s") + \
+            "".join(" %8s" % ("p" + str(p)) for p in PERCENTILES) + " %8s" % "max (ms)"
+        lines.append(header)
+        for name, endpoint in summary["endpoints"].items():
+            line = "  %-48s %7d %7d %8.1f" % (name, endpoint["count"], endpoint["errors"], endpoint["rps"])
+            for key in ["p" + str(p) for p in PERCENTILES] + ["max"]:
+                line += " %8.1f" % endpoint[key] if endpoint[key] is not None else " %8s" % "-"
+            lines.append(line)
+        for name, value in summary["counters"].items():
+            lines.append("  %s: %s" % (name, value))
+        return "\n".join(lines)
+
+
+async def timed(report: LoadReport, endpoint: str, request):
+    """
+    Awaits a request and records its latency and status under the endpoint name.
+
+    Args:
+        report (LoadReport): The report of the scenario.
+        endpoint (str): The name of the endpoint, e.g. "POST /smartfactory/predict".
+        request (awaitable): The httpx request.
+
+    Returns:
+        httpx.Response: The response, or None if the request failed without one.
+    """
+    started = time.perf_counter()
+    try:
+        response = await request
+    except Exception as e:
+        report.record(endpoint, time.perf_counter() - started, type(e).__name__)
+        return None
+    report.record(endpoint, time.perf_counter() - started, response.status_code)
+    return response
+
+
+async def run_iterations(step, iterations: int, concurrency: int):
+    """
+    Runs `iterations` calls of a step, at most `concurrency` at the same time.
+
+    Args:
+        step (callable): The coroutine function of an iteration, called with the iteration number.
+        iterations (int): The number of iterations.
+        concurrency (int): The number of virtual users.
+    """
+    counter = iter(range(iterations))
+
+    async def user():
+        for iteration in counter:
+            await step(iteration)
+
+    await asyncio.gather(*(user() for _ in range(max(1, min(concurrency, iterations)))))
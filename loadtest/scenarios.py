@@ -0,0 +1,199 @@
+"""
+Scripted load test scenarios, run against the API layer as the GUI would use it.
+"""
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from loadtest.fakes import KPIS, MACHINES
+from loadtest.runner import LoadReport, run_iterations, timed
+
+
+class LoadContext(object):
+    """
+    What the scenarios share: the client of the API layer, the user they act as and the SMTP sink.
+    """
+    def __init__(self, client, user_id: str, sink=None, seed: int = 0):
+        self.client = client
+        self.user_id = str(user_id)
+        self.sink = sink
+        self.seed = seed
+
+
+class Scenario(object):
+    """
+    A scenario runs `iterations` iterations of its step, with `concurrency` virtual users.
+    """
+    name = None
+    iterations = 100
+    concurrency = 10
+
+    def __init__(self, iterations: int = None, concurrency: int = None):
+        self.iterations = iterations or self.iterations
+        self.concurrency = concurrency or self.concurrency
+
+    async def setup(self, context: LoadContext, report: LoadReport):
+        pass
+
+    async def step(self, context: LoadContext, report: LoadReport, iteration: int):
+        raise NotImplementedError
+
+    async def teardown(self, context: LoadContext, report: LoadReport):
+        pass
+
+    async def run(self, context: LoadContext):
+        """
+        Runs the scenario.
+
+        Returns:
+            LoadReport: The latencies of the requests, per endpoint.
+        """
+        report = LoadReport(self.name)
+        await self.setup(context, report)
+        await run_iterations(lambda iteration: self.step(context, report, iteration), self.iterations,
+                             self.concurrency)
+        await self.teardown(context, report)
+        report.finish()
+        return report
+
+
+def _interval(rng: random.Random, max_days: int = 60):
+    end = datetime.now(timezone.utc).date()
+    start = end - timedelta(days=rng.randint(7, max_days))
+    return {"start_date": start.isoformat(), "end_date": end.isoformat()}
+
+
+class DashboardLoad(Scenario):
+    """
+    Opens the dashboard: settings, KPI and machine lists, then the historical data of every widget in a batch.
+    The widgets repeat across iterations, as the same dashboards are opened by several users.
+    """
+    name = "dashboard-load"
+    iterations = 200
+    concurrency = 20
+    widgets = 6
+
+    async def step(self, context, report, iteration):
+        rng = random.Random(context.seed * 100003 + iteration % 25)
+        client = context.client
+        widgets = []
+        for index in range(self.widgets):
+            widgets.append({
+                "widgetId": "w" + str(index),
+                "kpi": rng.choice(KPIS) + "_" + rng.choice(["sum", "avg", "max"]),
+                "machines": rng.sample(MACHINES, rng.randint(1, 4)),
+                "timeframe": _interval(rng),
+                "group_time": rng.choice([None, "P1D", "P1W"]),
+                "format": rng.choice(["rows", "columnar"]),
+            })
+        await asyncio.gather(
+            timed(report, "GET /smartfactory/dashboardSettings/{userId}",
+                  client.get("/smartfactory/dashboardSettings/" + context.user_id)),
+            timed(report, "GET /smartfactory/kpi", client.get("/smartfactory/kpi")),
+            timed(report, "GET /smartfactory/retrieveMachines", client.get("/smartfactory/retrieveMachines")),
+            timed(report, "POST /smartfactory/historical/batch",
+                  client.post("/smartfactory/historical/batch", json=widgets)),
+        )
+
+
+class ChatBurst(Scenario):
+    """
+    Many users asking the AI agent at the same time, with a mix of the supported question types.
+    """
+    name = "chat-burst"
+    iterations = 60
+    concurrency = 30
+    questions = [
+        "Calculate the working_time_sum for Assembly Machine 1 for the last 7 days",
+        "Predict the consumption_avg for Laser Welding Machine 2 for the next 7 days",
+        "Can you describe cost_working_avg?",
+        "Compute the idle_time_max for Riveting Machine for yesterday",
+        "Make a report about bad_cycles_min for Testing Machine 1 with respect to last week",
+        "Create a dashboard to compare the consumption of the cutting machines",
+    ]
+
+    async def step(self, context, report, iteration):
+        question = self.questions[iteration % len(self.questions)]
+        await timed(report, "POST /smartfactory/agent/{userId}",
+                    context.client.post("/smartfactory/agent/" + context.user_id,
+                                        json={"userInput": question, "userId": context.user_id}))
+
+
+class PredictionFanOut(Scenario):
+    """
+    Predictions of several KPIs and machines per request, as requested by the forecasting page.
+    Half of the requests are repeated, to exercise the sharing of identical requests in flight.
+    """
+    name = "prediction-fan-out"
+    iterations = 80
+    concurrency = 16
+    series = 8
+
+    async def step(self, context, report, iteration):
+        rng = random.Random(context.seed * 100003 + iteration // 2)
+        value = [{"Machine_Name": rng.choice(MACHINES), "KPI_Name": rng.choice(KPIS) + "_avg",
+                  "Date_prediction": rng.choice([7, 14, 30])} for _ in range(self.series)]
+        await timed(report, "POST /smartfactory/predict",
+                    context.client.post("/smartfactory/predict", json={"value": value}))
+
+
+class ReportSchedule(Scenario):
+    """
+    Schedules reports that run every 10 seconds and sends them by email, while users generate reports in
+    background jobs, poll them and download them.
+
+    The schedules are saved in the database, so this scenario should run on a disposable database.
+    """
+    name = "report-schedule"
+    iterations = 20
+    concurrency = 5
+    schedules = 5
+    poll_interval = 0.5
+    timeout = 120
+
+    async def setup(self, context, report):
+        self._started = time.time()
+        start = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for index in range(self.schedules):
+            schedule = {"id": None, "name": "loadtest-" + str(index), "recurrence": "test", "status": True,
+                        "email": "loadtest@localhost", "startDate": start, "kpis": [KPIS[index % len(KPIS)] + "_sum"],
+                        "machines": [MACHINES[index % len(MACHINES)]]}
+            await timed(report, "POST /smartfactory/reports/schedule",
+                        context.client.post("/smartfactory/reports/schedule",
+                                            json={"userId": context.user_id, "params": schedule}))
+
+    async def step(self, context, report, iteration):
+        client = context.client
+        params = {"name": "loadtest-job-" + str(iteration), "type": "Standard", "period": "last week",
+                  "status": True, "email": "loadtest@localhost", "kpis": [KPIS[iteration % len(KPIS)] + "_sum"],
+                  "machines": [MACHINES[iteration % len(MACHINES)]]}
+        started = time.perf_counter()
+        response = await timed(report, "POST /smartfactory/reports/jobs",
+                               client.post("/smartfactory/reports/jobs",
+                                           json={"userId": context.user_id, "params": params}))
+        if response is None or response.status_code != 202:
+            return
+        job_id = response.json()["jobId"]
+        status = None
+        while time.perf_counter() - started < self.timeout:
+            await asyncio.sleep(self.poll_interval)
+            response = await timed(report, "GET /smartfactory/reports/jobs/{job_id}",
+                                   client.get("/smartfactory/reports/jobs/" + job_id))
+            status = response.json().get("status") if response is not None and response.status_code == 200 else None
+            if status not in ("queued", "running"):
+                break
+        # the time from the submission to the end of the job, as seen by the user
+        report.record("report job (submit to finish)", time.perf_counter() - started, 200 if status == "completed" else 500)
+        if status == "completed":
+            await timed(report, "GET /smartfactory/reports/jobs/{job_id}/download",
+                        client.get("/smartfactory/reports/jobs/" + job_id + "/download"))
+
+    async def teardown(self, context, report):
+        if context.sink is not None:
+            # leave time for the scheduled runs started during the scenario to deliver their emails
+            await asyncio.sleep(10)
+            report.count("scheduled report emails delivered", context.sink.delivered_since(self._started))
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (DashboardLoad, ChatBurst, PredictionFanOut, ReportSchedule)}
@@ -0,0 +1,120 @@
+"""
+Runs one service of the stack with its external backends replaced by the fakes of loadtest.fakes.
+
+Every service runs in its own process, as in the containers, since the services share module names
+(api_auth, tracing, main, ...). Each one listens on port 8000 of its own loopback address, and the host
+names of the docker network (api, kb, router, ...) are resolved to those addresses, so that the URLs
+configured in the services work unchanged.
+
+Usage:
+    python -m loadtest.serve <service>
+"""
+import argparse
+import json
+import os
+import runpy
+import socket
+import sys
+from collections import OrderedDict
+
+import uvicorn
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# service -> (directory of the service, entry point, relative to the directory)
+SERVICES = OrderedDict([
+    ("api", ("api", "src/app.py")),
+    ("kb", ("kb", "src/kb.py")),
+    ("kpi-engine", ("kpi-engine", "src/main.py")),
+    ("data-processing", ("data-processing", "main.py")),
+    ("rag", ("rag", "main.py")),
+])
+
+# host names of the docker network -> loopback addresses
+HOSTS = {
+    "api": "127.0.10.1",
+    "kb": "127.0.10.2",
+    "kpi-engine": "127.0.10.3",
+    "data-processing": "127.0.10.4",
+    "rag": "127.0.10.5",
+    "router": "127.0.10.6",
+    "smtp": "127.0.10.7",
+}
+
+SERVICE_PORT = 8000
+DRUID_PORT = 8888
+SMTP_PORT = 2525
+
+
+def install_hosts(hosts: dict):
+    """
+    Resolves the given host names to the given addresses in this process, before any lookup.
+    """
+    getaddrinfo = socket.getaddrinfo
+
+    def resolve(host, *args, **kwargs):
+        return getaddrinfo(hosts.get(host, host), *args, **kwargs)
+
+    socket.getaddrinfo = resolve
+
+
+def patch_backends(service: str):
+    """
+    Replaces the MinIO client and the LLM of a service with the fakes.
+    Must be called before the entry point of the service runs.
+    """
+    from loadtest.fakes import InMemoryMinio, fake_chat_model_class
+
+    minio = InMemoryMinio()
+    if service == "api":
+        import database.minio_connection
+        # the app imports the function with a star import, so the module attribute is replaced first
+        database.minio_connection.get_minio_connection = lambda: minio
+    elif service == "data-processing":
+        import storage.minio_client
+        import storage.storage_operations
+        storage.minio_client.get_minio_client = lambda: minio
+        storage.storage_operations.get_minio_client = lambda: minio
+    elif service == "rag":
+        import langchain_google_genai
+        langchain_google_genai.ChatGoogleGenerativeAI = fake_chat_model_class()
+
+
+def serve(service: str):
+    """
+    Runs the entry point of a service, listening on its loopback address.
+    """
+    directory, entry_point = SERVICES[service]
+    hosts = json.loads(os.getenv("LOADTEST_HOSTS", "null")) or HOSTS
+    install_hosts(hosts)
+
+    directory = os.path.join(REPO_ROOT, directory)
+    script = os.path.join(directory, entry_point)
+    os.chdir(directory)
+    sys.path.insert(0, os.path.dirname(script))
+    patch_backends(service)
+
+    # the entry points start uvicorn on 0.0.0.0, every service must listen on its own address instead
+    run = uvicorn.run
+
+    def run_on_loopback(app, **kwargs):
+        kwargs.update(host=hosts[service], port=SERVICE_PORT, log_level=os.getenv("LOADTEST_LOG_LEVEL", "warning"))
+        run(app, **kwargs)
+
+    uvicorn.run = run_on_loopback
+    if service == "rag":
+        # started by the uvicorn command line in the container
+        run_on_loopback(runpy.run_path(script, run_name="main")["app"])
+    else:
+        runpy.run_path(script, run_name="__main__")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs a service of the stack on fake backends.")
+    parser.add_argument("service", choices=list(SERVICES))
+    args = parser.parse_args(argv)
+    serve(args.service)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import json
 import logging
 import re
+import threading
+import time
 from dotenv import load_dotenv
 from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
 from fastapi import Depends, status, HTTPException
@@ -14,6 +16,8 @@ ALGORITHM = 'HS256'
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 # change this value accordingly to your requirements
 
 API_KEYS_FILE_PATH = './api/api_auth/api_keys.json'
+API_KEY_CACHE_TTL = int(os.getenv('API_KEY_CACHE_TTL', 300))  # seconds before a cached key is reloaded
+API_KEY_REFRESH_INTERVAL = int(os.getenv('API_KEY_REFRESH_INTERVAL', 5))  # min seconds between reloads on a miss
 
 
 password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -72,12 +76,90 @@ def retrieve_keys(microservice_id: str):
             result = None
     except Exception as e:
         logging.error("Database query failed: %s", str(e))
+        result = None
         #result = json.load(open(API_KEYS_FILE_PATH, 'r'))['microservice'][microservice_id]
     finally:
         cursor.close()
         connection.close()
     return result
     
+class ApiKeyCache(object):
+    """
+    In-memory cache of the microservice API keys, so that verifying a request does not hit the database.
+
+    Keys are reloaded when older than the TTL, and also when an unknown key is presented (it may have just
+    been rotated). Reloads on a miss are rate limited, so that invalid keys cannot be used to flood the database.
+    """
+    def __init__(self, ttl: int = API_KEY_CACHE_TTL, refresh_interval: int = API_KEY_REFRESH_INTERVAL):
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self._keys = {}  # microservice_id -> (key, loaded_at)
+        self._lock = threading.Lock()
+
+    def _load(self, microservice_id: str):
+        key = retrieve_keys(microservice_id)
+        with self._lock:
+            self._keys[microservice_id] = (key, time.monotonic())
+        return key
+
+    def get_keys(self, microservice_ids: list, max_age: float = None):
+        """
+        Returns the set of valid API keys for the given microservices, reloading the ones older than max_age.
+
+        Args:
+            microservice_ids (list): The microservice IDs whose keys are accepted.
+            max_age (float): Maximum age of a cached key in seconds, defaults to the TTL.
+
+        Returns:
+            set: The valid API keys.
+        """
+        max_age = self.ttl if max_age is None else max_age
+        now = time.monotonic()
+        keys = set()
+        for microservice_id in microservice_ids:
+            key, loaded_at = self._keys.get(microservice_id, (None, None))
+            if loaded_at is None or now - loaded_at >= max_age:
+                key = self._load(microservice_id)
+            if key is not None:
+                keys.add(key)
+        return keys
+
+    def verify(self, api_key: str, microservice_ids: list):
+        """
+        Checks whether the API key belongs to one of the given microservices.
+
+        Args:
+            api_key (str): The API key sent by the client.
+            microservice_ids (list): The microservice IDs whose keys are accepted.
+
+        Returns:
+            bool: True if the key is valid.
+        """
+        if api_key in self.get_keys(microservice_ids):
+            return True
+        return api_key in self.get_keys(microservice_ids, max_age=self.refresh_interval)
+
+    def invalidate(self, microservice_id: str = None):
+        """
+        Drops the cached key of a microservice, or all of them if no ID is given. Call it after rotating a key.
+        """
+        with self._lock:
+            if microservice_id is None:
+                self._keys.clear()
+            else:
+                self._keys.pop(microservice_id, None)
+
+api_key_cache = ApiKeyCache()
+
+def invalidate_api_keys(microservice_id: str = None):
+    """
+    Invalidates the cached API keys, forcing the next verification to reload them from the database.
+
+    Args:
+        microservice_id (str): The microservice whose key changed, or None to drop all the keys.
+    """
+    api_key_cache.invalidate(microservice_id)
+
 def get_verify_api_key(microservice_ids: list):
     """
     Creates an asynchronous dependency function to verify API keys against the specified microservice IDs.
@@ -89,8 +171,7 @@ def get_verify_api_key(microservice_ids: list):
         Callable: An asynchronous function that verifies the provided API key. Raises an HTTPException with a 401 status code if the API key is invalid.
     """
     async def verify_api_key(api_key: str = Depends(api_key_header)):
-        matched_keys = [retrieve_keys(microservice_id) for microservice_id in microservice_ids]
-        if api_key not in matched_keys:
+        if not api_key_cache.verify(api_key, microservice_ids):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
     return verify_api_key
 
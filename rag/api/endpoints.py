@@ -1,3 +1,4 @@
+import contextvars
 import httpx
 import json
 import os
@@ -13,6 +14,7 @@ from chains.ontology_rag import DashboardGenerationChain, GeneralQAChain, KPIGen
 from schemas.models import Question, Answer
 from schemas.XAI_rag import RagExplainer
 from queryGen.QueryGen import QueryGenerator
+from api.llm_tracing import LLMTracingHandler
 
 from langchain_community.graphs import RdfGraph
 from langchain.prompts import PromptTemplate,FewShotPromptTemplate
@@ -92,7 +94,7 @@ observer.schedule(event_handler, os.environ['KB_FILE_PATH'], recursive=True)
 observer.start()"""
 
 # Initialize the LLM model
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash")
+llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", callbacks=[LLMTracingHandler()])
 
 # Initialize the conversation history deque
 history = {}
@@ -478,8 +480,9 @@ async def ask_question(question: Question): # to add or modify the services allo
             # Initialize a thread pool executor for asynchronous task execution
             executor = ThreadPoolExecutor()
 
-            # Submit a task to the executor: calling `llm.invoke` with the `prompt`
-            future = executor.submit(llm.invoke, prompt)
+            # Submit a task to the executor: calling `llm.invoke` with the `prompt`, in a copy of the context
+            # so that the LLM span is a child of the request span
+            future = executor.submit(contextvars.copy_context().run, llm.invoke, prompt)
 
             # Check the label type and perform operations accordingly
             if label == 'predictions':
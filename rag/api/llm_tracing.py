@@ -0,0 +1,40 @@
+from langchain_core.callbacks import BaseCallbackHandler
+
+from tracing import open_span
+
+
+class LLMTracingHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler that records every call of the LLM in a span.
+
+    The handler is given to the model, so that the calls made directly and the ones made by the chains are
+    both traced, as children of the span active when the call starts.
+    """
+    def __init__(self):
+        self._spans = {}  # LangChain run ID -> Span
+
+    def _start(self, serialized, run_id, prompts: int):
+        model = (serialized or {}).get("kwargs", {}).get("model") or (serialized or {}).get("name")
+        self._spans[run_id] = open_span("llm.invoke", kind="client", **{"llm.model": model, "llm.prompts": prompts})
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(serialized, run_id, len(prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(serialized, run_id, len(messages))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        usage = (response.llm_output or {}).get("usage_metadata") or (response.llm_output or {}).get("token_usage")
+        if usage:
+            span.set("llm.usage", dict(usage))
+        span.end()
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        span.fail(error)
+        span.end()
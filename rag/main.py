@@ -1,6 +1,17 @@
+import os
+from brotli_asgi import BrotliMiddleware
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from api import endpoints
+from tracing import TracingMiddleware, instrument_http_clients
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+
+app.add_middleware(BrotliMiddleware, minimum_size=int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 1024)),
+                   gzip_fallback=True)
+
+# added last, so that the server span covers the other middlewares
+app.add_middleware(TracingMiddleware)
+instrument_http_clients()
 
 app.include_router(endpoints.router, prefix='/agent')
\ No newline at end of file